@@ -0,0 +1,50 @@
+"""Compare single-stream and sharded collection export throughput.
+
+    python benchmarks/bench_export.py -f <foreign-id> --shards 1 4 8 [--raw]
+
+Uses OPAL_HOST / OPAL_API_KEY for the server, which can be the fake server
+(`python benchmarks/fake_server.py`, collection "benchmark"). Exported entities
+are counted and discarded.
+"""
+import argparse
+import time
+
+from openaleph_client.api import AlephAPI
+from openaleph_client.export import export_shards
+
+
+class NullSink(object):
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+
+
+def run(api, collection, shards, raw):
+    sink = NullSink()
+    start = time.monotonic()
+    total = export_shards(api, collection, shards, outfile=sink, raw=raw)  # type: ignore
+    elapsed = time.monotonic() - start
+    print(
+        "shards=%-3d entities=%-10d %8.1f entities/s %8.2f MB/s"
+        % (shards, total, total / elapsed, sink.bytes / elapsed / 1e6)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-f", "--foreign-id", required=True)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--raw", action="store_true")
+    args = parser.parse_args()
+    api = AlephAPI()
+    collection = api.get_collection_by_foreign_id(args.foreign_id)
+    if collection is None:
+        parser.error("Collection %r not found" % args.foreign_id)
+    for shards in args.shards:
+        run(api, collection, shards, args.raw)
+
+
+if __name__ == "__main__":
+    main()
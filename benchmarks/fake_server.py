@@ -0,0 +1,284 @@
+"""A local stand-in for the OpenAleph API, for benchmarking the client.
+
+    python benchmarks/fake_server.py --port 8000 --latency 0.02 --error-rate 0.01
+
+Implements just enough of the API for the client: collections (lookup by
+foreign ID, creation), document ingest, entity bulk writes, entity streams,
+entity search with pagination and a schema facet, single entities and
+matching. Uploads and bulk
+bodies are read and discarded. Every response is delayed by `latency`
+seconds, `error_rate` of all requests fail with HTTP 503, and response bodies
+are sent at no more than `throughput` bytes per second (0: unlimited).
+"""
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
+
+PREFIX = "/api/2/"
+WRITE_SIZE = 64 * 1024
+# Entities cycle through these schemata, so that exports can be sharded
+SCHEMATA = ("Person", "Company", "Organization", "LegalEntity")
+
+
+def make_entity(idx: int, collection_id: str = "1") -> Dict:
+    return {
+        "id": "entity-%d" % idx,
+        "schema": SCHEMATA[idx % len(SCHEMATA)],
+        "collection_id": collection_id,
+        "properties": {
+            "name": ["Person %d" % idx],
+            "nationality": ["de"],
+            "birthDate": ["1970-01-01"],
+        },
+        "links": {"self": "entities/entity-%d" % idx},
+    }
+
+
+class FakeStats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.uploads = 0
+        self.entities = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    def add(self, **counts: int):
+        with self.lock:
+            for key, value in counts.items():
+                setattr(self, key, getattr(self, key) + value)
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are sent in separate writes: with Nagle's algorithm,
+    # the body would wait for the client's delayed ACK of the headers.
+    disable_nagle_algorithm = True
+    server: "FakeServer"
+
+    def log_message(self, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+            body = b"".join(parts)
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.stats.add(bytes_received=len(body))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    def _write(self, data: bytes):
+        throughput = self.server.throughput
+        for offset in range(0, len(data), WRITE_SIZE):
+            chunk = data[offset : offset + WRITE_SIZE]
+            self.wfile.write(chunk)
+            if throughput > 0:
+                time.sleep(len(chunk) / throughput)
+        self.server.stats.add(bytes_sent=len(data))
+
+    def _respond(self, status: int, body: bytes, ctype: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self._write(body)
+
+    def _json(self, data, status: int = 200):
+        self._respond(status, json.dumps(data).encode("utf-8"))
+
+    def _handle(self, method: str):
+        body = self._read_body() if method == "POST" else b""
+        self.server.stats.add(requests=1)
+        if self.server.latency > 0:
+            time.sleep(self.server.latency)
+        if random.random() < self.server.error_rate:
+            self.server.stats.add(errors=1)
+            return self._json({"status": "error", "message": "unavailable"}, 503)
+        url = urlparse(self.path)
+        if not url.path.startswith(PREFIX):
+            return self._json({"message": "not found"}, 404)
+        parts = url.path[len(PREFIX) :].strip("/").split("/")
+        query = parse_qs(url.query)
+        route = getattr(self, "route_%s_%s" % (method, parts[0]), None)
+        if route is None:
+            return self._json({"message": "not found"}, 404)
+        return route(parts[1:], query, body)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _page(self, query: Dict, total: int, make) -> Dict:
+        offset = int(query.get("offset", ["0"])[0])
+        limit = int(query.get("limit", ["20"])[0])
+        end = min(total, offset + limit)
+        results = [make(i) for i in range(offset, end)]
+        next_url = None
+        if end < total:
+            params = {k: v[0] for k, v in query.items()}
+            params.update({"offset": end, "limit": limit})
+            next_url = self.server.base_url + "entities?" + urlencode(params)
+        return {
+            "results": results,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "next": next_url,
+        }
+
+    def _collection(self, collection_id: str = "1") -> Dict:
+        return {"id": collection_id, "foreign_id": "benchmark", "label": "Benchmark"}
+
+    def route_GET_collections(self, parts, query, body):
+        if not len(parts):
+            return self._json(self._page(query, 1, lambda i: self._collection()))
+        if len(parts) > 1 and parts[1] == "_stream":
+            return self._stream(query)
+        return self._json(self._collection(parts[0]))
+
+    def route_POST_collections(self, parts, query, body):
+        if not len(parts):
+            return self._json(self._collection())
+        if parts[-1] == "ingest":
+            self.server.stats.add(uploads=1)
+            return self._json({"status": "ok", "id": self.server.next_id()})
+        if parts[-1] == "_bulk":
+            count = len(json.loads(body)) if len(body) else 0
+            self.server.stats.add(entities=count)
+            return self._respond(204, b"")
+        return self._json({"message": "not found"}, 404)
+
+    def route_GET_entities(self, parts, query, body):
+        if len(parts) and parts[0] == "_stream":
+            return self._stream(query)
+        if len(parts):
+            idx = int(parts[0].rsplit("-", 1)[-1]) if "-" in parts[0] else 0
+            return self._json(make_entity(idx))
+        page = self._page(query, self.server.entities, make_entity)
+        if "schema" in query.get("facet", []):
+            page["facets"] = {"schema": {"values": self._schema_counts()}}
+        return self._json(page)
+
+    def route_POST_match(self, parts, query, body):
+        results = [make_entity(i) for i in range(10)]
+        return self._json({"results": results, "total": len(results)})
+
+    def _schema_counts(self) -> List[Dict]:
+        total, size = self.server.entities, len(SCHEMATA)
+        counts = [(total - idx + size - 1) // size for idx in range(size)]
+        return [{"id": s, "count": c} for s, c in zip(SCHEMATA, counts) if c]
+
+    def _stream(self, query: Dict):
+        body = self.server.stream_body(tuple(sorted(query.get("schema", []))))
+        self._respond(200, body, ctype="application/x-ndjson")
+
+
+class FakeServer(ThreadingHTTPServer):
+    """Run the fake API in a background thread:
+
+    with FakeServer(latency=0.01) as server:
+        api = AlephAPI(host=server.url, api_key="fake")
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        throughput: float = 0.0,
+        entities: int = 10_000,
+    ):
+        super(FakeServer, self).__init__(("127.0.0.1", port), FakeHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throughput = throughput
+        self.entities = entities
+        self.stats = FakeStats()
+        self.url = "http://127.0.0.1:%d/" % self.server_address[1]
+        self.base_url = self.url + PREFIX.lstrip("/")
+        self._ids = 0
+        self._streams: Dict[Tuple[str, ...], bytes] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def stream_body(self, schemata: Tuple[str, ...] = ()) -> bytes:
+        """All entities (of the given schemata) as newline-delimited JSON,
+        built once."""
+        with self.stats.lock:
+            if schemata not in self._streams:
+                entities = (make_entity(i) for i in range(self.entities))
+                lines = [
+                    json.dumps(e)
+                    for e in entities
+                    if not schemata or e["schema"] in schemata
+                ]
+                body = "".join(line + "\n" for line in lines)
+                self._streams[schemata] = body.encode("utf-8")
+            return self._streams[schemata]
+
+    def next_id(self) -> str:
+        with self.stats.lock:
+            self._ids += 1
+            return str(self._ids)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "FakeServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throughput", type=float, default=0.0)
+    parser.add_argument("--entities", type=int, default=10_000)
+    args = parser.parse_args()
+    server = FakeServer(
+        port=args.port,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throughput=args.throughput,
+        entities=args.entities,
+    )
+    print("Serving fake OpenAleph API on %s" % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
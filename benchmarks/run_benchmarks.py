@@ -0,0 +1,265 @@
+"""Repeatable client benchmarks against a local fake OpenAleph server.
+
+    python benchmarks/run_benchmarks.py [--only crawl_dir write_entities ...]
+        [--scale 0.1] [--latency 0.005] [--json results.json]
+        [--compare baseline.json --tolerance 0.2]
+
+Each benchmark reports a throughput (higher is better). Save the results of a
+known-good version with `--json`, then run the new version with `--compare`:
+the script exits with status 1 if any throughput dropped by more than
+`--tolerance`. Use `--scale` to shrink or grow all workloads.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_server import FakeServer  # noqa: E402
+
+from openaleph_client.api import AlephAPI  # noqa: E402
+from openaleph_client.crawldir import crawl_dir  # noqa: E402
+from openaleph_client.export import export_shards  # noqa: E402
+from openaleph_client.ignore import IGNORE_FILE, IgnoreRules  # noqa: E402
+
+# name -> (value, unit)
+Results = Dict[str, Tuple[float, str]]
+
+
+def _api(server: FakeServer, **kwargs) -> AlephAPI:
+    return AlephAPI(host=server.url, api_key="benchmark", **kwargs)
+
+
+def _make_tree(root: Path, files: int, size: int, per_dir: int = 100):
+    data = os.urandom(min(size, 1024 * 1024))
+    for idx in range(files):
+        folder = root / ("d%04d" % (idx // per_dir))
+        folder.mkdir(parents=True, exist_ok=True)
+        with open(folder / ("f%06d.bin" % idx), "wb") as fh:
+            written = 0
+            while written < size:
+                fh.write(data[: size - written])
+                written += min(len(data), size - written)
+
+
+def bench_crawl_dir(server: FakeServer, scale: float, results: Results):
+    workloads = [
+        ("small", max(10, int(5000 * scale)), 1024),
+        ("large", max(2, int(16 * scale)), 8 * 1024 * 1024),
+    ]
+    for name, files, size in workloads:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            _make_tree(root, files, size)
+            for parallel in (1, 4, 16):
+                start = time.monotonic()
+                crawl_dir(_api(server), str(root), "benchmark", {}, parallel=parallel)
+                elapsed = time.monotonic() - start
+                key = "crawl_dir[%s,%dx%dB,parallel=%d]" % (name, files, size, parallel)
+                results[key] = (files / elapsed, "files/s")
+                if name == "large":
+                    mb = files * size / elapsed / 1e6
+                    results[key.replace("crawl_dir", "crawl_dir_mb")] = (mb, "MB/s")
+
+
+def bench_write_entities(server: FakeServer, scale: float, results: Results):
+    count = max(1000, int(100_000 * scale))
+    entities = [
+        {
+            "id": "e%d" % i,
+            "schema": "Person",
+            "properties": {"name": ["Person %d" % i], "nationality": ["de"]},
+        }
+        for i in range(count)
+    ]
+    for concurrency in (1, 4):
+        api = _api(server)
+        sent = server.stats.bytes_received
+        start = time.monotonic()
+        api.write_entities("1", entities, concurrency=concurrency)
+        elapsed = time.monotonic() - start
+        size = server.stats.bytes_received - sent
+        key = "write_entities[%d,concurrency=%d]" % (count, concurrency)
+        results[key] = (count / elapsed, "entities/s")
+        results[key + ".mb"] = (size / elapsed / 1e6, "MB/s")
+
+
+def bench_stream_entities(server: FakeServer, scale: float, results: Results):
+    api = _api(server)
+    for raw in (False, True):
+        start = time.monotonic()
+        stream = api.stream_entities({"id": "1"}, raw=raw)
+        for _ in stream:
+            pass
+        elapsed = time.monotonic() - start
+        key = "stream_entities[%d,raw=%s]" % (server.entities, raw)
+        results[key] = (stream.position / elapsed, "entities/s")
+
+
+class NullSink(object):
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+
+
+def bench_export(server: FakeServer, scale: float, results: Results):
+    api = _api(server)
+    for shards in (1, 4):
+        sink = NullSink()
+        start = time.monotonic()
+        total = export_shards(api, {"id": "1"}, shards, outfile=sink)  # type: ignore
+        elapsed = time.monotonic() - start
+        key = "export_shards[%d,shards=%d]" % (total, shards)
+        results[key] = (total / elapsed, "entities/s")
+
+
+def bench_pagination(server: FakeServer, scale: float, results: Results):
+    api = _api(server)
+    for prefetch in (0, 4):
+        start = time.monotonic()
+        found = sum(1 for _ in api.search("", limit=100, prefetch=prefetch))
+        elapsed = time.monotonic() - start
+        key = "search_pagination[%d,prefetch=%d]" % (found, prefetch)
+        results[key] = (found / elapsed, "entities/s")
+
+
+def bench_patch_entity(server: FakeServer, scale: float, results: Results):
+    api = _api(server)
+    entity = {
+        "id": "e1",
+        "schema": "Person",
+        "properties": {"name": ["Person 1"]},
+        "links": {"self": "entities/e1"},
+        "collection": {"id": "1", "label": "Benchmark"},
+    }
+    number = max(1000, int(200_000 * scale))
+    elapsed = timeit.timeit(
+        lambda: api._patch_entity(dict(entity), publisher=True), number=number
+    )
+    results["_patch_entity"] = (number / elapsed, "calls/s")
+
+
+def _ignore_file(count: int = 200) -> List[str]:
+    """An ignore file with `count` patterns of all kinds."""
+    lines = []
+    for i in range(count):
+        kind = i % 10
+        if kind < 4:
+            lines.append("*.ext%d" % i)
+        elif kind < 6:
+            lines.append("name%d.txt" % i)
+        elif kind == 6:
+            lines.append("/d%03d/sub%d/" % (i % 500, i))
+        elif kind == 7:
+            lines.append("**/cache%d/*" % i)
+        elif kind == 8:
+            lines.append("build%d/" % i)
+        else:
+            lines.append("!keep%d.log" % i)
+    return lines
+
+
+def bench_is_ignored(server: FakeServer, scale: float, results: Results):
+    patterns = _ignore_file(200)
+    with tempfile.TemporaryDirectory() as tmp:
+        ignore_file = Path(tmp) / IGNORE_FILE
+        ignore_file.write_text("\n".join(patterns), encoding="utf-8")
+        rules = IgnoreRules.from_file(ignore_file)
+    extensions = ("pdf", "txt", "log", "ext40")
+    paths = [
+        ("d%03d/sub/f%06d.%s" % (i % 500, i, extensions[i % 4]), i % 50 == 0)
+        for i in range(max(1000, int(1_000_000 * scale)))
+    ]
+    is_ignored = rules.is_ignored
+    start = time.monotonic()
+    for rel, is_dir in paths:
+        is_ignored(rel, is_dir)
+    elapsed = time.monotonic() - start
+    results["is_ignored[%d patterns]" % len(patterns)] = (
+        len(paths) / elapsed,
+        "paths/s",
+    )
+
+
+BENCHMARKS: Dict[str, Callable[[FakeServer, float, Results], None]] = {
+    "crawl_dir": bench_crawl_dir,
+    "write_entities": bench_write_entities,
+    "stream_entities": bench_stream_entities,
+    "export": bench_export,
+    "pagination": bench_pagination,
+    "patch_entity": bench_patch_entity,
+    "is_ignored": bench_is_ignored,
+}
+
+
+def compare(results: Results, baseline: Dict, tolerance: float) -> List[str]:
+    """Names of the benchmarks slower than `baseline` by more than
+    `tolerance`."""
+    slower = []
+    for name, (value, unit) in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["value"]
+        if before > 0 and value < before * (1 - tolerance):
+            slower.append(name)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS))
+    parser.add_argument("--scale", type=float, default=0.1)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throughput", type=float, default=0.0)
+    parser.add_argument("--entities", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    # the client logs every upload URL at a high level
+    logging.getLogger("openaleph_client").setLevel(logging.CRITICAL + 1)
+
+    entities = args.entities or max(1000, int(100_000 * args.scale))
+    server = FakeServer(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throughput=args.throughput,
+        entities=entities,
+    )
+    results: Results = {}
+    with server:
+        for name in args.only or list(BENCHMARKS):
+            BENCHMARKS[name](server, args.scale, results)
+    width = max(len(name) for name in results)
+    for name, (value, unit) in results.items():
+        print("%-*s %12.1f %s" % (width, name, value, unit))
+
+    if args.json:
+        data = {name: {"value": v, "unit": u} for name, (v, u) in results.items()}
+        with open(args.json, "w") as fh:
+            json.dump(data, fh, indent=2)
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        slower = compare(results, baseline, args.tolerance)
+        for name in slower:
+            print("REGRESSION: %s (was %.1f)" % (name, baseline[name]["value"]))
+        if len(slower):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,123 @@
+import hashlib
 import importlib.metadata
 import json
 import uuid
 import logging
-from itertools import count
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from collections import deque
 from pathlib import Path
-from urllib.parse import urlencode, urljoin
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
 from banal import ensure_dict, ensure_list
-from requests import RequestException, Session
-from requests.exceptions import HTTPError
+from requests import RequestException, Response, Session
+from requests.exceptions import HTTPError, ReadTimeout
 from requests_toolbelt import MultipartEncoder  # type: ignore
-from typing import Dict, Mapping, Iterable, Iterator, List, Optional, Any
-
-from openaleph_client import settings
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from openaleph_client import codec, settings
+from openaleph_client.bulk import BulkBody, ChunkSizer, encode_entity, gzip_stream
+from openaleph_client.cache import ResponseCache
 from openaleph_client.errors import AlephException
-from openaleph_client.util import backoff, prop_push
+from openaleph_client.hedge import Hedger
+from openaleph_client.metrics import Hook
+from openaleph_client.ratelimit import RateLimiter
+from openaleph_client.retry import RetryPolicy
+from openaleph_client.transport import Transport
+from openaleph_client.util import prop_push
 
 log = logging.getLogger(__name__)
 MIME = "application/octet-stream"
 VERSION = importlib.metadata.version("openaleph-client")
+# Status with which the server or a proxy rejects a request body as too large.
+# Gateway timeouts (504) are left to the retry policy: they are as likely to
+# mean an overloaded server as a chunk which is too large.
+OVERSIZE_STATUS = (413,)
+# Read size for raw entity streams
+RAW_CHUNK_SIZE = 1024 * 1024
+# Read timeouts by kind of request, see `BaseAPI.timeout`
+TIMEOUTS = {
+    "read": settings.READ_TIMEOUT,
+    "write": settings.READ_TIMEOUT,
+    "stream": settings.STREAM_TIMEOUT,
+    "bulk": settings.BULK_TIMEOUT,
+    "upload": settings.UPLOAD_TIMEOUT,
+}
+
+
+def _line_blocks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Re-cut a stream of byte chunks so that each block ends on a newline."""
+    # Chunks without a newline are collected and joined once one arrives,
+    # since appending them one by one copies the tail each time.
+    parts: List[bytes] = []
+    for chunk in chunks:
+        end = chunk.rfind(b"\n")
+        if end == -1:
+            parts.append(chunk)
+            continue
+        parts.append(chunk[: end + 1])
+        yield b"".join(parts)
+        parts = [chunk[end + 1 :]]
+    tail = b"".join(parts)
+    if len(tail.strip()):
+        yield tail + b"\n"
+
+
+def _nth_line_end(block: bytes, n: int) -> int:
+    """Index just past the `n`th newline in `block`."""
+    end = -1
+    for _ in range(n):
+        end = block.find(b"\n", end + 1)
+    return end + 1
+
+
+def _line_id(line: bytes) -> Optional[str]:
+    if not len(line.strip()):
+        return None
+    return codec.loads(line).get("id")
+
+
+def _is_oversize(exc: Exception, ae: AlephException) -> bool:
+    # Only a timeout waiting for the response hints at a chunk that takes too
+    # long to process; a connect timeout says nothing about the body.
+    return isinstance(exc, ReadTimeout) or ae.status in OVERSIZE_STATUS
 
 
 class APIResultSet(object):
-    def __init__(self, api: "AlephAPI", url: str):
+    """Iterate over all results of a paginated API call.
+
+    With `prefetch` set, the pages following the current one are fetched by
+    offset from a thread pool while iterating, up to `prefetch` pages ahead.
+    Results are still returned in order. Pages beyond the server's result
+    window (`settings.RESULT_WINDOW`) are not prefetched, the `next` links
+    decide whether there are any.
+    """
+
+    def __init__(self, api: "AlephAPI", url: str, prefetch: int = 0):
         self.api = api
         self.url = url
         self.current = 0
+        self.prefetch = prefetch
+        self._pages: Deque[Future] = deque()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._next_offset: Optional[int] = None
         self.result = self.api._request("GET", self.url)
 
     def __iter__(self):
@@ -34,17 +127,73 @@ class APIResultSet(object):
         if self.index >= self.result.get("limit"):
             next_url = self.result.get("next")
             if next_url is None:
+                self.close()
                 raise StopIteration
-            self.result = self.api._request("GET", next_url)
+            self.result = self._next_page(next_url)
         try:
             item = self.result.get("results", [])[self.index]
         except IndexError:
+            self.close()
             raise StopIteration
         self.current += 1
         return self._patch(item)
 
     next = __next__
 
+    def _page_end(self, result: Dict) -> int:
+        return (result.get("offset") or 0) + (result.get("limit") or 0)
+
+    def _page_url(self, offset: int) -> str:
+        parsed = urlparse(self.url)
+        query = parse_qsl(parsed.query, keep_blank_values=True)
+        query = [(k, v) for k, v in query if k != "offset"]
+        query.append(("offset", str(offset)))
+        if "limit" not in dict(query):
+            query.append(("limit", str(self.result.get("limit"))))
+        return urlunparse(parsed._replace(query=urlencode(query)))
+
+    def _schedule(self):
+        total = self.result.get("total") or 0
+        limit = self.result.get("limit") or 0
+        # The last page the server returns ends at the result window.
+        end = min(total, settings.RESULT_WINDOW - limit + 1)
+        if self._next_offset is None:
+            self._next_offset = self._page_end(self.result)
+        if self._executor is None:
+            self.api.transport.ensure_pool_size(self.prefetch + 1)
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.prefetch, thread_name_prefix="openaleph-page"
+            )
+        while len(self._pages) < self.prefetch and self._next_offset < end:
+            url = self._page_url(self._next_offset)
+            self._pages.append(self._executor.submit(self.api._request, "GET", url))
+            self._next_offset += limit
+
+    def _next_page(self, next_url: str) -> Dict:
+        if self.prefetch <= 0 or not self.result.get("limit"):
+            return self.api._request("GET", next_url)
+        self._schedule()
+        if not len(self._pages):
+            # `total` can be a lower bound, keep following `next` links.
+            result = self.api._request("GET", next_url)
+            self._next_offset = self._page_end(result)
+            return result
+        result = self._pages.popleft().result()
+        self._schedule()
+        return result
+
+    def close(self):
+        """Stop fetching pages in the background."""
+        for page in self._pages:
+            page.cancel()
+        self._pages.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def __del__(self):
+        self.close()
+
     def _patch(self, item):
         return item
 
@@ -60,8 +209,10 @@ class APIResultSet(object):
 
 
 class EntityResultSet(APIResultSet):
-    def __init__(self, api: "AlephAPI", url: str, publisher: bool):
-        super(EntityResultSet, self).__init__(api, url)
+    def __init__(
+        self, api: "AlephAPI", url: str, publisher: bool, prefetch: int = 0
+    ):
+        super(EntityResultSet, self).__init__(api, url, prefetch=prefetch)
         self.publisher = publisher
 
     def _patch(self, item):
@@ -69,8 +220,10 @@ class EntityResultSet(APIResultSet):
 
 
 class EntitySetItemsResultSet(APIResultSet):
-    def __init__(self, api: "AlephAPI", url: str, publisher: bool):
-        super(EntitySetItemsResultSet, self).__init__(api, url)
+    def __init__(
+        self, api: "AlephAPI", url: str, publisher: bool, prefetch: int = 0
+    ):
+        super(EntitySetItemsResultSet, self).__init__(api, url, prefetch=prefetch)
         self.publisher = publisher
 
     def _patch(self, item):
@@ -79,25 +232,166 @@ class EntitySetItemsResultSet(APIResultSet):
         return item
 
 
-class AlephAPI(object):
+class EntityStream(object):
+    """Iterate over a streamed entity export. When the connection drops, the
+    stream is requested again and the entities already returned are skipped,
+    so the export continues without duplicates.
+
+    `position` counts the lines of the export consumed so far and `last_id`
+    is the ID of the last entity among them. Both can be stored and passed to
+    `AlephAPI.stream_entities` to resume the export in another process. The
+    server does not support offsets, so a resumed stream downloads (but does
+    not parse) the skipped entities again. If the server returns entities in
+    a different order than before, resuming fails instead of risking
+    duplicate or missing entities.
+    """
+
+    def __init__(
+        self,
+        api: "AlephAPI",
+        url: str,
+        params: Dict,
+        collection: Optional[Dict] = None,
+        publisher: bool = False,
+        raw: bool = False,
+        position: int = 0,
+        last_id: Optional[str] = None,
+    ):
+        self.api = api
+        self.url = url
+        self.params = params
+        self.collection = collection
+        self.publisher = publisher
+        self.raw = raw
+        self.position = position
+        self._last_id = last_id
+        self._last_line: Optional[bytes] = None
+        self._iter = self._generate()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iter)
+
+    @property
+    def last_id(self) -> Optional[str]:
+        if self._last_line is not None:
+            self._last_id = _line_id(self._last_line)
+            self._last_line = None
+        return self._last_id
+
+    def _blocks(self) -> Iterator[bytes]:
+        """Yield the not yet consumed part of the stream as line-aligned
+        blocks, reconnecting after transient errors."""
+        retrying = self.api.retry.start()
+        while True:
+            skip = self.position
+            start = self.position
+            try:
+                res = self.api.session.get(
+                    self.url,
+                    params=self.params,
+                    stream=True,
+                    timeout=self.api.timeout("stream"),
+                )
+                res.raise_for_status()
+                chunks = res.iter_content(chunk_size=RAW_CHUNK_SIZE)
+                for block in _line_blocks(chunks):
+                    if skip > 0:
+                        lines = block.count(b"\n")
+                        if lines < skip:
+                            skip -= lines
+                            continue
+                        end = _nth_line_end(block, skip)
+                        self._check_resumed(block[:end])
+                        block = block[end:]
+                        skip = 0
+                        if not len(block):
+                            continue
+                    yield block
+                if skip > 0:
+                    msg = "Stream ended before resume position %d" % start
+                    raise AlephException(msg)
+                return
+            except (RequestException, HTTPError) as exc:
+                ae = AlephException(exc)
+                if self.position > start:
+                    retrying.reset()
+                log.warning("Stream interrupted at entity %d: %s", self.position, ae)
+                if not retrying.retry(ae):
+                    raise ae from exc
+
+    def _check_resumed(self, skipped: bytes):
+        expected = self.last_id
+        if expected is None:
+            return
+        last = skipped[skipped.rfind(b"\n", 0, len(skipped) - 1) + 1 :]
+        if _line_id(last) != expected:
+            raise AlephException(
+                "Cannot resume stream: entity order changed on the server"
+            )
+
+    def _generate(self) -> Iterator[Any]:
+        for block in self._blocks():
+            if self.raw:
+                self.position += block.count(b"\n")
+                self._last_line = block[block.rfind(b"\n", 0, len(block) - 1) + 1 :]
+                yield block
+                continue
+            for line in block.split(b"\n")[:-1]:
+                self.position += 1
+                if not len(line.strip()):
+                    continue
+                entity = codec.loads(line)
+                self._last_id = entity.get("id")
+                self._last_line = None
+                yield self.api._patch_entity(
+                    entity, publisher=self.publisher, collection=self.collection
+                )
+
+
+class BaseAPI(object):
+    """Configuration and request-independent helpers shared by the blocking
+    and the asyncio clients."""
+
     def __init__(
         self,
         host: Optional[str] = settings.HOST,
         api_key: Optional[str] = settings.API_KEY,
         session_id: Optional[str] = None,
         retries: int = settings.MAX_TRIES,
+        timeouts: Optional[Mapping[str, float]] = None,
+        connect_timeout: float = settings.CONNECT_TIMEOUT,
     ):
 
         if not host:
             raise AlephException("No host environment variable found")
         self.base_url = urljoin(host, "/api/2/")
         self.retries = retries
+        self.retry = RetryPolicy(retries)
+        self.hooks: List[Hook] = self.retry.hooks
+        self.connect_timeout = connect_timeout
+        self.timeouts = dict(TIMEOUTS)
+        self.timeouts.update(ensure_dict(timeouts))
         session_id = session_id or str(uuid.uuid4())
-        self.session: Session = Session()
-        self.session.headers["X-Aleph-Session"] = session_id
-        self.session.headers["User-Agent"] = "openaleph/%s" % VERSION
+        self.headers: Dict[str, str] = {
+            "X-Aleph-Session": session_id,
+            "User-Agent": "openaleph/%s" % VERSION,
+        }
         if api_key is not None:
-            self.session.headers["Authorization"] = "ApiKey %s" % api_key
+            self.headers["Authorization"] = "ApiKey %s" % api_key
+
+    def add_hook(self, hook: Hook):
+        """Report all requests and retries to an instrumentation hook, such
+        as a `MetricsCollector`."""
+        self.hooks.append(hook)
+
+    def timeout(self, kind: str) -> Tuple[float, float]:
+        """The (connect, read) timeout for a kind of request: `read` and
+        `write` for regular API calls, `stream` for entity streams, `bulk` for
+        bulk writes and `upload` for document uploads."""
+        return (self.connect_timeout, self.timeouts[kind])
 
     def _make_url(
         self,
@@ -149,6 +443,46 @@ class AlephAPI(object):
         entity["properties"] = properties
         return entity
 
+
+class AlephAPI(BaseAPI):
+    def __init__(
+        self,
+        host: Optional[str] = settings.HOST,
+        api_key: Optional[str] = settings.API_KEY,
+        session_id: Optional[str] = None,
+        retries: int = settings.MAX_TRIES,
+        pool_size: int = settings.POOL_SIZE,
+        cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        timeouts: Optional[Mapping[str, float]] = None,
+        hedge: bool = settings.HEDGE,
+    ):
+        super(AlephAPI, self).__init__(
+            host,
+            api_key=api_key,
+            session_id=session_id,
+            retries=retries,
+            timeouts=timeouts,
+        )
+        self.transport = Transport(
+            self.headers,
+            pool_size=pool_size,
+            limiter=rate_limiter,
+            retry=self.retry,
+            hooks=self.hooks,
+        )
+        self.cache = cache
+        self.hedger = Hedger(max_workers=pool_size) if hedge else None
+        # Keep cached responses of different users apart in shared caches.
+        key_hash = hashlib.sha1(str(api_key).encode("utf-8")).hexdigest()[:12]
+        self._cache_ns = key_hash + " "
+
+    @property
+    def session(self) -> Session:
+        """The HTTP session of the calling thread. All sessions share one
+        connection pool, see `Transport`."""
+        return self.transport.session
+
     def _request(self, method: str, url: str, **kwargs) -> Dict:
         """A single point to make the http requests.
 
@@ -156,16 +490,93 @@ class AlephAPI(object):
         successful and failed responses and possibly manage session etc
         conviniently in a single place.
         """
+        if self.cache is not None:
+            if method == "GET" and not kwargs:
+                return self._cached_request(url)
+            if method != "GET":
+                self._invalidate(url)
+        response = self._send(method, url, **kwargs)
+        return self._parse(response.content)
+
+    def _send(self, method: str, url: str, **kwargs) -> Response:
+        kind = "read" if method == "GET" else "write"
+        kwargs.setdefault("timeout", self.timeout(kind))
+        if kind == "read":
+            # reads are idempotent, so transient errors can always be retried
+            return self.retry.call(self._send_once, method, url, kind, **kwargs)
+        return self._send_once(method, url, kind, **kwargs)
+
+    def _send_once(self, method: str, url: str, kind: str, **kwargs) -> Response:
         try:
-            response = self.session.request(method=method, url=url, **kwargs)
+            if self.hedger is not None and kind == "read":
+                response = self._hedged(method, url, **kwargs)
+            else:
+                response = self.session.request(method=method, url=url, **kwargs)
             response.raise_for_status()
         except (RequestException, HTTPError) as exc:
             raise AlephException(exc) from exc
+        return response
+
+    def _hedged(self, method: str, url: str, **kwargs) -> Response:
+        """Send an idempotent request, and a duplicate if it is slow."""
+        assert self.hedger is not None
+        latency = self.hedger.latency
+
+        def send() -> Response:
+            start = time.monotonic()
+            response = self.session.request(method=method, url=url, **kwargs)
+            latency.observe(time.monotonic() - start)
+            return response
+
+        return self.hedger.call(send, discard=Response.close)
 
-        if len(response.text):
-            return response.json()
+    def _parse(self, content: bytes) -> Dict:
+        if len(content):
+            return codec.loads(content)
         return {}
 
+    def _cache_scope(self, url: str) -> str:
+        """Cache key prefix for all URLs of the same kind of object, which
+        are invalidated when one of them is modified."""
+        path = url[len(self.base_url) :] if url.startswith(self.base_url) else ""
+        segment = path.split("?")[0].split("/")[0]
+        return self._cache_ns + self.base_url + segment
+
+    def _invalidate(self, url: str):
+        """Drop cached responses which a write to `url` may have changed:
+        those of the same kind of object and, for writes into a collection
+        (bulk writes, uploads), all entities."""
+        if self.cache is None:
+            return
+        scope = self._cache_scope(url)
+        self.cache.invalidate(scope)
+        prefix = self._cache_ns + self.base_url
+        if scope == prefix + "collections":
+            self.cache.invalidate(prefix + "entities")
+
+    def _cached_request(self, url: str) -> Dict:
+        assert self.cache is not None
+        key = self._cache_ns + url
+        entry = self.cache.get(key)
+        if entry is not None and entry.fresh:
+            self.cache.hit()
+            return self._parse(entry.data)
+        self.cache.miss()
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        response = self._send("GET", url, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            self.cache.refresh(key, entry)
+            return self._parse(entry.data)
+        self.cache.set(
+            key,
+            response.content,
+            etag=response.headers.get("ETag"),
+            scope=self._cache_scope(url),
+        )
+        return self._parse(response.content)
+
     def search(
         self,
         query: str,
@@ -174,8 +585,17 @@ class AlephAPI(object):
         filters: Optional[List] = None,
         publisher: bool = False,
         params: Optional[Mapping[str, Any]] = None,
+        limit: Optional[int] = None,
+        prefetch: int = 0,
     ) -> "EntityResultSet":
-        """Conduct a search and return the search results."""
+        """Conduct a search and return the search results.
+
+        params
+        ------
+        limit: number of results per page (the server default is small)
+        prefetch: number of pages to fetch ahead in the background while
+        iterating over the results
+        """
         filters_list: List = ensure_list(filters)
         if schema is not None:
             filters_list.append(("schema", schema))
@@ -183,10 +603,13 @@ class AlephAPI(object):
             filters_list.append(("schemata", schemata))
         if schema is None and schemata is None:
             filters_list.append(("schemata", "Thing"))
+        params_ = dict(params or {})
+        if limit is not None:
+            params_["limit"] = limit
         url = self._make_url(
-            "entities", query=query, filters=filters_list, params=params
+            "entities", query=query, filters=filters_list, params=params_
         )
-        return EntityResultSet(self, url, publisher)
+        return EntityResultSet(self, url, publisher, prefetch=prefetch)
 
     def get_collection(self, collection_id: str) -> Dict:
         """Get a single collection by ID (not foreign ID!)."""
@@ -308,32 +731,43 @@ class AlephAPI(object):
         self,
         collection: Optional[Dict] = None,
         include: Optional[List] = None,
-        schema: Optional[str] = None,
+        schema: Optional[Union[str, Iterable[str]]] = None,
         publisher: bool = False,
-    ) -> Iterator[Dict]:
+        raw: bool = False,
+        position: int = 0,
+        last_id: Optional[str] = None,
+    ) -> "EntityStream":
         """Iterate over all entities in the given collection.
 
         params
         ------
         collection_id: id of the collection to stream
         include: an array of fields from the index to include.
+        schema: one or several schemata to stream.
+        raw: instead of parsed and patched entities, yield the server's
+        newline-delimited JSON as large blocks of bytes, each ending on a
+        complete line. `publisher` is ignored and no `alephUrl` is added.
+        position, last_id: resume a stream from a previous `EntityStream`,
+        skipping the entities it already returned.
         """
         url = self._make_url("entities/_stream")
         if collection is not None:
             collection_id = collection.get("id")
             url = f"collections/{collection_id}/_stream"
             url = self._make_url(url)
+        if schema is not None and not isinstance(schema, str):
+            schema = list(schema)
         params = {"include": include, "schema": schema}
-        try:
-            res = self.session.get(url, params=params, stream=True)
-            res.raise_for_status()
-            for entity in res.iter_lines(chunk_size=None):
-                entity = json.loads(entity)
-                yield self._patch_entity(
-                    entity, publisher=publisher, collection=collection
-                )
-        except (RequestException, HTTPError) as exc:
-            raise AlephException(exc) from exc
+        return EntityStream(
+            self,
+            url,
+            params,
+            collection=collection,
+            publisher=publisher,
+            raw=raw,
+            position=position,
+            last_id=last_id,
+        )
 
     def _bulk_chunk(
         self,
@@ -343,26 +777,67 @@ class AlephAPI(object):
         force: bool = False,
         unsafe: bool = False,
         cleaned: bool = False,
+        sizer: Optional[ChunkSizer] = None,
+        compress: bool = False,
     ):
-        for attempt in count(1):
-            url = self._make_url(f"collections/{collection_id}/_bulk")
-            params = {"entityset_id": entityset_id}
-            if unsafe:
-                params["safe"] = "false"
-            if cleaned:
-                params["clean"] = "false"
+        """Send one chunk of entities to the bulk API. The body is streamed
+        from the encoded entities and gzip-compressed if `compress` is set. A
+        chunk the server rejects as too large (HTTP 413), or which times out
+        while waiting for the response, is split in half and each half sent
+        on its own. Other errors go through the retry policy."""
+        url = self._make_url(f"collections/{collection_id}/_bulk")
+        params = {"entityset_id": entityset_id}
+        if unsafe:
+            params["safe"] = "false"
+        if cleaned:
+            params["clean"] = "false"
+        chunk = [encode_entity(e) for e in chunk]
+        headers = {"Content-Type": "application/json"}
+        if compress:
+            headers["Content-Encoding"] = "gzip"
+        retrying = self.retry.start()
+        while True:
             try:
-                response = self.session.post(url, json=chunk, params=params)
+                body: Any = BulkBody(chunk)
+                if compress:
+                    body = gzip_stream(body)
+                start = time.monotonic()
+                response = self.session.post(
+                    url,
+                    data=body,
+                    params=params,
+                    headers=headers,
+                    timeout=self.timeout("bulk"),
+                )
                 response.raise_for_status()
+                self._invalidate(url)
+                if sizer is not None:
+                    sizer.observe(len(chunk), time.monotonic() - start)
                 return
             except (RequestException, HTTPError) as exc:
                 ae = AlephException(exc)
-                if not ae.transient or attempt > self.retries:
+                if len(chunk) > 1 and _is_oversize(exc, ae):
+                    if sizer is None:
+                        sizer = ChunkSizer(len(chunk))
+                    sizer.oversize(chunk)
+                    half = len(chunk) // 2
+                    for part in (chunk[:half], chunk[half:]):
+                        self._bulk_chunk(
+                            collection_id,
+                            part,
+                            entityset_id=entityset_id,
+                            force=force,
+                            unsafe=unsafe,
+                            cleaned=cleaned,
+                            sizer=sizer,
+                            compress=compress,
+                        )
+                    return
+                if not retrying.retry(ae):
                     if not force:
                         raise ae from exc
                     log.error(ae)
                     return
-                backoff(ae, attempt)
 
     def write_entity(
         self, collection_id: str, entity: Dict, entity_id: Optional[str] = None, **kw
@@ -383,24 +858,25 @@ class AlephAPI(object):
         if entity_id is not None:
             entity["id"] = entity_id
 
-        for attempt in count(1):
-            if entity_id is not None:
-                url = self._make_url("entities/{}").format(entity_id)
-            else:
-                url = self._make_url("entities")
-            try:
-                return self._request("POST", url, json=entity)
-            except RequestException as exc:
-                ae = AlephException(exc)
-                if not ae.transient or attempt > self.retries:
-                    log.error(ae)
-                    raise exc
-                backoff(ae, attempt)
-
-        return {}
+        if entity_id is not None:
+            url = self._make_url("entities/{}").format(entity_id)
+        else:
+            url = self._make_url("entities")
+        try:
+            return self.retry.call(self._request, "POST", url, json=entity)
+        except AlephException as ae:
+            log.error(ae)
+            raise
 
     def write_entities(
-        self, collection_id: str, entities: Iterable, chunk_size: int = 1000, **kw
+        self,
+        collection_id: str,
+        entities: Iterable,
+        chunk_size: int = 1000,
+        concurrency: int = 1,
+        chunk_bytes: int = settings.BULK_CHUNK_BYTES,
+        target_latency: float = settings.BULK_TARGET_LATENCY,
+        **kw,
     ):
         """Create entities in bulk via the API, in the given
         collection.
@@ -409,17 +885,46 @@ class AlephAPI(object):
         ------
         collection_id: id of the collection to use
         entities: an iterable of entities to upload
+        chunk_size: maximum number of entities sent per bulk request
+        concurrency: number of bulk requests kept in flight at once. At most
+        as many chunks again are buffered in memory while waiting for the
+        server, after which reading from `entities` is paused.
+        chunk_bytes: maximum serialized size of a bulk request
+        target_latency: shrink chunks when a bulk request takes longer than
+        this many seconds, grow them back up to `chunk_size` when faster.
+        Set to 0 to always send `chunk_size` entities.
+        compress: gzip-compress request bodies. The server, or a proxy in
+        front of it, must accept `Content-Encoding: gzip` request bodies.
         """
-        chunk = []
-        for entity in entities:
-            if hasattr(entity, "to_dict"):
-                entity = entity.to_dict()
-            chunk.append(entity)
-            if len(chunk) >= chunk_size:
+        sizer = ChunkSizer(chunk_size, chunk_bytes, target_latency)
+        kw["sizer"] = sizer
+        chunks = sizer.chunks(entities)
+        if concurrency <= 1:
+            for chunk in chunks:
                 self._bulk_chunk(collection_id, chunk, **kw)
-                chunk = []
-        if len(chunk):
-            self._bulk_chunk(collection_id, chunk, **kw)
+            return
+
+        self.transport.ensure_pool_size(concurrency)
+        executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="openaleph-bulk"
+        )
+        pending: Set[Future] = set()
+        try:
+            for chunk in chunks:
+                while len(pending) >= concurrency * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                future = executor.submit(self._bulk_chunk, collection_id, chunk, **kw)
+                pending.add(future)
+            for future in as_completed(pending):
+                future.result()
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+        finally:
+            executor.shutdown(wait=True)
 
     def match(
         self,
@@ -432,13 +937,18 @@ class AlephAPI(object):
         params = {"collection_ids": ensure_list(collection_ids)}
         if url is None:
             url = self._make_url("match")
-        try:
-            response = self.session.post(url, json=entity, params=params)  # type: ignore
-            response.raise_for_status()
-            for result in response.json().get("results", []):
-                yield self._patch_entity(result, publisher=publisher)
-        except (RequestException, HTTPError) as exc:
-            raise AlephException(exc) from exc
+        # matching does not modify anything, so it is retried like a read
+        response = self.retry.call(
+            self._send_once,
+            "POST",
+            url,
+            "write",
+            json=entity,
+            params=params,
+            timeout=self.timeout("read"),
+        )
+        for result in codec.loads(response.content).get("results", []):
+            yield self._patch_entity(result, publisher=publisher)
 
     def entitysets(
         self,
@@ -455,10 +965,12 @@ class AlephAPI(object):
         return APIResultSet(self, url)
 
     def entitysetitems(
-        self, entityset_id: str, publisher: bool = False
+        self, entityset_id: str, publisher: bool = False, prefetch: int = 0
     ) -> "APIResultSet":
         url = self._make_url(f"entitysets/{entityset_id}/items")
-        return EntitySetItemsResultSet(self, url, publisher=publisher)
+        return EntitySetItemsResultSet(
+            self, url, publisher=publisher, prefetch=prefetch
+        )
 
     def ingest_upload(
         self,
@@ -486,25 +998,24 @@ class AlephAPI(object):
         log.critical(url)
         if not file_path or file_path.is_dir():
             data = {"meta": json.dumps(metadata)}
-            return self._request("POST", url, data=data)
+            return self.retry.call(self._request, "POST", url, data=data)
+
+        def upload() -> Dict:
+            with file_path.open("rb") as fh:
+                # use multipart encoder to allow uploading very large files
+                m = MultipartEncoder(
+                    fields={
+                        "meta": json.dumps(metadata),
+                        "file": (file_path.name, fh, MIME),
+                    }
+                )
+                headers = {"Content-Type": m.content_type}
+                timeout = self.timeout("upload")
+                return self._request(
+                    "POST", url, data=m, headers=headers, timeout=timeout
+                )
 
-        for attempt in count(1):
-            try:
-                with file_path.open("rb") as fh:
-                    # use multipart encoder to allow uploading very large files
-                    m = MultipartEncoder(
-                        fields={
-                            "meta": json.dumps(metadata),
-                            "file": (file_path.name, fh, MIME),
-                        }
-                    )
-                    headers = {"Content-Type": m.content_type}
-                    return self._request("POST", url, data=m, headers=headers)
-            except AlephException as ae:
-                if not ae.transient or attempt > self.retries:
-                    raise ae from ae
-                backoff(ae, attempt)
-        return {}
+        return self.retry.call(upload)
 
     def create_entityset(
         self, collection_id: str, type: str, label: str, summary: Optional[str]
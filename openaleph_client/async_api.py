@@ -0,0 +1,485 @@
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from banal import ensure_dict, ensure_list
+from typing import Any, AsyncIterator, Dict, Iterable, List, Mapping, Optional
+
+from openaleph_client import codec, settings
+from openaleph_client.api import BaseAPI, MIME
+from openaleph_client.bulk import BulkBody, ChunkSizer
+from openaleph_client.errors import AlephException
+from openaleph_client.metrics import RequestInfo, endpoint_name
+from openaleph_client.retry import Retrying, RetryPolicy
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None  # type: ignore
+
+log = logging.getLogger(__name__)
+
+
+def _clean_params(params: Optional[Mapping[str, Any]]) -> Dict[str, Any]:
+    # requests silently drops None values, httpx would send them as empty
+    # strings.
+    return {k: v for k, v in ensure_dict(params).items() if v is not None}
+
+
+def _exception(exc: Exception) -> AlephException:
+    ae = AlephException(exc)
+    if isinstance(exc, httpx.TransportError):
+        ae.transient = True
+    return ae
+
+
+async def _retry(retrying: Retrying, err: AlephException) -> bool:
+    """Asynchronous version of `Retrying.retry`."""
+    delay = retrying.delay(err)
+    if delay is None:
+        return False
+    log.warning("Error: %s, back-off: %.2fs", err, delay)
+    await asyncio.sleep(delay)
+    return True
+
+
+if httpx is not None:
+
+    class _PolicyTransport(httpx.AsyncBaseTransport):
+        """Wait for the circuit breaker of a `RetryPolicy` before each
+        request and report the outcome to it."""
+
+        def __init__(self, transport: httpx.AsyncBaseTransport, retry: RetryPolicy):
+            self.transport = transport
+            self.retry = retry
+
+        async def handle_async_request(self, request):
+            while True:
+                delay = self.retry.breaker.remaining()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            start = time.monotonic()
+            status = None
+            try:
+                response = await self.transport.handle_async_request(request)
+                status = response.status_code
+            except httpx.TransportError:
+                self.retry.record(None)
+                raise
+            finally:
+                if len(self.retry.hooks):
+                    self._report(request, status, time.monotonic() - start)
+            self.retry.record(response.status_code)
+            return response
+
+        def _report(self, request, status: Optional[int], elapsed: float):
+            url = str(request.url)
+            info = RequestInfo(
+                method=request.method,
+                url=url,
+                endpoint=endpoint_name(url),
+                status=status,
+                elapsed=elapsed,
+                sent=int(request.headers.get("Content-Length", 0)),
+            )
+            for hook in self.retry.hooks:
+                hook.on_request(info)
+
+        async def aclose(self):
+            await self.transport.aclose()
+
+
+class AsyncAPIResultSet(object):
+    """Async iterator over a paginated API result. Use ``await`` on the
+    method returning it to load the first page, then ``async for``."""
+
+    def __init__(self, api: "AsyncAlephAPI", url: str):
+        self.api = api
+        self.url = url
+        self.current = 0
+        self.result: Dict = {}
+
+    async def _load(self) -> "AsyncAPIResultSet":
+        self.result = await self.api._request("GET", self.url)
+        return self
+
+    def __await__(self):
+        return self._load().__await__()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.result:
+            await self._load()
+        if self.index >= self.result.get("limit"):
+            next_url = self.result.get("next")
+            if next_url is None:
+                raise StopAsyncIteration
+            self.result = await self.api._request("GET", next_url)
+        try:
+            item = self.result.get("results", [])[self.index]
+        except IndexError:
+            raise StopAsyncIteration
+        self.current += 1
+        return self._patch(item)
+
+    def _patch(self, item):
+        return item
+
+    @property
+    def index(self):
+        return self.current - self.result.get("offset")
+
+    def __len__(self):
+        return self.result.get("total")
+
+    def __repr__(self):
+        return "<AsyncAPIResultSet(%r)>" % self.url
+
+
+class AsyncEntityResultSet(AsyncAPIResultSet):
+    def __init__(self, api: "AsyncAlephAPI", url: str, publisher: bool):
+        super(AsyncEntityResultSet, self).__init__(api, url)
+        self.publisher = publisher
+
+    def _patch(self, item):
+        return self.api._patch_entity(item, self.publisher)
+
+
+class AsyncEntitySetItemsResultSet(AsyncAPIResultSet):
+    def __init__(self, api: "AsyncAlephAPI", url: str, publisher: bool):
+        super(AsyncEntitySetItemsResultSet, self).__init__(api, url)
+        self.publisher = publisher
+
+    def _patch(self, item):
+        entity = ensure_dict(item.get("entity"))
+        item["entity"] = self.api._patch_entity(entity, self.publisher)
+        return item
+
+
+class AsyncAlephAPI(BaseAPI):
+    """An asyncio-native version of `AlephAPI`. All requests share a single
+    connection pool of at most `pool_size` connections, so many concurrent
+    calls can be issued from one event loop:
+
+        async with AsyncAlephAPI(host, api_key) as api:
+            entities = await asyncio.gather(*[api.get_entity(i) for i in ids])
+
+    Requires the optional `httpx` dependency (`openaleph-client[async]`).
+    """
+
+    def __init__(
+        self,
+        host: Optional[str] = settings.HOST,
+        api_key: Optional[str] = settings.API_KEY,
+        session_id: Optional[str] = None,
+        retries: int = settings.MAX_TRIES,
+        pool_size: int = settings.POOL_SIZE,
+        transport: Optional["httpx.AsyncBaseTransport"] = None,
+        timeouts: Optional[Mapping[str, float]] = None,
+    ):
+        if httpx is None:
+            raise AlephException(
+                "AsyncAlephAPI requires httpx: pip install openaleph-client[async]"
+            )
+        super(AsyncAlephAPI, self).__init__(
+            host,
+            api_key=api_key,
+            session_id=session_id,
+            retries=retries,
+            timeouts=timeouts,
+        )
+        limits = httpx.Limits(
+            max_connections=pool_size, max_keepalive_connections=pool_size
+        )
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(limits=limits)
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            timeout=self._timeout("read"),
+            transport=_PolicyTransport(transport, self.retry),
+        )
+
+    def _timeout(self, kind: str) -> "httpx.Timeout":
+        connect, read = self.timeout(kind)
+        return httpx.Timeout(read, connect=connect)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _request(
+        self, method: str, url: str, idempotent: Optional[bool] = None, **kwargs
+    ) -> Dict:
+        """A single point to make the http requests. Idempotent requests (by
+        default all GETs) are retried on transient errors."""
+        if idempotent is None:
+            idempotent = method == "GET"
+        retrying = self.retry.start()
+        while True:
+            try:
+                response = await self.client.request(method=method, url=url, **kwargs)
+                response.raise_for_status()
+                break
+            except httpx.HTTPError as exc:
+                ae = _exception(exc)
+                if not idempotent or not await _retry(retrying, ae):
+                    raise ae from exc
+
+        if len(response.content):
+            return codec.loads(response.content)
+        return {}
+
+    def search(
+        self,
+        query: str,
+        schema: Optional[str] = None,
+        schemata: Optional[str] = None,
+        filters: Optional[List] = None,
+        publisher: bool = False,
+        params: Optional[Mapping[str, Any]] = None,
+    ) -> AsyncEntityResultSet:
+        """Conduct a search and return the search results."""
+        filters_list: List = ensure_list(filters)
+        if schema is not None:
+            filters_list.append(("schema", schema))
+        if schemata is not None:
+            filters_list.append(("schemata", schemata))
+        if schema is None and schemata is None:
+            filters_list.append(("schemata", "Thing"))
+        url = self._make_url(
+            "entities", query=query, filters=filters_list, params=params
+        )
+        return AsyncEntityResultSet(self, url, publisher)
+
+    async def get_collection(self, collection_id: str) -> Dict:
+        """Get a single collection by ID (not foreign ID!)."""
+        url = self._make_url(f"collections/{collection_id}")
+        return await self._request("GET", url)
+
+    async def get_entity(self, entity_id: str, publisher: bool = False) -> Dict:
+        """Get a single entity by ID."""
+        url = self._make_url(f"entities/{entity_id}")
+        entity = await self._request("GET", url)
+        return self._patch_entity(entity, publisher)
+
+    async def delete_entity(self, entity_id: str) -> Dict:
+        """Delete a single entity by ID."""
+        url = self._make_url(f"entities/{entity_id}")
+        return await self._request("DELETE", url)
+
+    def filter_collections(
+        self, query: Optional[str] = None, filters: Optional[List] = None, **kwargs
+    ) -> AsyncAPIResultSet:
+        """Filter collections for the given query and/or filters."""
+        if not query and not filters:
+            raise ValueError("One of query or filters is required")
+
+        url = self._make_url("collections", query=query, filters=filters, params=kwargs)
+        return AsyncAPIResultSet(self, url)
+
+    async def get_collection_by_foreign_id(self, foreign_id: str) -> Optional[Dict]:
+        """Get a dict representing a collection based on its foreign ID."""
+        if foreign_id is None:
+            return None
+        filters = [("foreign_id", foreign_id)]
+        async for coll in self.filter_collections(filters=filters):
+            return coll
+        return None
+
+    async def create_collection(self, data: Dict) -> Dict:
+        """Create a collection from the given data."""
+        url = self._make_url("collections")
+        return await self._request("POST", url, json=data)
+
+    async def load_collection_by_foreign_id(
+        self, foreign_id: str, config: Optional[Dict] = None
+    ) -> Dict:
+        """Get a collection by its foreign ID, or create one."""
+        collection = await self.get_collection_by_foreign_id(foreign_id)
+        if collection is not None:
+            return collection
+
+        config_: Dict = ensure_dict(config)
+        return await self.create_collection(
+            {
+                "foreign_id": foreign_id,
+                "label": config_.get("label", foreign_id),
+                "casefile": config_.get("casefile", False),
+                "category": config_.get("category", "other"),
+                "languages": config_.get("languages", []),
+                "summary": config_.get("summary", ""),
+            }
+        )
+
+    async def stream_entities(
+        self,
+        collection: Optional[Dict] = None,
+        include: Optional[List] = None,
+        schema: Optional[str] = None,
+        publisher: bool = False,
+    ) -> AsyncIterator[Dict]:
+        """Iterate over all entities in the given collection."""
+        url = self._make_url("entities/_stream")
+        if collection is not None:
+            collection_id = collection.get("id")
+            url = self._make_url(f"collections/{collection_id}/_stream")
+        params = _clean_params({"include": include, "schema": schema})
+        try:
+            timeout = self._timeout("stream")
+            async with self.client.stream(
+                "GET", url, params=params, timeout=timeout
+            ) as res:
+                res.raise_for_status()
+                async for line in res.aiter_lines():
+                    if not line.strip():
+                        continue
+                    entity = codec.loads(line)
+                    yield self._patch_entity(
+                        entity, publisher=publisher, collection=collection
+                    )
+        except httpx.HTTPError as exc:
+            raise _exception(exc) from exc
+
+    async def _bulk_chunk(
+        self,
+        collection_id: str,
+        chunk: List[bytes],
+        entityset_id: Optional[str] = None,
+        force: bool = False,
+        unsafe: bool = False,
+        cleaned: bool = False,
+        sizer: Optional[ChunkSizer] = None,
+    ):
+        url = self._make_url(f"collections/{collection_id}/_bulk")
+        params: Dict[str, Any] = _clean_params({"entityset_id": entityset_id})
+        if unsafe:
+            params["safe"] = "false"
+        if cleaned:
+            params["clean"] = "false"
+        body = b"".join(BulkBody(chunk))
+        headers = {"Content-Type": "application/json"}
+        retrying = self.retry.start()
+        while True:
+            try:
+                started = time.monotonic()
+                response = await self.client.post(
+                    url,
+                    content=body,
+                    headers=headers,
+                    params=params,
+                    timeout=self._timeout("bulk"),
+                )
+                response.raise_for_status()
+                if sizer is not None:
+                    sizer.observe(len(chunk), time.monotonic() - started)
+                return
+            except httpx.HTTPError as exc:
+                ae = _exception(exc)
+                if not await _retry(retrying, ae):
+                    if not force:
+                        raise ae from exc
+                    log.error(ae)
+                    return
+
+    async def write_entities(
+        self,
+        collection_id: str,
+        entities: Iterable,
+        chunk_size: int = 1000,
+        chunk_bytes: int = settings.BULK_CHUNK_BYTES,
+        target_latency: float = settings.BULK_TARGET_LATENCY,
+        **kw,
+    ):
+        """Create entities in bulk via the API, in the given collection.
+        `entities` may be a regular or an async iterable of dicts or entity
+        proxies. Chunks are capped like in `AlephAPI.write_entities`: by
+        `chunk_size` entities, adapted to the server latency, and by
+        `chunk_bytes` of serialized entities."""
+        sizer = ChunkSizer(chunk_size, chunk_bytes, target_latency)
+        if hasattr(entities, "__aiter__"):
+            async for chunk in sizer.achunks(entities):  # type: ignore
+                await self._bulk_chunk(collection_id, chunk, sizer=sizer, **kw)
+        else:
+            for chunk in sizer.chunks(entities):
+                await self._bulk_chunk(collection_id, chunk, sizer=sizer, **kw)
+
+    async def match(
+        self,
+        entity: Dict,
+        collection_ids: Optional[str] = None,
+        url: Optional[str] = None,
+        publisher: bool = False,
+    ) -> List[Dict]:
+        """Find similar entities given a sample entity."""
+        params = {"collection_ids": ensure_list(collection_ids)}
+        if url is None:
+            url = self._make_url("match")
+        data = await self._request(
+            "POST", url, idempotent=True, json=entity, params=params
+        )
+        return [
+            self._patch_entity(result, publisher=publisher)
+            for result in data.get("results", [])
+        ]
+
+    def entitysets(
+        self,
+        collection_id: Optional[str] = None,
+        set_types: Optional[List] = None,
+        prefix: Optional[str] = None,
+    ) -> AsyncAPIResultSet:
+        """Stream EntitySets"""
+        filters_collection = [("collection_id", collection_id)]
+        filters_type = [("type", t) for t in ensure_list(set_types)]
+        filters = [*filters_collection, *filters_type]
+        params = {"prefix": prefix}
+        url = self._make_url("entitysets", filters=filters, params=params)
+        return AsyncAPIResultSet(self, url)
+
+    def entitysetitems(
+        self, entityset_id: str, publisher: bool = False
+    ) -> AsyncAPIResultSet:
+        url = self._make_url(f"entitysets/{entityset_id}/items")
+        return AsyncEntitySetItemsResultSet(self, url, publisher=publisher)
+
+    async def ingest_upload(
+        self,
+        collection_id: str,
+        file_path: Optional[Path] = None,
+        metadata: Optional[Dict] = None,
+        sync: bool = False,
+        index: bool = True,
+    ) -> Dict:
+        """Create an empty folder in a collection or upload a document to it.
+        See `AlephAPI.ingest_upload`."""
+        url_path = "collections/{0}/ingest".format(collection_id)
+        params = {"sync": sync, "index": index}
+        url = self._make_url(url_path, params=params)
+        data = {"meta": json.dumps(metadata)}
+        if not file_path or file_path.is_dir():
+            return await self._request("POST", url, data=data)
+
+        retrying = self.retry.start()
+        while True:
+            try:
+                with file_path.open("rb") as fh:
+                    files = {"file": (file_path.name, fh, MIME)}
+                    return await self._request(
+                        "POST",
+                        url,
+                        data=data,
+                        files=files,
+                        timeout=self._timeout("upload"),
+                    )
+            except AlephException as ae:
+                if not await _retry(retrying, ae):
+                    raise
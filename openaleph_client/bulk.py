@@ -0,0 +1,179 @@
+import logging
+import threading
+import zlib
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator, List
+
+from openaleph_client import codec, settings
+
+log = logging.getLogger(__name__)
+
+
+def encode_entity(entity: Any) -> bytes:
+    """Serialize an entity (a dict or a followthemoney proxy) for the bulk
+    API. Already encoded entities are passed through."""
+    if isinstance(entity, bytes):
+        return entity
+    if hasattr(entity, "to_dict"):
+        entity = entity.to_dict()
+    return codec.dumps(entity)
+
+
+class BulkBody(object):
+    """A request body that streams a chunk of encoded entities as a JSON
+    array, without joining them into one large string first. Its length is
+    known up front, so it is sent with a `Content-Length` header; it can be
+    iterated again when a request is retried."""
+
+    def __init__(self, chunk: List[bytes], buffer_size: int = 64 * 1024):
+        self.chunk = chunk
+        self.buffer_size = buffer_size
+
+    def __len__(self) -> int:
+        if not len(self.chunk):
+            return 2
+        return sum(len(e) for e in self.chunk) + len(self.chunk) + 1
+
+    def __iter__(self) -> Iterator[bytes]:
+        # Coalesce small entities into larger writes to the socket.
+        buffer = bytearray(b"[")
+        for idx, data in enumerate(self.chunk):
+            if idx > 0:
+                buffer.extend(b",")
+            if len(buffer) + len(data) > self.buffer_size:
+                yield bytes(buffer)
+                buffer.clear()
+                if len(data) > self.buffer_size:
+                    yield data
+                    continue
+            buffer.extend(data)
+        buffer.extend(b"]")
+        yield bytes(buffer)
+
+
+def gzip_stream(parts: Iterable[bytes], buffer_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Gzip-compress a stream of bytes into pieces of roughly `buffer_size`
+    bytes, for use as a chunked request body (`Content-Encoding: gzip`)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    buffer = bytearray()
+    for part in parts:
+        buffer.extend(compressor.compress(part))
+        if len(buffer) >= buffer_size:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer.extend(compressor.flush())
+    yield bytes(buffer)
+
+
+class ChunkSizer(object):
+    """Decide how many entities go into the next bulk request.
+
+    Chunks are capped both by number of entities and by serialized size. The
+    entity limit starts at `max_size` and follows the observed server latency:
+    it shrinks when a request takes longer than `target_latency` seconds and
+    grows back towards `max_size` when requests are fast. A rejected oversize
+    chunk lowers both limits to half of that chunk; like the entity limit,
+    the byte limit then grows back towards `max_bytes` with fast requests.
+    Shared by all threads writing the same stream.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        max_bytes: int = settings.BULK_CHUNK_BYTES,
+        target_latency: float = settings.BULK_TARGET_LATENCY,
+    ):
+        self.max_size = max(1, max_size)
+        self.limit_bytes = max_bytes
+        self.max_bytes = max_bytes
+        self.target_latency = target_latency
+        self.size = self.max_size
+        self._lock = threading.Lock()
+
+    def observe(self, size: int, elapsed: float):
+        """Adapt the chunk size after a request for `size` entities took
+        `elapsed` seconds."""
+        if self.max_bytes != self.limit_bytes:
+            self._recover_bytes(elapsed)
+        if self.target_latency <= 0 or size < self.size:
+            # latency of a short (final or split) chunk says little about
+            # the current size
+            return
+        with self._lock:
+            if elapsed > self.target_latency * 2:
+                new_size = self.size // 2
+            elif elapsed > self.target_latency:
+                new_size = int(self.size * 0.8)
+            elif elapsed < self.target_latency / 2:
+                new_size = int(self.size * 1.25) + 1
+            else:
+                return
+            new_size = min(self.max_size, max(1, new_size))
+            if new_size != self.size:
+                log.debug("Bulk chunk size: %d -> %d (%.2fs)", self.size, new_size, elapsed)
+                self.size = new_size
+
+    def _recover_bytes(self, elapsed: float):
+        # Chunks cut short by the byte limit are still informative here, so
+        # this does not depend on the number of entities sent.
+        if 0 < self.target_latency <= elapsed * 2:
+            return
+        with self._lock:
+            new_bytes = int(self.max_bytes * 1.25) + 1
+            if 0 < self.limit_bytes <= new_bytes:
+                new_bytes = self.limit_bytes
+            log.debug("Bulk chunk bytes: %d -> %d (%.2fs)", self.max_bytes, new_bytes, elapsed)
+            self.max_bytes = new_bytes
+
+    def oversize(self, chunk: List[bytes]):
+        """The server rejected `chunk` as too large or timed out on it."""
+        with self._lock:
+            self.size = max(1, min(self.size, len(chunk) // 2))
+            chunk_bytes = sum(len(e) for e in chunk)
+            if self.max_bytes <= 0 or chunk_bytes // 2 < self.max_bytes:
+                self.max_bytes = max(1, chunk_bytes // 2)
+            log.warning(
+                "Bulk chunk too large (%d entities, %d bytes), splitting. "
+                "New limits: %d entities, %d bytes",
+                len(chunk),
+                chunk_bytes,
+                self.size,
+                self.max_bytes,
+            )
+
+    def _exceeds(self, chunk: List[bytes], chunk_bytes: int, data: bytes) -> bool:
+        """Whether adding `data` would take `chunk` over the byte limit."""
+        return len(chunk) > 0 and 0 < self.max_bytes < chunk_bytes + len(data)
+
+    def chunks(self, entities: Iterable) -> Iterator[List[bytes]]:
+        """Group `entities` into encoded chunks within the current limits."""
+        chunk: List[bytes] = []
+        chunk_bytes = 0
+        for entity in entities:
+            data = encode_entity(entity)
+            if self._exceeds(chunk, chunk_bytes, data):
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk.append(data)
+            chunk_bytes += len(data)
+            if len(chunk) >= self.size:
+                yield chunk
+                chunk, chunk_bytes = [], 0
+        if len(chunk):
+            yield chunk
+
+    async def achunks(self, entities: AsyncIterable) -> AsyncIterator[List[bytes]]:
+        """Like `chunks`, for an async iterable of entities."""
+        chunk: List[bytes] = []
+        chunk_bytes = 0
+        async for entity in entities:
+            data = encode_entity(entity)
+            if self._exceeds(chunk, chunk_bytes, data):
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk.append(data)
+            chunk_bytes += len(data)
+            if len(chunk) >= self.size:
+                yield chunk
+                chunk, chunk_bytes = [], 0
+        if len(chunk):
+            yield chunk
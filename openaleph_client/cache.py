@@ -0,0 +1,179 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Set
+
+from openaleph_client import settings
+
+log = logging.getLogger(__name__)
+
+
+class CacheEntry(NamedTuple):
+    expires: float
+    etag: Optional[str]
+    data: bytes
+    scope: Optional[str] = None
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires > time.time()
+
+
+class ResponseCache(object):
+    """Cache for the bodies of idempotent GET responses.
+
+    Entries are kept in memory up to `max_size`, evicting the least recently
+    used ones, and are fresh for `ttl` seconds. Expired entries which came
+    with an `ETag` are kept for revalidation with `If-None-Match`. With a
+    `path`, entries are also stored in an SQLite file, so that they can be
+    shared between processes (e.g. subsequent CLI invocations). Each entry
+    belongs to a `scope`, by which entries are invalidated together. Scopes
+    without cached entries are tracked in memory, so that writes to them cost
+    nothing; entries stored by other processes after this cache was opened
+    are therefore only invalidated once this process also caches in that
+    scope.
+    """
+
+    def __init__(
+        self,
+        ttl: float = settings.CACHE_TTL,
+        max_size: int = settings.CACHE_SIZE,
+        path: Optional[str] = None,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.path = path
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # scopes which may have cached entries
+        self._scopes: Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+        if path is not None:
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._setup()
+            self._prune()
+            rows = self._conn.execute("SELECT DISTINCT scope FROM cache")
+            self._scopes.update(row[0] for row in rows if row[0] is not None)
+
+    def _setup(self):
+        assert self._conn is not None
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, expires REAL, etag TEXT, data BLOB, "
+                "scope TEXT)"
+            )
+            columns = [r[1] for r in self._conn.execute("PRAGMA table_info(cache)")]
+            if "scope" not in columns:
+                # entries of older files cannot be invalidated by scope
+                self._conn.execute("DELETE FROM cache")
+                self._conn.execute("ALTER TABLE cache ADD COLUMN scope TEXT")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_scope ON cache (scope)"
+            )
+
+    def _prune(self):
+        assert self._conn is not None
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM cache WHERE etag IS NULL AND expires < ?", (time.time(),)
+            )
+            self._conn.execute(
+                "DELETE FROM cache WHERE key NOT IN "
+                "(SELECT key FROM cache ORDER BY expires DESC LIMIT ?)",
+                (self.max_size,),
+            )
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Get the entry for `key`, fresh or due for revalidation. Callers
+        record the outcome with `hit`, `miss` or `set`."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            if self._conn is None:
+                return None
+            row = self._conn.execute(
+                "SELECT expires, etag, data, scope FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            entry = CacheEntry(row[0], row[1], bytes(row[2]), row[3])
+            self._store(key, entry)
+            return entry
+
+    def set(
+        self,
+        key: str,
+        data: bytes,
+        etag: Optional[str] = None,
+        scope: Optional[str] = None,
+    ):
+        """Store a response body. Responses without an ETag are only kept
+        while they are fresh."""
+        entry = CacheEntry(time.time() + self.ttl, etag, data, scope)
+        with self._lock:
+            self._store(key, entry)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO cache "
+                        "(key, expires, etag, data, scope) VALUES (?, ?, ?, ?, ?)",
+                        (key, entry.expires, etag, data, scope),
+                    )
+
+    def refresh(self, key: str, entry: CacheEntry):
+        """The server confirmed (HTTP 304) that `entry` is still current."""
+        with self._lock:
+            self.revalidated += 1
+        self.set(key, entry.data, etag=entry.etag, scope=entry.scope)
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def invalidate(self, scope: str):
+        """Drop all entries of `scope`."""
+        with self._lock:
+            if scope not in self._scopes:
+                return
+            self._scopes.discard(scope)
+            for key in [k for k, e in self._entries.items() if e.scope == scope]:
+                del self._entries[key]
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM cache WHERE scope = ?", (scope,))
+
+    def _store(self, key: str, entry: CacheEntry):
+        if entry.scope is not None:
+            self._scopes.add(entry.scope)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+        }
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -1,16 +1,23 @@
-import json
 import click
 import logging
+import os
 import sys
 from importlib.metadata import version
+from pathlib import Path
 
-from openaleph_client import settings
+from openaleph_client import codec, settings
 from openaleph_client.api import AlephAPI
+from openaleph_client.cache import ResponseCache
 from openaleph_client.errors import AlephException
-from openaleph_client.crawldir import crawl_dir
+from openaleph_client.crawldir import DUPLICATES, crawl_dir
+from openaleph_client.export import export_shards
+from openaleph_client.metrics import MetricsCollector
+from openaleph_client.ratelimit import RateLimiter
 from openaleph_client.fetchdir import fetch_collection, fetch_entity
 
 log = logging.getLogger(__name__)
+# Number of streamed entities between two checkpoints of stream-entities
+CHECKPOINT_INTERVAL = 10_000
 
 
 def _get_id_from_foreign_key(api, foreign_id):
@@ -20,10 +27,17 @@ def _get_id_from_foreign_key(api, foreign_id):
     return collection.get("id")
 
 
+def _write_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp_path, path)
+
+
 def _write_result(stream, result):
     for data in result:
-        stream.write(json.dumps(data))
-        stream.write("\n")
+        stream.write(codec.dumps(data))
+        stream.write(b"\n")
 
 
 @click.group()
@@ -43,9 +57,87 @@ def _write_result(stream, result):
     default=settings.MAX_TRIES,
     help="retries upon server failure",
 )
+@click.option(
+    "--cache",
+    is_flag=True,
+    default=settings.CACHE,
+    help="cache GET responses (collections, entities, search pages)",
+)
+@click.option(
+    "--cache-file",
+    default=settings.CACHE_FILE,
+    type=click.Path(dir_okay=False),
+    help="share cached responses between invocations in this file",
+)
+@click.option(
+    "--rate-limit",
+    type=click.FloatRange(0),
+    default=settings.RATE_LIMIT,
+    metavar="RPS",
+    help="maximum requests per second (0: unlimited)",
+)
+@click.option(
+    "--byte-rate-limit",
+    type=click.FloatRange(0),
+    default=settings.BYTE_RATE_LIMIT,
+    metavar="BPS",
+    help="maximum upload bytes per second (0: unlimited)",
+)
+@click.option(
+    "--rate-limit-file",
+    default=settings.RATE_LIMIT_FILE,
+    type=click.Path(dir_okay=False),
+    help="share the rate limits with other processes using this file",
+)
+@click.option(
+    "--timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    default=settings.READ_TIMEOUT,
+    metavar="SECONDS",
+    help="time to wait for the server to respond to regular API calls",
+)
+@click.option(
+    "--hedge/--no-hedge",
+    default=settings.HEDGE,
+    help="send a duplicate of GET requests slower than the usual p95 latency",
+)
+@click.option(
+    "--metrics",
+    is_flag=True,
+    default=False,
+    help="log a summary of HTTP request metrics at exit",
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(dir_okay=False, writable=True),
+    help="keep request metrics in this file (JSON if it ends with .json, "
+    "otherwise Prometheus text format)",
+)
+@click.option(
+    "--metrics-interval",
+    type=click.FloatRange(min=1),
+    default=15.0,
+    metavar="SECONDS",
+    help="how often to update the metrics file",
+)
 @click.version_option(version("openaleph-client"))
 @click.pass_context
-def cli(ctx, host, api_key, retries):
+def cli(
+    ctx,
+    host,
+    api_key,
+    retries,
+    cache=False,
+    cache_file=None,
+    rate_limit=0,
+    byte_rate_limit=0,
+    rate_limit_file=None,
+    timeout=settings.READ_TIMEOUT,
+    hedge=False,
+    metrics=False,
+    metrics_file=None,
+    metrics_interval=15.0,
+):
     """API client for OpenAleph API"""
     logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)-8s |  %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
     logging.getLogger("requests").setLevel(logging.WARNING)
@@ -55,7 +147,52 @@ def cli(ctx, host, api_key, retries):
         raise click.BadParameter("Missing OpenAleph host URL")
     if ctx.obj is None:
         ctx.obj = {}
-    ctx.obj["api"] = AlephAPI(host, api_key, retries=retries)
+    response_cache = None
+    if cache or cache_file:
+        response_cache = ResponseCache(path=cache_file)
+
+        def _cache_stats():
+            stats = response_cache.stats()
+            log.info(
+                "Response cache: %(hits)d hits, %(misses)d misses, "
+                "%(revalidated)d revalidated" % stats
+            )
+            response_cache.close()
+
+        ctx.call_on_close(_cache_stats)
+    limiter = None
+    if rate_limit or byte_rate_limit:
+        limiter = RateLimiter(rate_limit, byte_rate_limit, path=rate_limit_file)
+    ctx.obj["api"] = AlephAPI(
+        host,
+        api_key,
+        retries=retries,
+        cache=response_cache,
+        rate_limiter=limiter,
+        timeouts={"read": timeout, "write": timeout},
+        hedge=hedge,
+    )
+    if metrics or metrics_file:
+        collector = MetricsCollector()
+        ctx.obj["api"].add_hook(collector)
+        if metrics_file:
+            collector.start_writer(metrics_file, interval=metrics_interval)
+
+        def _metrics():
+            collector.stop_writer()
+            if metrics_file:
+                collector.write(metrics_file)
+            if metrics:
+                log.info(collector.summary())
+
+        ctx.call_on_close(_metrics)
+    if hedge:
+
+        def _hedge_stats():
+            stats = ctx.obj["api"].hedger.stats()
+            log.info("Hedged requests: %(hedged)d, won by the duplicate: %(wins)d" % stats)
+
+        ctx.call_on_close(_hedge_stats)
 
 
 @cli.command()
@@ -81,6 +218,40 @@ def cli(ctx, host, api_key, retries):
     type=click.IntRange(1),
     help="maximum number of parallel uploads",
 )
+@click.option(
+    "--scan-parallel",
+    default=4,
+    show_default=True,
+    type=click.IntRange(1),
+    help="number of threads listing directories and creating folders",
+)
+@click.option(
+    "--queue-size",
+    default=settings.CRAWL_QUEUE_SIZE,
+    show_default=True,
+    type=click.IntRange(0),
+    help="files listed ahead of the uploads; scanning pauses when reached",
+)
+@click.option(
+    "--large-file-threshold",
+    default=settings.CRAWL_LARGE_FILE_THRESHOLD,
+    show_default=True,
+    type=click.IntRange(0),
+    metavar="BYTES",
+    help="upload files of at least this size with separate threads (0: off)",
+)
+@click.option(
+    "--large-parallel",
+    default=settings.CRAWL_LARGE_PARALLEL,
+    show_default=True,
+    type=click.IntRange(1),
+    help="number of threads uploading large files",
+)
+@click.option(
+    "--largest-first",
+    is_flag=True,
+    help="upload the largest of the queued large files first",
+)
 @click.option(
     "-f",
     "--foreign-id",
@@ -96,6 +267,35 @@ def cli(ctx, host, api_key, retries):
     type=click.Path(),
     help="Path to state file (for resuming from custom locations)"
 )
+@click.option(
+    "--retry-failed",
+    is_flag=True,
+    help="upload only the files which failed in earlier runs, without a rescan",
+)
+@click.option(
+    "--sync",
+    is_flag=True,
+    help="upload only files which are new or changed since the last crawl",
+)
+@click.option(
+    "--delete",
+    is_flag=True,
+    help="with --sync, delete documents of files removed since the last crawl",
+)
+@click.option(
+    "--dedupe",
+    is_flag=True,
+    help="upload files with the same content only once",
+)
+@click.option(
+    "--duplicates",
+    type=click.Choice(DUPLICATES),
+    default="skip",
+    show_default=True,
+    help="with --dedupe, only record duplicates in the state (skip), create "
+    "a document referring to the content of the first copy (entry) or upload "
+    "them in full (upload)",
+)
 @click.argument("path", type=click.Path(exists=True))
 @click.pass_context
 def crawldir(
@@ -108,9 +308,23 @@ def crawldir(
     parallel=1,
     resume=False,
     state_file=None,
+    scan_parallel=4,
+    sync=False,
+    delete=False,
+    dedupe=False,
+    duplicates="skip",
+    queue_size=settings.CRAWL_QUEUE_SIZE,
+    large_file_threshold=settings.CRAWL_LARGE_FILE_THRESHOLD,
+    large_parallel=settings.CRAWL_LARGE_PARALLEL,
+    largest_first=False,
+    retry_failed=False,
 ):
     """Crawl a directory recursively and upload the documents in it to a
     collection."""
+    if delete and not sync:
+        raise click.UsageError("--delete requires --sync")
+    if retry_failed and sync:
+        raise click.UsageError("--retry-failed cannot be combined with --sync")
     try:
         config = {"languages": language, "casefile": casefile}
         api = ctx.obj["api"]
@@ -123,6 +337,16 @@ def crawldir(
             parallel=parallel,
             resume=resume,
             state_file=state_file,
+            scan_parallel=scan_parallel,
+            sync=sync,
+            delete=delete,
+            dedupe=dedupe,
+            duplicates=duplicates,
+            queue_size=queue_size,
+            large_file_threshold=large_file_threshold,
+            large_parallel=large_parallel,
+            largest_first=largest_first,
+            retry_failed=retry_failed,
         )
     except AlephException as exc:
         raise click.ClickException(str(exc))
@@ -143,16 +367,31 @@ def crawldir(
     default=False,
     help="overwrite existing files",
 )
+@click.option(
+    "--deadline",
+    type=click.FloatRange(min=1),
+    default=settings.FETCH_DEADLINE,
+    metavar="SECONDS",
+    help="abort downloading a single file after this time",
+)
 @click.pass_context
-def fetchdir(ctx, foreign_id, prefix=None, entity_id=None, overwrite=False):
+def fetchdir(
+    ctx,
+    foreign_id,
+    prefix=None,
+    entity_id=None,
+    overwrite=False,
+    deadline=settings.FETCH_DEADLINE,
+):
     """Recursively download the contents of an OpenAleph entity or collection and rebuild
     them as a folder tree."""
     try:
         api = ctx.obj["api"]
+        kw = {"overwrite": overwrite, "deadline": deadline}
         if entity_id is not None:
-            fetch_entity(api, prefix, entity_id, overwrite=overwrite)
+            fetch_entity(api, prefix, entity_id, **kw)
         elif foreign_id is not None:
-            fetch_collection(api, prefix, foreign_id, overwrite=overwrite)
+            fetch_collection(api, prefix, foreign_id, **kw)
         else:
             msg = "Please specify either a foreign_id or entity_id"
             raise click.ClickException(msg)
@@ -224,7 +463,7 @@ def flush_collection(ctx, foreign_id, sync=False):
 
 
 @cli.command("write-entity")
-@click.option("-i", "--infile", type=click.File("r"), default="-")
+@click.option("-i", "--infile", type=click.File("rb"), default="-")
 @click.option("-f", "--foreign-id", required=True, help="foreign_id of the collection")
 @click.pass_context
 def write_entity(ctx, infile, foreign_id):
@@ -236,7 +475,7 @@ def write_entity(ctx, infile, foreign_id):
 
         def read_json_stream(stream):
             line = stream.readline()
-            return json.loads(line)
+            return codec.loads(line)
 
         api.write_entity(
             collection.get("id"),
@@ -262,7 +501,7 @@ def delete_entity(ctx, entity_id):
 
 
 @cli.command("write-entities")
-@click.option("-i", "--infile", type=click.File("r"), default="-")
+@click.option("-i", "--infile", type=click.File("rb"), default="-")
 @click.option("-f", "--foreign-id", required=True, help="foreign_id of the collection")
 @click.option(
     "-e", "--entityset", "entityset_id", help="add entities to the given entity set"
@@ -272,7 +511,29 @@ def delete_entity(ctx, entity_id):
     "--chunksize",
     default=1000,
     type=click.INT,
-    help="chunk size when sending to API",
+    help="maximum number of entities per request when sending to API",
+)
+@click.option(
+    "--chunk-bytes",
+    default=settings.BULK_CHUNK_BYTES,
+    show_default=True,
+    type=click.IntRange(1),
+    help="maximum serialized size of a request when sending to API",
+)
+@click.option(
+    "-p",
+    "--parallel",
+    default=1,
+    show_default=True,
+    type=click.IntRange(1),
+    help="number of bulk requests sent concurrently",
+)
+@click.option(
+    "--gzip",
+    "compress",
+    is_flag=True,
+    default=False,
+    help="gzip-compress request bodies (the server must accept them)",
 )
 @click.option(
     "--force", is_flag=True, default=False, help="continue after server errors"
@@ -290,6 +551,9 @@ def write_entities(
     foreign_id,
     entityset_id=None,
     chunksize=1000,
+    chunk_bytes=settings.BULK_CHUNK_BYTES,
+    parallel=1,
+    compress=False,
     force=False,
     unsafe=False,
     cleaned=False
@@ -311,12 +575,15 @@ def write_entities(
                         print(f"\r\x1b[K[{foreign_id}] Bulk load entities: {count:_}...", end='')
                     else:
                         log.info(f"[{foreign_id}] Bulk load entities: {count:_}...")
-                yield json.loads(line)
+                yield codec.loads(line)
 
         api.write_entities(
             collection.get("id"),
             read_json_stream(infile),
             chunk_size=chunksize,
+            chunk_bytes=chunk_bytes,
+            concurrency=parallel,
+            compress=compress,
             unsafe=unsafe,
             force=force,
             cleaned=cleaned,
@@ -332,7 +599,9 @@ def write_entities(
 
 
 @cli.command("stream-entities")
-@click.option("-o", "--outfile", type=click.File("w"), default="-")  # noqa
+@click.option(
+    "-o", "--outfile", type=click.Path(dir_okay=False, allow_dash=True), default="-"
+)
 @click.option("-s", "--schema", multiple=True, default=[])  # noqa
 @click.option("-f", "--foreign-id", help="foreign_id of the collection")
 @click.option(
@@ -342,27 +611,180 @@ def write_entities(
     default=False,
     help="Add publisher info from collection context",
 )
+@click.option(
+    "--raw",
+    is_flag=True,
+    default=False,
+    help="Write the server's output as-is, without adding alephUrl",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="Continue an interrupted export into --outfile",
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False),
+    help="Checkpoint file for --resume (default: OUTFILE.checkpoint)",
+)
+@click.option(
+    "--shards",
+    default=1,
+    show_default=True,
+    type=click.IntRange(1),
+    help="Stream groups of schemata over this many parallel connections",
+)
+@click.option(
+    "--outdir",
+    type=click.Path(file_okay=False),
+    help="Write one file per shard into this directory",
+)
 @click.pass_context
-def stream_entities(ctx, outfile, schema, foreign_id, publisher):
+def stream_entities(
+    ctx,
+    outfile,
+    schema,
+    foreign_id,
+    publisher,
+    raw,
+    resume,
+    checkpoint,
+    shards=1,
+    outdir=None,
+):
     """Load entities from the server and print them to stdout."""
     api = ctx.obj["api"]
+    if raw and publisher:
+        raise click.BadParameter("--publisher cannot be used with --raw")
+    if shards > 1 or outdir is not None:
+        if resume or checkpoint:
+            msg = "--resume and --checkpoint cannot be used with --shards/--outdir"
+            raise click.BadParameter(msg)
+        if outdir is not None and outfile != "-":
+            raise click.BadParameter("--outdir cannot be used with --outfile")
+        _stream_shards(
+            api, outfile, schema, foreign_id, publisher, raw, shards, outdir
+        )
+        return
+    if outfile == "-" and (resume or checkpoint):
+        raise click.BadParameter("--resume and --checkpoint require --outfile")
+    if outfile != "-":
+        checkpoint = checkpoint or outfile + ".checkpoint"
+    options = {
+        "foreign_id": foreign_id,
+        "schema": list(schema),
+        "publisher": publisher,
+        "raw": raw,
+    }
+    position, last_id, offset = 0, None, 0
+    if resume:
+        if not os.path.exists(checkpoint):
+            raise click.BadParameter("No checkpoint found at %s" % checkpoint)
+        with open(checkpoint, "rb") as fh:
+            saved = codec.loads(fh.read())
+        if any(saved.get(k) != v for k, v in options.items()):
+            msg = "Checkpoint %s was written with different options" % checkpoint
+            raise click.BadParameter(msg)
+        position, last_id, offset = saved["position"], saved["last_id"], saved["offset"]
+        log.info("Resuming export after %d entities", position)
+
+    def save_checkpoint(position, last_id, offset):
+        stream.flush()
+        data = dict(options, position=position, last_id=last_id, offset=offset)
+        _write_atomic(checkpoint, codec.dumps(data))
+
+    if outfile == "-":
+        stream = click.get_binary_stream("stdout")
+    elif resume:
+        stream = open(outfile, "r+b")
+        if os.fstat(stream.fileno()).st_size < offset:
+            stream.close()
+            msg = "%s is shorter than recorded in %s" % (outfile, checkpoint)
+            raise click.BadParameter(msg)
+        # Drop whatever was written after the last checkpoint
+        stream.truncate(offset)
+        stream.seek(offset)
+    else:
+        stream = open(outfile, "wb")
     try:
         include = ["id", "schema", "properties"]
         collection = api.get_collection_by_foreign_id(foreign_id)
         if collection is None:
             raise click.BadParameter("Collection %r not found!" % foreign_id)
         res = api.stream_entities(
-            collection=collection, include=include, schema=schema, publisher=publisher
+            collection=collection,
+            include=include,
+            schema=schema,
+            publisher=publisher,
+            raw=raw,
+            position=position,
+            last_id=last_id,
         )
-        _write_result(outfile, res)
+        # Stream position and output offset after the last complete write
+        written = (position, last_id, offset)
+        try:
+            for item in res:
+                data = item if raw else codec.dumps(item) + b"\n"
+                stream.write(data)
+                offset += len(data)
+                written = (res.position, res.last_id, offset)
+                if checkpoint and res.position - position >= CHECKPOINT_INTERVAL:
+                    save_checkpoint(*written)
+                    position = res.position
+        except BaseException:
+            if checkpoint:
+                try:
+                    save_checkpoint(*written)
+                    log.info("Export interrupted, continue it with --resume")
+                except OSError as exc:
+                    log.warning("Cannot save checkpoint %s: %s", checkpoint, exc)
+            raise
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+    except AlephException as exc:
+        raise click.ClickException(str(exc))
+    except BrokenPipeError:
+        raise click.Abort()
+    finally:
+        if outfile != "-":
+            stream.close()
+
+
+def _stream_shards(api, outfile, schema, foreign_id, publisher, raw, shards, outdir):
+    if outdir is None:
+        if outfile == "-":
+            stream = click.get_binary_stream("stdout")
+        else:
+            stream = open(outfile, "wb")
+    try:
+        include = ["id", "schema", "properties"]
+        collection = api.get_collection_by_foreign_id(foreign_id)
+        if collection is None:
+            raise click.BadParameter("Collection %r not found!" % foreign_id)
+        total = export_shards(
+            api,
+            collection,
+            shards,
+            outfile=stream if outdir is None else None,
+            outdir=Path(outdir) if outdir is not None else None,
+            schema=list(schema),
+            include=include,
+            publisher=publisher,
+            raw=raw,
+        )
+        log.info("Exported %d entities in %d shards", total, shards)
     except AlephException as exc:
         raise click.ClickException(str(exc))
     except BrokenPipeError:
         raise click.Abort()
+    finally:
+        if outdir is None and outfile != "-":
+            stream.close()
 
 
 @cli.command("entitysets")
-@click.option("-o", "--outfile", type=click.File("w"), default="-")
+@click.option("-o", "--outfile", type=click.File("wb"), default="-")
 @click.option("-f", "--foreign-id", default=None, help="foreign_id of the collection")
 @click.option("-t", "--type", "type_", default=None, help="entity set type")
 @click.pass_context
@@ -382,7 +804,7 @@ def entitysets(ctx, outfile, foreign_id, type_):
 
 
 @cli.command("entitysetitems")
-@click.option("-o", "--outfile", type=click.File("w"), default="-")
+@click.option("-o", "--outfile", type=click.File("wb"), default="-")
 @click.argument("entityset_id")
 @click.pass_context
 def entitysetitems(ctx, outfile, entityset_id):
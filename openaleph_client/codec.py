@@ -0,0 +1,52 @@
+import json
+import logging
+from typing import Any, Callable, Union
+
+from openaleph_client import settings
+
+log = logging.getLogger(__name__)
+
+
+def _stdlib():
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+    return "json", dumps, json.loads
+
+
+def _orjson():
+    import orjson
+
+    return "orjson", orjson.dumps, orjson.loads
+
+
+def _ujson():
+    import ujson  # type: ignore
+
+    def dumps(obj: Any) -> bytes:
+        return ujson.dumps(
+            obj, ensure_ascii=False, escape_forward_slashes=False
+        ).encode("utf-8")
+
+    return "ujson", dumps, ujson.loads
+
+
+CODECS = {"orjson": _orjson, "ujson": _ujson, "json": _stdlib}
+
+
+def _load(preferred: str):
+    names = [preferred] if preferred else ["orjson", "ujson", "json"]
+    for name in names:
+        try:
+            return CODECS[name]()
+        except (ImportError, KeyError):
+            if preferred:
+                log.warning("JSON library %r is not available", preferred)
+    return _stdlib()
+
+
+# Serialize to UTF-8 encoded JSON bytes / parse JSON from bytes or a string.
+NAME: str
+dumps: Callable[[Any], bytes]
+loads: Callable[[Union[bytes, bytearray, str]], Any]
+NAME, dumps, loads = _load(settings.JSON_CODEC)
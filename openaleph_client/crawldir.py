@@ -1,21 +1,56 @@
 import logging
 import threading
-from fnmatch import fnmatch
-import sqlite3
 import signal
 import sys
 import os
 import tempfile
 import hashlib
-from queue import Queue
+from concurrent.futures import Future, ThreadPoolExecutor
+from heapq import heappop, heappush
+from itertools import count
+from queue import PriorityQueue, Queue
 from pathlib import Path
-from typing import cast, Optional, Dict, List
+from typing import cast, Optional, Dict, List, Set
 
+from openaleph_client import settings
 from openaleph_client.api import AlephAPI
+from openaleph_client.crawlstate import CrawlState, Signature, file_signature
 from openaleph_client.errors import AlephException
-from openaleph_client.util import backoff
+from openaleph_client.ignore import IGNORE_FILE, IgnoreRules
 
 log = logging.getLogger(__name__)
+# Size of the blocks in which files are hashed
+HASH_CHUNK = 1024 * 1024
+# What to do with duplicate files when deduplicating: only record them in
+# the state, create a document entity in their folder which refers to the
+# stored content of the first copy, or upload them in full
+DUPLICATES = ("skip", "entry", "upload")
+# Statuses with which the server reports an entity it does not know (any more)
+MISSING_STATUS = (404, 410)
+# Files of the crawler itself, ignored in every directory
+DEFAULT_IGNORE = [".openaleph_crawl_state.db*", IGNORE_FILE, ".openaleph-failed.txt"]
+
+
+def _resolved(value: Optional[str]) -> Future:
+    future: Future = Future()
+    future.set_result(value)
+    return future
+
+
+class LargestFirstQueue(PriorityQueue):
+    """A queue of (path, folder, size) items which returns the largest
+    queued file first, and files of the same size in the order they were
+    put."""
+
+    def _init(self, maxsize):
+        super(LargestFirstQueue, self)._init(maxsize)
+        self._order = count()
+
+    def _put(self, item):
+        heappush(self.queue, (-(item[2] or 0), next(self._order), item))
+
+    def _get(self):
+        return heappop(self.queue)[2]
 
 
 def get_state_file_path(target_dir: Path) -> Path:
@@ -59,81 +94,353 @@ class CrawlDirectory(object):
         collection: Dict,
         path: Path,
         index: bool = True,
+        scan_parallel: int = 4,
+        sync: bool = False,
+        dedupe: bool = False,
+        duplicates: str = "skip",
+        queue_size: int = settings.CRAWL_QUEUE_SIZE,
+        large_file_threshold: int = settings.CRAWL_LARGE_FILE_THRESHOLD,
+        largest_first: bool = False,
+        state: Optional[CrawlState] = None,
     ):
         self.api = api
         self.index = index
+        self.sync = sync
+        self.dedupe = dedupe
+        self.duplicates = duplicates
+        # content hash -> future ID of its canonical upload, while uploading
+        self.uploading: Dict[str, Future] = {}
+        self.duplicate_count = 0
+        self.saved_bytes = 0
+        self._dedupe_lock = threading.Lock()
+        self.scan_errors = 0
         self.collection = collection
         self.collection_id = cast(str, collection.get("id"))
         self.root = path
-        self._db_conn: sqlite3.Connection = None
-        self._db_lock = threading.Lock()
-        self.queue: Queue = Queue()
+        # without a state file, nothing is remembered beyond this run
+        self.state = state if state is not None else CrawlState(Path(":memory:"))
+        # Files to upload, as (path, folder future) with the path as a plain
+        # string and one future shared by all files of a folder. Bounded, so
+        # that the scanners cannot run ahead of the uploads.
+        self.queue: Queue = Queue(maxsize=max(0, queue_size))
+        # Files of at least `large_file_threshold` bytes go into their own
+        # lane, as (path, folder future, size), so that they do not hold up
+        # small files; this lane can return the largest files first.
+        self.large_file_threshold = large_file_threshold
+        if largest_first:
+            self.large_queue: Queue = LargestFirstQueue(maxsize=max(0, queue_size))
+        else:
+            self.large_queue = Queue(maxsize=max(0, queue_size))
         self.scan_queue: Queue = Queue()
-        self.ignore_patterns: List[str] = []
+        self.ignore_patterns = []
+        self.scan_parallel = scan_parallel
+        # Folders are created on the server by their own pool, so that
+        # listing directories never waits for an HTTP round trip.
+        self.folders = ThreadPoolExecutor(
+            max_workers=scan_parallel, thread_name_prefix="openaleph-folder"
+        )
+        # folder IDs taken from the state of an earlier run, and the IDs of
+        # those found missing on the server -> the IDs of their replacements
+        self.reused: Set[str] = set()
+        self.replaced: Dict[str, Optional[str]] = {}
+        self._replace_lock = threading.RLock()
+
+    @property
+    def ignore_patterns(self) -> List[str]:
+        return self._ignore_patterns
+
+    @ignore_patterns.setter
+    def ignore_patterns(self, patterns: List[str]):
+        """Ignore rules for the whole tree, in addition to the
+        `.openalephignore` files found in it."""
+        self._ignore_patterns = [str(p) for p in patterns]
+        self.rules = IgnoreRules(self._ignore_patterns)
 
     def is_ignored(self, path: Path) -> bool:
-        rel = str(path.relative_to(self.root))
-        for pat in self.ignore_patterns:
-            p = pat if isinstance(pat, str) else str(pat)
-            if p.endswith("/") and path.is_dir():
-                prefix = p.rstrip("/")
-                if rel == prefix or rel.startswith(prefix + "/"):
-                    return True
-            elif fnmatch(rel, p):
-                return True
-        return False
+        """Whether `path` is excluded by `ignore_patterns`, or is inside an
+        excluded directory. The scanner uses the rules directly instead."""
+        rel = Path(path).relative_to(self.root).as_posix()
+        return self.rules.is_ignored_path(rel, path.is_dir())
 
     def crawl(self):
-        while not self.scan_queue.empty():
-            path, parent_id = self.scan_queue.get()
-            id = None
-            foreign_id = self.get_foreign_id(Path(path))
-            if foreign_id is not None:
-                id = self.backoff_ingest_upload(path, parent_id, foreign_id)
-            self.scandir(path, id, parent_id)
-            self.scan_queue.task_done()
-
-    def consume(self):
-        """Worker thread: upload files, skipping those already processed."""
+        """Scanner thread: list the directories in `scan_queue`. Several
+        scanners run in parallel; the queue items are the path of a directory
+        and a future of the server-side ID of its parent folder, and the
+        ignore rules which apply to it."""
         while True:
-            path, parent_id = self.queue.get()
+            path, parent, rules = self.scan_queue.get()
             # Poison‐pill sentinel
             if path is None:
-                self.queue.task_done()
+                self.scan_queue.task_done()
                 break
-
-            rel = str(Path(path).relative_to(self.root))
-            with self._db_lock:
-                cur = self._db_conn.execute("SELECT 1 FROM processed WHERE path = ?", (rel,))
-                if cur.fetchone():
-                    self.queue.task_done()
-                    log.info("Skipping [%s->%s]: %s", self.collection_id, parent_id, rel)
-                    continue  # if in db skip
-
-            log.info("Upload [%s->%s]: %s", self.collection_id, parent_id, rel)
-            result = self.backoff_ingest_upload(path, parent_id, self.get_foreign_id(Path(path)))
-            with self._db_lock:
-                if result:
-                    self._db_conn.execute("INSERT OR IGNORE INTO processed(path) VALUES(?)", (rel,))
+            try:
+                folder = parent
+                foreign_id = self.get_foreign_id(Path(path))
+                if foreign_id is not None:
+                    folder = self.folders.submit(
+                        self.create_folder, path, parent, foreign_id
+                    )
+                self.scandir(path, folder, rules)
+            except OSError:
+                log.exception("Cannot list directory: %s", path)
+                self.scan_errors += 1
+            finally:
+                self.scan_queue.task_done()
+
+    def create_folder(self, path: Path, parent: Future, foreign_id: str) -> Optional[str]:
+        """Create the folder for `path` once its parent folder exists. Parents
+        are always submitted before their children, so the parent is either
+        created already or in the process of being created.
+
+        Folders created by an earlier run of a resumed crawl are not created
+        again: their stored ID is used as is."""
+        folder_id = self.state.folder_id(foreign_id)
+        if folder_id is not None:
+            self.reused.add(folder_id)
+            return folder_id
+        parent_id = parent.result()
+        folder_id = self.try_ingest_upload(path, parent_id, foreign_id)
+        if folder_id is not None:
+            self.state.set_folder_id(foreign_id, folder_id)
+        return folder_id
+
+    def replace_folder(self, stale_id: str, path: Path) -> Optional[str]:
+        """Create the folder for `path` again, after the server reported that
+        the folder `stale_id` stored by an earlier run does not exist. Each
+        folder is replaced once, by the first upload that finds it missing."""
+        with self._replace_lock:
+            if stale_id in self.replaced:
+                return self.replaced[stale_id]
+            log.warning("Folder missing on the server, creating it again: %s", path)
+            foreign_id = cast(str, self.get_foreign_id(path))
+            parent_id = None
+            if path.parent != self.root:
+                parent_foreign_id = cast(str, self.get_foreign_id(path.parent))
+                parent_id = self.state.folder_id(parent_foreign_id)
+            folder_id = self.try_ingest_upload(path, parent_id, foreign_id)
+            if folder_id is not None:
+                self.state.set_folder_id(foreign_id, folder_id)
+            self.replaced[stale_id] = folder_id
+            return folder_id
+
+    def consume(self, queue: Optional[Queue] = None):
+        """Worker thread: upload files from `queue` (the small files by
+        default), skipping those already processed or, when syncing, those
+        unchanged since they were uploaded."""
+        queue = self.queue if queue is None else queue
+        while True:
+            item = queue.get()
+            path, folder = item[0], item[1]
+            # Poison‐pill sentinel
+            if path is None:
+                queue.task_done()
+                break
+            try:
+                self.consume_file(path, folder)
+            except Exception:
+                # a dead worker would leave the queue undrained forever
+                log.exception("Failed [%s]: %s", self.collection_id, path)
+                self.state.mark_failed(str(Path(path).relative_to(self.root)))
+            finally:
+                queue.task_done()
+
+    def consume_file(self, path: str, folder: Future):
+        """Upload one file from the queue, unless it can be skipped."""
+        file_path = Path(path)
+        rel = str(file_path.relative_to(self.root))
+        signature = file_signature(file_path)
+        if self.sync:
+            skip = self.state.is_unchanged(rel, signature)
+        else:
+            skip = self.state.is_processed(rel)
+        if skip:
+            log.info("Skipping [%s]: %s", self.collection_id, rel)
+            return
+
+        # wait for the parent folder to be created on the server
+        parent_id = folder.result()
+
+        # only the crawl root has no foreign ID, and it is a directory
+        foreign_id = cast(str, self.get_foreign_id(file_path))
+        if self.dedupe:
+            self.upload_unique(file_path, rel, parent_id, foreign_id, signature)
+        else:
+            self.upload(file_path, rel, parent_id, foreign_id, signature)
+
+    def upload(
+        self,
+        path: Path,
+        rel: str,
+        parent_id: Optional[str],
+        foreign_id: str,
+        signature: Optional[Signature],
+        content_hash: Optional[str] = None,
+    ) -> Optional[str]:
+        log.info("Upload [%s->%s]: %s", self.collection_id, parent_id, rel)
+        result = self.try_ingest_upload(path, parent_id, foreign_id)
+        if result:
+            self.state.mark_processed(rel, signature, result, content_hash)
+        else:
+            self.state.mark_failed(rel)
+        return result
+
+    def upload_unique(
+        self,
+        path: Path,
+        rel: str,
+        parent_id: Optional[str],
+        foreign_id: str,
+        signature: Optional[Signature],
+    ):
+        """Upload a file unless a file with the same content was uploaded
+        before, by this or an earlier run. Copies are recorded in the state
+        as duplicates of the first upload and, depending on `duplicates`, get
+        a document of their own in their folder: an entity which refers to
+        the content of the first upload ("entry"), or a full upload
+        ("upload")."""
+        content_hash = self.content_hash(path, signature)
+        if content_hash is None:
+            self.upload(path, rel, parent_id, foreign_id, signature)
+            return
+        owner = False
+        with self._dedupe_lock:
+            canonical = self.uploading.get(content_hash)
+            if canonical is None:
+                document_id = self.state.content_id(content_hash)
+                if document_id is not None:
+                    canonical = _resolved(document_id)
                 else:
-                    self._db_conn.execute("INSERT OR IGNORE INTO failed(path) VALUES(?)", (rel,))
-                self._db_conn.commit()
-            self.queue.task_done()
+                    canonical = self.uploading[content_hash] = Future()
+                    owner = True
+        if owner:
+            result = None
+            try:
+                result = self.upload(
+                    path, rel, parent_id, foreign_id, signature, content_hash
+                )
+                if result:
+                    self.state.set_content_id(content_hash, result)
+            finally:
+                canonical.set_result(result)
+                with self._dedupe_lock:
+                    del self.uploading[content_hash]
+            return
+
+        canonical_id = canonical.result()
+        if canonical_id is None:
+            # the first copy failed to upload: try this one
+            self.upload_unique(path, rel, parent_id, foreign_id, signature)
+            return
+        document_id = None
+        if self.duplicates == "upload":
+            log.info("Upload [%s->%s]: %s", self.collection_id, parent_id, rel)
+            document_id = self.try_ingest_upload(path, parent_id, foreign_id)
+        elif self.duplicates == "entry":
+            document_id = self.try_ingest_upload(
+                path, parent_id, foreign_id, content_hash=content_hash
+            )
+        if self.duplicates != "skip" and document_id is None:
+            self.state.mark_failed(rel)
+            return
+        log.info("Duplicate [%s->%s]: %s", self.collection_id, canonical_id, rel)
+        self.state.mark_processed(
+            rel, signature, document_id, content_hash, canonical_id
+        )
+        with self._dedupe_lock:
+            self.duplicate_count += 1
+            if self.duplicates != "upload":
+                self.saved_bytes += signature[0] if signature else 0
+
+    def content_hash(self, path: Path, signature: Optional[Signature]) -> Optional[str]:
+        """The SHA1 hash of a file, from the state if the file was hashed
+        before and is unchanged (hardlinks share it)."""
+        if signature is not None:
+            cached = self.state.cached_hash(signature)
+            if cached is not None:
+                return cached
+        digest = hashlib.sha1()
+        try:
+            with open(path, "rb") as fh:
+                for chunk in iter(lambda: fh.read(HASH_CHUNK), b""):
+                    digest.update(chunk)
+        except OSError:
+            log.exception("Cannot read file: %s", path)
+            return None
+        content_hash = digest.hexdigest()
+        if signature is not None:
+            self.state.cache_hash(signature, content_hash)
+        return content_hash
 
-    def scandir(self, path: Path, id: Optional[str], parent_id: str):
+    def scandir(self, path: Path, folder: Future, rules: Optional[IgnoreRules] = None):
         """
         Walk `path`, send directories to scan_queue
-        and files to queue, skipping .openalephignore entries
+        and files to queue, skipping .openalephignore entries.
+        `folder` is the future ID of the server-side folder for `path`.
+        Ignored directories are not sent, so they are never listed.
         """
+        rules = rules or self.rules
+        rel = Path(path).relative_to(self.root).as_posix()
+        prefix = "" if rel == "." else rel + "/"
+        ignore_file = os.path.join(path, IGNORE_FILE)
+        if os.path.isfile(ignore_file):
+            try:
+                with open(ignore_file, encoding="utf-8") as fh:
+                    rules = rules.child(prefix.rstrip("/"), fh.read().splitlines())
+            except (OSError, UnicodeDecodeError):
+                log.exception("Cannot read ignore file: %s", ignore_file)
+        # Entries are queued as they are listed, never collected: putting a
+        # file blocks while the upload queue is full.
         with os.scandir(path) as it:
             for entry in it:
-                child_path = Path(entry.path)
-                if self.is_ignored(child_path):
+                # DirEntry caches the file type from the directory listing
+                is_dir = entry.is_dir()
+                if rules.is_ignored(prefix + entry.name, is_dir):
                     continue
-                if entry.is_dir():
-                    self.scan_queue.put((child_path, id))
+                if is_dir:
+                    self.scan_queue.put((entry.path, folder, rules))
                 else:
-                    self.queue.put((child_path, id))
+                    self.put_file(entry, folder)
+
+    def put_file(self, entry: os.PathLike, folder: Future):
+        """Queue a file (a `DirEntry` or a path) in the lane for its size."""
+        path = os.fspath(entry)
+        if self.large_file_threshold <= 0:
+            self.queue.put((path, folder))
+            return
+        try:
+            if isinstance(entry, os.DirEntry):
+                size = entry.stat().st_size
+            else:
+                size = os.stat(path).st_size
+        except OSError:
+            size = 0
+        if size >= self.large_file_threshold:
+            self.large_queue.put((path, folder, size))
+        else:
+            self.queue.put((path, folder))
+
+    def queue_failed(self, paths: List[str]):
+        """Queue files which failed in earlier runs, without scanning the
+        tree. Their folders are taken from the state, and only those which
+        were never created are created now (parents first)."""
+        folders: Dict[str, Future] = {}
+
+        def folder_future(rel_dir: str) -> Future:
+            if rel_dir in ("", "."):
+                return _resolved(None)
+            if rel_dir not in folders:
+                parent = folder_future(os.path.dirname(rel_dir))
+                folders[rel_dir] = self.folders.submit(
+                    self.create_folder, self.root / rel_dir, parent, rel_dir
+                )
+            return folders[rel_dir]
+
+        for rel in paths:
+            path = self.root / rel
+            if not path.is_file():
+                log.warning("Failed file no longer exists: %s", rel)
+                continue
+            self.put_file(path, folder_future(os.path.dirname(rel)))
 
     def get_foreign_id(self, path: Path) -> Optional[str]:
         if path == self.root:
@@ -147,23 +454,56 @@ class CrawlDirectory(object):
         except ValueError:
             return None
 
-    def backoff_ingest_upload(self, path: Path, parent_id: str, foreign_id: str) -> Optional[str]:
-        try_number = 1
-        while True:
-            try:
-                return self.ingest_upload(Path(path), parent_id, foreign_id)
-            except AlephException as err:
-                if err.transient and try_number < self.api.retries:
-                    try_number += 1
-                    backoff(err, try_number)
-                else:
-                    log.error(err.message)
-                    return None
-            except Exception:
-                log.exception("Failed [%s]: %s", self.collection_id, path)
-                return None
+    def try_ingest_upload(
+        self,
+        path: Path,
+        parent_id: Optional[str],
+        foreign_id: str,
+        content_hash: Optional[str] = None,
+    ) -> Optional[str]:
+        """Upload a file or create a folder, returning None on failure. With
+        a `content_hash`, the file is a duplicate and only an entity which
+        refers to that content is created. The API client already retries transient
+        errors.
+
+        If the parent is a folder stored by an earlier run which the server
+        no longer knows, the folder is created again and the upload is
+        repeated once."""
+        try:
+            if content_hash is not None:
+                return self.ingest_duplicate(Path(path), parent_id, content_hash)
+            return self.ingest_upload(Path(path), parent_id, foreign_id)
+        except AlephException as err:
+            if parent_id in self.reused and self.folder_missing(parent_id, err):
+                parent_id = self.replace_folder(parent_id, Path(path).parent)
+                if parent_id is not None:
+                    return self.try_ingest_upload(
+                        path, parent_id, foreign_id, content_hash
+                    )
+            log.error(err.message)
+            return None
+        except Exception:
+            log.exception("Failed [%s]: %s", self.collection_id, path)
+            return None
 
-    def ingest_upload(self, path: Path, parent_id: str, foreign_id: str) -> str:
+    def folder_missing(self, folder_id: str, err: AlephException) -> bool:
+        """Whether an upload into `folder_id` failed with `err` because the
+        server does not know the folder any more. The ingest API rejects an
+        unknown parent with a 400, which can have other causes too, so the
+        folder is looked up to confirm."""
+        if err.status in MISSING_STATUS:
+            return True
+        if err.status != 400:
+            return False
+        try:
+            self.api.get_entity(folder_id)
+        except AlephException as exc:
+            return exc.status in MISSING_STATUS
+        return False
+
+    def ingest_upload(
+        self, path: Path, parent_id: Optional[str], foreign_id: str
+    ) -> str:
         metadata = {
             "foreign_id": foreign_id,
             "file_name": path.name,
@@ -180,6 +520,61 @@ class CrawlDirectory(object):
             raise AlephException("Upload failed")
         return result["id"]
 
+    def ingest_duplicate(
+        self, path: Path, parent_id: Optional[str], content_hash: str
+    ) -> str:
+        """Create the document of a duplicate file in its folder, without
+        sending its content again: the server stores files by their SHA1
+        hash, so the document refers to the content of the first upload."""
+        properties: Dict[str, List] = {
+            "fileName": [path.name],
+            "contentHash": [content_hash],
+            "fileSize": [path.stat().st_size],
+        }
+        if parent_id is not None:
+            properties["parent"] = [parent_id]
+        entity = {"schema": "Document", "properties": properties}
+        result = self.api.write_entity(self.collection_id, entity)
+        if "id" not in result:
+            raise AlephException("Upload failed")
+        return result["id"]
+
+
+def delete_removed(crawler: CrawlDirectory, parallel: int = 1):
+    """Delete the documents of files removed since the last run from the
+    server, and forget them."""
+    removed = crawler.state.removed()
+    if not len(removed):
+        return
+    if crawler.scan_errors:
+        log.warning(
+            "Not deleting %d removed files: some directories could not be listed",
+            len(removed),
+        )
+        return
+
+    def delete(item):
+        path, document_id, canonical = item
+        if document_id is None:
+            if canonical is not None:
+                # a duplicate without a document of its own
+                return path
+            log.warning("Document ID unknown, cannot delete: %s", path)
+            return None
+        try:
+            crawler.api.delete_entity(document_id)
+        except AlephException as err:
+            if err.status != 404:
+                log.error("Cannot delete [%s]: %s", path, err.message)
+                return None
+        log.info("Deleted [%s]: %s", crawler.collection_id, path)
+        return path
+
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:
+        deleted = [path for path in pool.map(delete, removed) if path is not None]
+    crawler.state.forget(deleted)
+    log.info(f"Deleted from the server: {len(deleted)} of {len(removed)} removed files")
+
 
 def crawl_dir(
     api: AlephAPI,
@@ -189,7 +584,17 @@ def crawl_dir(
     index: bool = True,
     parallel: int = 1,
     resume: bool = False,
-    state_file: Optional[str] = None
+    state_file: Optional[str] = None,
+    scan_parallel: int = 4,
+    sync: bool = False,
+    delete: bool = False,
+    dedupe: bool = False,
+    duplicates: str = "skip",
+    queue_size: int = settings.CRAWL_QUEUE_SIZE,
+    large_file_threshold: int = settings.CRAWL_LARGE_FILE_THRESHOLD,
+    large_parallel: int = settings.CRAWL_LARGE_PARALLEL,
+    largest_first: bool = False,
+    retry_failed: bool = False,
 ):
     """Crawl a directory and upload its content to a collection
 
@@ -198,14 +603,30 @@ def crawl_dir(
     path: path of the directory
     foreign_id: foreign_id of the collection to use.
     language: language hint for the documents
+    parallel: number of upload threads
+    scan_parallel: number of threads listing directories, and creating
+    folders on the server
+    sync: upload only new files and files changed since the last run, by
+    their size, modification time and inode
+    delete: when syncing, delete the documents of files removed since the
+    last run from the server
+    dedupe: upload files with the same content only once
+    duplicates: for duplicates, only record them in the state ("skip"),
+    create a document which refers to the content of the first copy
+    ("entry") or upload them in full ("upload")
+    queue_size: number of files listed ahead of the uploads (0: unlimited)
+    large_file_threshold: size in bytes from which files are uploaded by
+    their own `large_parallel` threads (0: all files share the upload
+    threads)
+    largest_first: upload the largest of the queued large files first
+    retry_failed: upload only the files which failed in earlier runs,
+    without scanning the directory
     """
     # shut down gracefully on sigint
     def _save_and_exit(signum, frame):
-        with crawler._db_lock:
-            crawler._db_conn.commit()
+        state.flush()
         log.info(f"\nState saved to {db_file}. Exiting.")
         sys.exit(1)
-    signal.signal(signal.SIGINT, _save_and_exit)
 
     root = Path(path).resolve()
     # SQLite DB to store crawl state, with fallback for read-only directories
@@ -214,70 +635,133 @@ def crawl_dir(
     else:
         db_file = get_state_file_path(root)
 
-    if not resume and db_file.exists():
-        os.remove(db_file)
-    conn = sqlite3.connect(str(db_file), check_same_thread=False)
-    conn.execute("CREATE TABLE IF NOT EXISTS processed (path TEXT PRIMARY KEY)")
-    conn.execute("CREATE TABLE IF NOT EXISTS failed (path TEXT PRIMARY KEY)")
-    conn.commit()
+    resume = resume or sync or retry_failed
+    if not resume:
+        CrawlState.remove(db_file)
+    state = CrawlState(db_file)
+    signal.signal(signal.SIGINT, _save_and_exit)
 
     # Log the state file location for user reference
     log.info(f"Using state file: {db_file}")
-    if resume:
+    if retry_failed:
+        log.info("Retrying the files which failed in earlier runs")
+        state.load_folders()
+    elif sync:
+        log.info("Syncing changes since the last crawl")
+        state.load()
+    elif resume:
         log.info("Resuming crawl from existing state")
+        state.load()
     else:
         log.info("Starting new crawl")
 
     collection = api.load_collection_by_foreign_id(foreign_id, config)
 
-    crawler = CrawlDirectory(api, collection, root, index=index)
-    crawler._db_conn = conn
-
-    # read dot ignore file
-    ignore_file = root / ".openalephignore"
-    patterns = [".openaleph_crawl_state.db", ".openalephignore", ".openaleph-failed.txt"]
-    if ignore_file.exists():
-        for line in ignore_file.read_text(encoding="utf-8").splitlines():
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
-            patterns.append(line)
-    crawler.ignore_patterns = patterns
-    crawler.scan_queue.put((root, None))
+    if large_file_threshold <= 0:
+        large_parallel = 0
+    # one connection per upload thread and per folder creation thread
+    api.transport.ensure_pool_size(parallel + large_parallel + scan_parallel)
+    crawler = CrawlDirectory(
+        api,
+        collection,
+        root,
+        index=index,
+        scan_parallel=scan_parallel,
+        sync=sync,
+        dedupe=dedupe,
+        duplicates=duplicates,
+        queue_size=queue_size,
+        large_file_threshold=large_file_threshold,
+        largest_first=largest_first,
+        state=state,
+    )
+
+    # .openalephignore files, including the one in the root, are read by
+    # the scanners
+    crawler.ignore_patterns = DEFAULT_IGNORE
     consumers = []
-
-    # Use one thread to produce using scandir and at least one to consume
-    # files for upload.
-    producer = threading.Thread(target=crawler.crawl, daemon=True)
-    producer.start()
+    scanners = []
+
+    # Scan the tree with several threads, and upload files with at least one
+    # other thread while the tree is being scanned.
+    if not retry_failed:
+        crawler.scan_queue.put((str(root), _resolved(None), None))
+        for i in range(max(1, scan_parallel)):
+            scanner = threading.Thread(target=crawler.crawl, daemon=True)
+            scanners.append(scanner)
+            scanner.start()
     for i in range(max(1, parallel)):
-        consumer = threading.Thread(target=crawler.consume, daemon=True)
+        consumer = threading.Thread(
+            target=crawler.consume, name="openaleph-upload-%d" % i, daemon=True
+        )
         consumers.append(consumer)
         consumer.start()
+    large_consumers = []
+    for i in range(large_parallel):
+        consumer = threading.Thread(
+            target=crawler.consume,
+            args=(crawler.large_queue,),
+            name="openaleph-upload-large-%d" % i,
+            daemon=True,
+        )
+        large_consumers.append(consumer)
+        consumer.start()
+
+    if retry_failed:
+        failed = state.failed_paths()
+        log.info(f"Failed in earlier runs: {len(failed)} files")
+        crawler.queue_failed(failed)
 
-    # Block until the producer is done with queueing the tree.
-    producer.join()
+    # Block until the whole tree has been listed: scanners queue the
+    # subdirectories of a directory before marking it done.
+    crawler.scan_queue.join()
+    for scanner in scanners:
+        crawler.scan_queue.put((None, None, None))
+    for scanner in scanners:
+        scanner.join()
 
-    # Block until the file upload queue is drained.
+    # Block until the file upload queues are drained.
     crawler.queue.join()
+    crawler.large_queue.join()
 
-    # Poison the queue to signal end to each consumer.
+    # Poison the queues to signal end to each consumer.
     for consumer in consumers:
         crawler.queue.put((None, None))
+    for consumer in large_consumers:
+        crawler.large_queue.put((None, None, None))
 
     # Block until all file upload queue consumers are done.
-    for consumer in consumers:
+    for consumer in consumers + large_consumers:
         consumer.join()
+    crawler.folders.shutdown(wait=True)
+
+    if sync:
+        if delete:
+            delete_removed(crawler, parallel)
+        else:
+            removed = len(crawler.state.removed())
+            if removed:
+                log.info(
+                    f"Removed locally: {removed} files (use --delete to delete "
+                    "them on the server)"
+                )
 
     # final report
-    cur = conn.execute("SELECT COUNT(*) FROM processed")
-    total_ok = cur.fetchone()[0]
-    cur = conn.execute("SELECT COUNT(*) FROM failed")
-    total_fail = cur.fetchone()[0]
+    total_ok, total_fail = state.counts()
 
     log.info(f"Crawldir complete.")
     log.info(f"Uploaded (including prev. sessions if resumed): {total_ok}")
     log.info(f"Failed: {total_fail}")
+    if dedupe:
+        log.info(
+            f"Duplicates: {crawler.duplicate_count} files, "
+            f"{crawler.saved_bytes} bytes not uploaded"
+        )
+    stats = api.transport.stats()
+    log.info(
+        "HTTP connections: %(connections)d opened for %(requests)d requests "
+        "(%(reused)d reused, pool size %(pool_size)d)" % stats
+    )
     log.info(f"State file location: {db_file}")
     log.info("To resume this crawl, use: --resume --state-file " + str(db_file))
 
@@ -285,6 +769,7 @@ def crawl_dir(
     if total_fail:
         failed_file = get_failed_file_path(root, db_file)
         with open(failed_file, "w", encoding="utf-8") as fp:
-            for row in conn.execute("SELECT path FROM failed ORDER BY path"):
-                fp.write(f"{row[0]}\n")
+            for failed_path in state.failed_paths():
+                fp.write(f"{failed_path}\n")
         log.info(f"List of failed files written to {failed_file}")
+    state.close()
@@ -0,0 +1,378 @@
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+# size, modification time (ns) and inode of a file
+Signature = Tuple[int, int, int]
+
+
+def file_signature(path: Path) -> Optional[Signature]:
+    """The signature of a file, by which a sync detects changes, or None if
+    the file cannot be read."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+class BloomFilter(object):
+    """A fixed-size Bloom filter for strings: `in` is never wrong about
+    strings that were added, and wrong about others with probability
+    `error_rate` as long as at most `capacity` strings are added."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1000, capacity)
+        self.size = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, value: str):
+        bits = self.bits
+        for pos in self._positions(value):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, value: str) -> bool:
+        bits = self.bits
+        for pos in self._positions(value):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class CrawlState(object):
+    """The persistent state of a directory crawl: which files were uploaded
+    and which failed, and the server-side IDs of the folders created.
+
+    Every uploaded file is stored with its signature and document ID, and
+    with the number of the last run which saw it. A sync uploads only files
+    whose signature changed, and the files last seen by an earlier run are
+    the ones removed since (see `removed`).
+
+    For deduplication, the state also caches the content hashes of files by
+    inode and modification time, and maps content hashes to the document
+    ID of their first (canonical) upload. Later copies are stored with the
+    hash and the canonical document ID.
+
+    The SQLite database runs in WAL mode, and results are written in group
+    commits of `batch_size` rows or every `flush_interval` seconds, whichever
+    comes first, instead of one transaction per file. Call `flush` to
+    persist pending results (e.g. on SIGINT) and `close` at the end.
+
+    To check whether a file was processed by an earlier run, the processed
+    paths are loaded into a Bloom filter. Paths it rules out need no
+    database access at all, the others are confirmed with a query on a
+    per-thread read connection. Neither takes a lock shared by the workers.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        batch_size: int = 1000,
+        flush_interval: float = 1.0,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS processed (path TEXT PRIMARY KEY)")
+        # state files of older versions only have the path
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(processed)")}
+        for column in ("size", "mtime", "inode", "id", "run", "hash", "canonical"):
+            if column not in columns:
+                kind = "INTEGER" if column in ("size", "mtime", "inode", "run") else "TEXT"
+                self._conn.execute(
+                    "ALTER TABLE processed ADD COLUMN %s %s" % (column, kind)
+                )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS failed (path TEXT PRIMARY KEY)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS folders (foreign_id TEXT PRIMARY KEY, id TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes (inode INTEGER, mtime INTEGER, "
+            "size INTEGER, hash TEXT, PRIMARY KEY (inode, mtime))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS contents (hash TEXT PRIMARY KEY, id TEXT)"
+        )
+        self._conn.commit()
+        query = "SELECT COALESCE(MAX(run), 0) + 1 FROM processed"
+        self.run: int = self._conn.execute(query).fetchone()[0]
+        self._write_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._processed: List[Tuple] = []
+        self._failed: List[Tuple[str]] = []
+        self._seen: List[Tuple] = []
+        self._folders: Dict[str, str] = {}
+        self._pending_folders: List[Tuple[str, str]] = []
+        self._hashes: List[Tuple] = []
+        # canonical uploads not committed yet
+        self._contents: Dict[str, str] = {}
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._known: Optional[BloomFilter] = None
+        self._stop = threading.Event()
+        # An in-memory database only exists for the connection which created
+        # it, so it is read through that connection too, and as nothing is
+        # persisted there is no need to commit in the background.
+        self._memory = str(path) == ":memory:"
+        self._flusher: Optional[threading.Thread] = None
+        if not self._memory:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    @classmethod
+    def remove(cls, path: Path):
+        """Delete a state database, including its WAL files."""
+        for suffix in ("", "-wal", "-shm"):
+            db_file = Path(str(path) + suffix)
+            if db_file.exists():
+                os.remove(db_file)
+
+    def load(self):
+        """Load the paths processed by earlier runs, to skip them, and the
+        folders created by them."""
+        count = self._conn.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+        known = BloomFilter(count)
+        for (path,) in self._conn.execute("SELECT path FROM processed"):
+            known.add(path)
+        self._known = known
+        self.load_folders()
+        log.info(
+            "Loaded %d processed paths and %d folders from %s",
+            count,
+            len(self._folders),
+            self.path,
+        )
+
+    def load_folders(self):
+        """Load only the folders created by earlier runs (see `folder_id`)."""
+        rows = self._conn.execute("SELECT foreign_id, id FROM folders")
+        with self._pending_lock:
+            self._folders.update(rows)
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._local.conn = conn
+            with self._pending_lock:
+                self._readers.append(conn)
+        return conn
+
+    def _fetchone(self, query: str, params: Tuple) -> Optional[Tuple]:
+        if self._memory:
+            with self._write_lock:
+                return self._conn.execute(query, params).fetchone()
+        return self._reader().execute(query, params).fetchone()
+
+    def is_processed(self, path: str) -> bool:
+        """Whether `path` was uploaded by an earlier run (see `load`)."""
+        if self._known is None or path not in self._known:
+            return False
+        query = "SELECT 1 FROM processed WHERE path = ?"
+        return self._fetchone(query, (path,)) is not None
+
+    def is_unchanged(self, path: str, signature: Optional[Signature]) -> bool:
+        """Whether `path` was uploaded by an earlier run and has not changed
+        since. If so it is recorded as seen by this run. Files uploaded by
+        older versions, which did not store signatures, count as
+        unchanged."""
+        if signature is None or self._known is None or path not in self._known:
+            return False
+        query = "SELECT size, mtime, inode FROM processed WHERE path = ?"
+        row = self._fetchone(query, (path,))
+        if row is None or (row[0] is not None and tuple(row) != signature):
+            return False
+        self._see(path, signature)
+        return True
+
+    def mark_processed(
+        self,
+        path: str,
+        signature: Optional[Signature] = None,
+        document_id: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        canonical: Optional[str] = None,
+    ):
+        """Record an uploaded file, or with `canonical` a duplicate of the
+        document `canonical` (`document_id` is then the ID of the entry
+        made for the duplicate, if any)."""
+        size, mtime, inode = signature or (None, None, None)
+        if document_id is not None:
+            document_id = str(document_id)
+        row = (path, size, mtime, inode, document_id, self.run, content_hash, canonical)
+        self._add(row, failed=False)
+
+    def mark_failed(self, path: str):
+        # a changed file which failed to upload is not removed
+        self._see(path, None)
+        self._add((path,), failed=True)
+
+    def _see(self, path: str, signature: Optional[Signature]):
+        size, mtime, inode = signature or (None, None, None)
+        with self._pending_lock:
+            self._seen.append((self.run, size, mtime, inode, path))
+
+    def cached_hash(self, signature: Signature) -> Optional[str]:
+        """The content hash of a file hashed before, if it is unchanged."""
+        size, mtime, inode = signature
+        query = "SELECT hash FROM hashes WHERE inode = ? AND mtime = ? AND size = ?"
+        row = self._fetchone(query, (inode, mtime, size))
+        return row[0] if row is not None else None
+
+    def cache_hash(self, signature: Signature, content_hash: str):
+        size, mtime, inode = signature
+        with self._pending_lock:
+            self._hashes.append((inode, mtime, size, content_hash))
+
+    def content_id(self, content_hash: str) -> Optional[str]:
+        """The ID of the document uploaded with this content, if any."""
+        with self._pending_lock:
+            if content_hash in self._contents:
+                return self._contents[content_hash]
+        query = "SELECT id FROM contents WHERE hash = ?"
+        row = self._fetchone(query, (content_hash,))
+        return row[0] if row is not None else None
+
+    def set_content_id(self, content_hash: str, document_id: str):
+        with self._pending_lock:
+            self._contents[content_hash] = str(document_id)
+
+    def removed(self) -> List[Tuple[str, Optional[str], Optional[str]]]:
+        """The paths, document IDs and canonical document IDs of the files
+        uploaded by earlier runs which this run has not seen. Documents which
+        are still the canonical upload of a file seen by this run are left
+        out."""
+        self.flush()
+        with self._write_lock:
+            query = (
+                "SELECT path, id, canonical FROM processed WHERE run < ? AND "
+                "(id IS NULL OR id NOT IN (SELECT canonical FROM processed "
+                "WHERE run >= ? AND canonical IS NOT NULL)) ORDER BY path"
+            )
+            return list(self._conn.execute(query, (self.run, self.run)))
+
+    def forget(self, paths: List[str]):
+        """Remove files from the state, e.g. once deleted on the server."""
+        self.flush()
+        with self._write_lock, self._conn:
+            rows = [(path,) for path in paths]
+            self._conn.executemany("DELETE FROM processed WHERE path = ?", rows)
+
+    def folder_id(self, foreign_id: str) -> Optional[str]:
+        """The server-side ID of a folder created by this or an earlier
+        run (see `load`)."""
+        return self._folders.get(foreign_id)
+
+    def set_folder_id(self, foreign_id: str, folder_id: str):
+        with self._pending_lock:
+            self._folders[foreign_id] = folder_id
+            self._pending_folders.append((foreign_id, str(folder_id)))
+            full = len(self._pending_folders) >= self.batch_size
+        if full:
+            self.flush()
+
+    def _add(self, row: Tuple, failed: bool):
+        with self._pending_lock:
+            pending = self._failed if failed else self._processed
+            pending.append(row)
+            full = len(self._processed) + len(self._failed) >= self.batch_size
+            full = full or len(self._seen) >= self.batch_size
+        if full:
+            self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Commit all pending results in one transaction."""
+        with self._write_lock:
+            with self._pending_lock:
+                processed, self._processed = self._processed, []
+                failed, self._failed = self._failed, []
+                folders, self._pending_folders = self._pending_folders, []
+                seen, self._seen = self._seen, []
+                hashes, self._hashes = self._hashes, []
+                contents = list(self._contents.items())
+            pending = processed, failed, folders, seen, hashes, contents
+            if not any(len(rows) for rows in pending):
+                return
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO hashes(inode, mtime, size, hash) "
+                    "VALUES(?, ?, ?, ?)",
+                    hashes,
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO contents(hash, id) VALUES(?, ?)", contents
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO folders(foreign_id, id) VALUES(?, ?)", folders
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO processed"
+                    "(path, size, mtime, inode, id, run, hash, canonical) "
+                    "VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+                    processed,
+                )
+                self._conn.executemany(
+                    "DELETE FROM failed WHERE path = ?", [row[:1] for row in processed]
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO failed(path) VALUES(?)", failed
+                )
+                self._conn.executemany(
+                    "UPDATE processed SET run = ?, size = COALESCE(?, size), "
+                    "mtime = COALESCE(?, mtime), inode = COALESCE(?, inode) "
+                    "WHERE path = ?",
+                    seen,
+                )
+            # committed: readers see these now
+            with self._pending_lock:
+                for content_hash, _ in contents:
+                    self._contents.pop(content_hash, None)
+
+    def counts(self) -> Tuple[int, int]:
+        """The number of processed and failed files, including earlier
+        runs."""
+        self.flush()
+        with self._write_lock:
+            processed = self._conn.execute("SELECT COUNT(*) FROM processed")
+            failed = self._conn.execute("SELECT COUNT(*) FROM failed")
+            return processed.fetchone()[0], failed.fetchone()[0]
+
+    def failed_paths(self) -> List[str]:
+        self.flush()
+        with self._write_lock:
+            rows = self._conn.execute("SELECT path FROM failed ORDER BY path")
+            return [row[0] for row in rows]
+
+    def close(self):
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        with self._pending_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+        with self._write_lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.close()
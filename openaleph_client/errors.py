@@ -1,4 +1,28 @@
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Optional
+
 from requests import ConnectionError, Timeout
+from requests.exceptions import ChunkedEncodingError
+
+# Responses worth retrying: rate limited, or the server (or a gateway in front
+# of it) failed.
+TRANSIENT_STATUS = (429, 500, 502, 503, 504)
+
+
+def retry_after(headers: Any) -> Optional[float]:
+    """Parse the `Retry-After` header into a delay in seconds."""
+    value = headers.get("Retry-After") if headers is not None else None
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
 
 
 class AlephException(Exception):
@@ -6,12 +30,16 @@ class AlephException(Exception):
         self.exc = exc
         self.response = None
         self.status = None
-        self.transient = isinstance(exc, (ConnectionError, Timeout))
+        self.retry_after: Optional[float] = None
+        self.transient = isinstance(
+            exc, (ConnectionError, Timeout, ChunkedEncodingError)
+        )
         self.message = str(exc)
         if hasattr(exc, "response") and exc.response is not None:
             self.response = exc.response
             self.status = exc.response.status_code
-            self.transient = exc.response.status_code >= 500
+            self.transient = exc.response.status_code in TRANSIENT_STATUS
+            self.retry_after = retry_after(exc.response.headers)
             try:
                 data = exc.response.json()
                 self.message = data.get("message")
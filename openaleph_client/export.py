@@ -0,0 +1,110 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, cast
+
+from openaleph_client import codec
+from openaleph_client.api import AlephAPI
+
+log = logging.getLogger(__name__)
+# Bytes buffered per shard before writing to a shared output stream
+BUFFER_SIZE = 1024 * 1024
+
+
+def schema_counts(api: AlephAPI, collection: Dict) -> Dict[str, int]:
+    """Count the entities of each schema in a collection, using a facet on
+    the search API."""
+    filters = [("collection_id", collection.get("id"))]
+    params = {"facet": "schema", "facet_size:schema": 1000, "limit": 0}
+    url = api._make_url("entities", filters=filters, params=params)
+    result = api._request("GET", url)
+    values = result.get("facets", {}).get("schema", {}).get("values", [])
+    return {v["id"]: v.get("count", 0) for v in values}
+
+
+def plan_shards(
+    counts: Dict[str, int], shards: int, schema: Optional[List[str]] = None
+) -> List[List[str]]:
+    """Distribute schemata over at most `shards` partitions with roughly the
+    same number of entities, largest schemata first."""
+    if schema:
+        counts = {s: counts.get(s, 0) for s in schema}
+    partitions: List[List[str]] = [[] for _ in range(min(shards, len(counts)))]
+    sizes = [0] * len(partitions)
+    for name, count in sorted(counts.items(), key=lambda i: (-i[1], i[0])):
+        idx = sizes.index(min(sizes))
+        partitions[idx].append(name)
+        sizes[idx] += count
+    return [p for p in partitions if len(p)]
+
+
+def _shard_file(outdir: Path, idx: int) -> Path:
+    return outdir / ("shard-%03d.ijson" % idx)
+
+
+def export_shards(
+    api: AlephAPI,
+    collection: Dict,
+    shards: int,
+    outfile: Optional[BinaryIO] = None,
+    outdir: Optional[Path] = None,
+    schema: Optional[List[str]] = None,
+    include: Optional[List] = None,
+    publisher: bool = False,
+    raw: bool = False,
+) -> int:
+    """Stream a collection over several concurrent connections, one per
+    group of schemata. Entities are either merged into `outfile` (in no
+    particular order) or written to one file per shard in `outdir`. Returns
+    the number of exported lines."""
+    if outfile is None and outdir is None:
+        raise ValueError("One of outfile or outdir is required")
+    partitions = plan_shards(schema_counts(api, collection), shards, schema=schema)
+    if not len(partitions):
+        return 0
+    if outdir is not None:
+        outdir.mkdir(parents=True, exist_ok=True)
+    lock = threading.Lock()
+    api.transport.ensure_pool_size(len(partitions))
+
+    def flush(fh: BinaryIO, buffer: bytearray):
+        if fh is outfile:
+            with lock:
+                fh.write(buffer)
+        else:
+            fh.write(buffer)
+        buffer.clear()
+
+    def export(idx: int, schemata: List[str]) -> int:
+        if outdir is not None:
+            log.info("Shard %d: %s", idx, ", ".join(schemata))
+            fh: BinaryIO = _shard_file(outdir, idx).open("wb")
+        else:
+            fh = cast(BinaryIO, outfile)
+        try:
+            res = api.stream_entities(
+                collection=collection,
+                include=include,
+                schema=schemata,
+                publisher=publisher,
+                raw=raw,
+            )
+            buffer = bytearray()
+            for item in res:
+                if raw:
+                    buffer.extend(item)
+                else:
+                    buffer.extend(codec.dumps(item))
+                    buffer.extend(b"\n")
+                if len(buffer) >= BUFFER_SIZE:
+                    flush(fh, buffer)
+            flush(fh, buffer)
+            return res.position
+        finally:
+            if fh is not outfile:
+                fh.close()
+
+    with ThreadPoolExecutor(max_workers=len(partitions)) as executor:
+        futures = [executor.submit(export, i, p) for i, p in enumerate(partitions)]
+        return sum(f.result() for f in futures)
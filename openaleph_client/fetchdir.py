@@ -1,10 +1,13 @@
 import logging
+import time
 import requests
 from pathlib import Path
 from pprint import pprint  # noqa
-from typing import Optional, Dict
+from typing import Dict, List, Optional
 
+from openaleph_client import settings
 from openaleph_client.api import AlephAPI
+from openaleph_client.errors import AlephException
 
 log = logging.getLogger(__name__)
 
@@ -22,15 +25,50 @@ def _get_filename(entity):
     return entity.get("id")
 
 
-def fetch_archive(url: str, path: Path):
-    with open(path, "wb") as fh:
-        res = requests.get(url, timeout=30)
-        for chunk in res.iter_content(chunk_size=512 * 1024):
-            if chunk:  # filter out keep-alive new chunks
-                fh.write(chunk)
-
-
-def fetch_object(api: AlephAPI, path: Path, entity: Dict, overwrite: bool = False):
+def fetch_archive(url: str, path: Path, deadline: float = settings.FETCH_DEADLINE):
+    """Download `url` to `path`. A stalled connection times out after 30s
+    without data, and the whole download is aborted (and the partial file
+    removed) after `deadline` seconds."""
+    started = time.monotonic()
+    try:
+        with open(path, "wb") as fh:
+            res = requests.get(
+                url, timeout=(settings.CONNECT_TIMEOUT, 30), stream=True
+            )
+            res.raise_for_status()
+            for chunk in res.iter_content(chunk_size=512 * 1024):
+                if chunk:  # filter out keep-alive new chunks
+                    fh.write(chunk)
+                if time.monotonic() - started > deadline:
+                    res.close()
+                    raise AlephException(
+                        "Download exceeded %ds deadline: %s" % (deadline, path)
+                    )
+    except requests.RequestException as exc:
+        path.unlink()
+        raise AlephException(exc) from exc
+    except AlephException:
+        path.unlink()
+        raise
+
+
+def _check_failed(failed: List[Path]):
+    if len(failed):
+        paths = ", ".join(str(p) for p in failed)
+        raise AlephException("%d downloads failed: %s" % (len(failed), paths))
+
+
+def fetch_object(
+    api: AlephAPI,
+    path: Path,
+    entity: Dict,
+    overwrite: bool = False,
+    deadline: float = settings.FETCH_DEADLINE,
+    failed: Optional[List[Path]] = None,
+):
+    """Download a document, or a folder with all its children. If `failed`
+    is given, failed downloads are logged and their paths added to it
+    instead of raising an error."""
     file_name = _get_filename(entity)
     path.mkdir(exist_ok=True, parents=True)
     object_path = path.joinpath(file_name)
@@ -45,24 +83,51 @@ def fetch_object(api: AlephAPI, path: Path, entity: Dict, overwrite: bool = Fals
                     return
 
         log.info("Fetch [%s]: %s", path, file_name)
-        return fetch_archive(url, object_path)
+        try:
+            return fetch_archive(url, object_path, deadline=deadline)
+        except AlephException as exc:
+            if failed is None:
+                raise
+            log.error("Failed [%s]: %s (%s)", path, file_name, exc)
+            failed.append(object_path)
+            return
 
     filters = [("properties.parent", entity.get("id"))]
     results = api.search("", filters=filters, schemata="Document")
     log.info("Directory [%s]: %s (%d children)", path, file_name, len(results))
     for entity in results:
-        fetch_object(api, object_path, entity, overwrite=overwrite)
+        fetch_object(
+            api,
+            object_path,
+            entity,
+            overwrite=overwrite,
+            deadline=deadline,
+            failed=failed,
+        )
 
 
 def fetch_entity(
-    api: AlephAPI, prefix: Optional[str], entity_id: str, overwrite: bool = False
+    api: AlephAPI,
+    prefix: Optional[str],
+    entity_id: str,
+    overwrite: bool = False,
+    deadline: float = settings.FETCH_DEADLINE,
 ):
     entity = api.get_entity(entity_id)
-    return fetch_object(api, _fix_path(prefix), entity, overwrite=overwrite)
+    path = _fix_path(prefix)
+    failed: List[Path] = []
+    fetch_object(
+        api, path, entity, overwrite=overwrite, deadline=deadline, failed=failed
+    )
+    _check_failed(failed)
 
 
 def fetch_collection(
-    api: AlephAPI, prefix: Optional[str], foreign_id: str, overwrite: bool = False
+    api: AlephAPI,
+    prefix: Optional[str],
+    foreign_id: str,
+    overwrite: bool = False,
+    deadline: float = settings.FETCH_DEADLINE,
 ):
     path = _fix_path(prefix)
     collection = api.get_collection_by_foreign_id(foreign_id)
@@ -73,5 +138,9 @@ def fetch_collection(
     results = api.search("", filters=filters, schemata="Document", params=params)
     label = collection.get("label")
     log.info("Dataset [%s]: %s (%d children)", path, label, len(results))
+    failed: List[Path] = []
     for entity in results:
-        fetch_object(api, path, entity, overwrite=overwrite)
+        fetch_object(
+            api, path, entity, overwrite=overwrite, deadline=deadline, failed=failed
+        )
+    _check_failed(failed)
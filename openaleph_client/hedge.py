@@ -0,0 +1,107 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Optional, Set, TypeVar
+
+from openaleph_client import settings
+
+log = logging.getLogger(__name__)
+T = TypeVar("T")
+
+
+class LatencyTracker(object):
+    """Keep the latencies of the last `window` requests and estimate their
+    `quantile`. The estimate is only available after `min_samples`
+    requests, and recomputed every `min_samples` requests after that."""
+
+    def __init__(
+        self,
+        quantile: float = settings.HEDGE_QUANTILE,
+        window: int = 1000,
+        min_samples: int = 20,
+    ):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._pending = 0
+        self._value: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+            self._pending += 1
+            if self._pending >= self.min_samples:
+                ordered = sorted(self._samples)
+                self._value = ordered[int(self.quantile * (len(ordered) - 1))]
+                self._pending = 0
+
+    @property
+    def value(self) -> Optional[float]:
+        return self._value
+
+
+class Hedger(object):
+    """Send a duplicate of a slow idempotent request and use whichever of the
+    two answers first ("hedged requests"). A request counts as slow once it
+    takes longer than the tracked latency quantile.
+
+    The duplicate is sent from another thread, and thus another session of
+    the transport. The losing request is not interrupted; `discard` is
+    called with its result once it arrives (e.g. to release a connection).
+    """
+
+    def __init__(self, max_workers: int = settings.POOL_SIZE):
+        self.latency = LatencyTracker()
+        self.hedged = 0
+        self.wins = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="openaleph-hedge"
+        )
+        self._lock = threading.Lock()
+
+    def call(
+        self, func: Callable[[], T], discard: Optional[Callable[[T], None]] = None
+    ) -> T:
+        delay = self.latency.value
+        if delay is None:
+            return func()
+        primary = self._executor.submit(func)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        hedge = self._executor.submit(func)
+        with self._lock:
+            self.hedged += 1
+        pending: Set[Future] = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if future is hedge:
+                    with self._lock:
+                        self.wins += 1
+                for other in pending:
+                    if discard is not None:
+                        other.add_done_callback(_discarder(discard))
+                return future.result()
+        assert error is not None
+        raise error
+
+    def stats(self) -> Dict[str, int]:
+        return {"hedged": self.hedged, "wins": self.wins}
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def _discarder(discard: Callable) -> Callable[[Future], None]:
+    def callback(future: Future):
+        if future.exception() is None:
+            discard(future.result())
+
+    return callback
@@ -0,0 +1,243 @@
+import re
+from pathlib import Path
+from typing import Iterable, List, Optional, Pattern, Set, Tuple
+
+IGNORE_FILE = ".openalephignore"
+WILDCARDS = re.compile(r"[*?\[\\]")
+
+
+def translate(pattern: str) -> str:
+    """Translate a gitignore glob into a regular expression: `*` and `?` do
+    not match `/`, `**/` matches any number of directories and a trailing
+    `/**` everything inside a directory."""
+    out: List[str] = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            j = i + 1
+            while j < n and pattern[j] == "*":
+                j += 1
+            if j - i > 1 and (i == 0 or pattern[i - 1] == "/"):
+                if j == n:
+                    out.append(".*")
+                    i = j
+                    continue
+                if pattern[j] == "/":
+                    out.append("(?:.*/)?")
+                    i = j + 1
+                    continue
+            out.append("[^/]*")
+            i = j
+            continue
+        if c == "?":
+            out.append("[^/]")
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        elif c == "[":
+            j = i + 1
+            if j < n and pattern[j] in "!^":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 1
+            if j >= n:
+                out.append("\\[")
+            else:
+                chars = pattern[i + 1 : j].replace("\\", "\\\\")
+                if chars[0] in "!^":
+                    chars = "^" + chars[1:]
+                out.append("[%s]" % chars)
+                i = j
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class Rule(object):
+    """One line of an ignore file."""
+
+    __slots__ = ("pattern", "negate", "dir_only", "anchored")
+
+    def __init__(self, line: str):
+        pattern = line
+        self.negate = pattern.startswith("!")
+        if self.negate:
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # a slash anywhere but at the end anchors the pattern to the
+        # directory of the ignore file, otherwise it matches names at any depth
+        self.anchored = "/" in pattern
+        self.pattern = pattern.lstrip("/")
+
+
+def parse(lines: Iterable[str]) -> List[Rule]:
+    rules = []
+    for line in lines:
+        line = line.rstrip("\n").rstrip()
+        if not line or line.startswith("#"):
+            continue
+        rule = Rule(line)
+        if len(rule.pattern):
+            rules.append(rule)
+    return rules
+
+
+def _compile(regexes: List[str]) -> Optional[Pattern]:
+    if not len(regexes):
+        return None
+    return re.compile("(?:%s)\\Z" % "|".join(regexes), re.DOTALL)
+
+
+class _Matcher(object):
+    """Rules merged into as few lookups as possible: literal names and paths
+    go into sets, `*suffix` patterns into a tuple for `str.endswith`, and
+    all other patterns into one regex for names, one for paths and one for
+    paths starting with `**/` (tried at each directory level, which is
+    faster than a leading `.*`)."""
+
+    __slots__ = ("names", "paths", "suffixes", "name_re", "path_re", "tail_re")
+
+    def __init__(self, rules: List[Rule]):
+        self.names: Set[str] = set()
+        self.paths: Set[str] = set()
+        suffixes: List[str] = []
+        name_res: List[str] = []
+        path_res: List[str] = []
+        tail_res: List[str] = []
+        for rule in rules:
+            pattern = rule.pattern
+            literal = WILDCARDS.search(pattern) is None
+            if rule.anchored:
+                if literal:
+                    self.paths.add(pattern)
+                elif pattern.startswith("**/") and "**" not in pattern[3:]:
+                    tail_res.append(translate(pattern[3:]))
+                else:
+                    path_res.append(translate(pattern))
+            elif literal:
+                self.names.add(pattern)
+            elif pattern.startswith("*") and WILDCARDS.search(pattern[1:]) is None:
+                suffixes.append(pattern[1:])
+            else:
+                name_res.append(translate(pattern))
+        self.suffixes: Tuple[str, ...] = tuple(suffixes)
+        self.name_re = _compile(name_res)
+        self.path_re = _compile(path_res)
+        self.tail_re = _compile(tail_res)
+
+    def matches(self, rel: str, name: str) -> bool:
+        if name in self.names or rel in self.paths:
+            return True
+        if len(self.suffixes) and name.endswith(self.suffixes):
+            return True
+        if self.name_re is not None and self.name_re.match(name):
+            return True
+        if self.path_re is not None and self.path_re.match(rel):
+            return True
+        if self.tail_re is not None:
+            pos = 0
+            while pos >= 0:
+                if self.tail_re.match(rel, pos):
+                    return True
+                pos = rel.find("/", pos) + 1 or -1
+        return False
+
+
+class _RuleSet(object):
+    """A matcher for all entries and one for the directory-only rules."""
+
+    __slots__ = ("all", "dirs")
+
+    def __init__(self, rules: List[Rule]):
+        self.all = _Matcher([r for r in rules if not r.dir_only])
+        self.dirs = _Matcher([r for r in rules if r.dir_only])
+
+    def matches(self, rel: str, name: str, is_dir: bool) -> bool:
+        if self.all.matches(rel, name):
+            return True
+        return is_dir and self.dirs.matches(rel, name)
+
+
+class IgnoreRules(object):
+    """Compiled gitignore-style rules, e.g. from an `.openalephignore` file.
+
+    Patterns match names at any depth, or paths relative to `base` if they
+    contain a slash; a trailing slash restricts them to directories and a
+    leading `!` re-includes what an earlier pattern excluded. The last
+    matching pattern wins, and the rules of an ignore file in a
+    subdirectory (see `child`) take precedence over those of its parents.
+    Paths inside an ignored directory are not matched against anything:
+    the crawler never descends into it.
+
+    All excluding patterns are merged into one matcher, and so are all
+    re-including ones; the patterns are only tried one by one for paths
+    which both match.
+    """
+
+    def __init__(
+        self,
+        lines: Iterable[str] = (),
+        base: str = "",
+        parent: Optional["IgnoreRules"] = None,
+    ):
+        self.base = base
+        self.parent = parent
+        self.rules = parse(lines)
+        self.ignore = _RuleSet([r for r in self.rules if not r.negate])
+        self.keep = _RuleSet([r for r in self.rules if r.negate])
+        self._ordered: Optional[List[Tuple[Rule, _RuleSet]]] = None
+
+    @classmethod
+    def from_file(
+        cls, path: Path, base: str = "", parent: Optional["IgnoreRules"] = None
+    ) -> "IgnoreRules":
+        lines = path.read_text(encoding="utf-8").splitlines()
+        return cls(lines, base=base, parent=parent)
+
+    def child(self, base: str, lines: Iterable[str]) -> "IgnoreRules":
+        """Rules of an ignore file in the directory `base` (relative to the
+        crawl root), which apply in addition to these."""
+        return IgnoreRules(lines, base=base, parent=self)
+
+    def _decide(self, rel: str, name: str, is_dir: bool) -> Optional[bool]:
+        """Whether these rules, not counting the parents, ignore (True) or
+        re-include (False) a path, or None if no rule matches."""
+        ignored = self.ignore.matches(rel, name, is_dir)
+        kept = self.keep.matches(rel, name, is_dir)
+        if ignored != kept:
+            return ignored
+        if not ignored:
+            return None
+        # both kinds match: the last matching rule decides
+        if self._ordered is None:
+            self._ordered = [(r, _RuleSet([r])) for r in reversed(self.rules)]
+        for rule, matcher in self._ordered:
+            if matcher.matches(rel, name, is_dir):
+                return not rule.negate
+        return None
+
+    def is_ignored(self, rel: str, is_dir: bool) -> bool:
+        """Whether the path `rel` (relative to the crawl root, with `/` as
+        separator) is ignored, given that its parent directory is not."""
+        name = rel.rsplit("/", 1)[-1]
+        rules: Optional[IgnoreRules] = self
+        while rules is not None:
+            local = rel[len(rules.base) + 1 :] if len(rules.base) else rel
+            decision = rules._decide(local, name, is_dir)
+            if decision is not None:
+                return decision
+            rules = rules.parent
+        return False
+
+    def is_ignored_path(self, rel: str, is_dir: bool) -> bool:
+        """Like `is_ignored`, but also checks the parent directories."""
+        parts = rel.split("/")
+        for idx in range(1, len(parts)):
+            if self.is_ignored("/".join(parts[:idx]), True):
+                return True
+        return self.is_ignored(rel, is_dir)
@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+
+log = logging.getLogger(__name__)
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+API_PREFIX = "/api/2/"
+
+
+def endpoint_name(url: str) -> str:
+    """Group API URLs by endpoint, replacing object IDs with `{id}`, e.g.
+    `collections/{id}/_bulk`. Object IDs follow the name of their kind of
+    object, so every other path segment is an ID unless it names an action
+    (`_stream`, `_bulk`)."""
+    path = urlparse(url).path
+    if path.startswith(API_PREFIX):
+        path = path[len(API_PREFIX) :]
+    segments = [s for s in path.split("/") if len(s)]
+    for idx in range(1, len(segments), 2):
+        if not segments[idx].startswith("_"):
+            segments[idx] = "{id}"
+    return "/".join(segments)
+
+
+class RequestInfo(NamedTuple):
+    """A completed HTTP request, as passed to `Hook.on_request`."""
+
+    method: str
+    url: str
+    endpoint: str
+    # None if no response was received
+    status: Optional[int]
+    # seconds until the response headers arrived
+    elapsed: float
+    sent: int
+
+
+class Hook(object):
+    """Base class for instrumentation hooks, see `AlephAPI.add_hook`. Hooks
+    are called from the threads making requests and must be thread-safe."""
+
+    def on_request(self, info: RequestInfo):
+        """A request was answered (or failed without a response)."""
+
+    def on_received(self, endpoint: str, size: int):
+        """`size` bytes of a response body were read."""
+
+    def on_retry(self, err: Exception, delay: float):
+        """A failed request will be retried after `delay` seconds."""
+
+
+class Histogram(object):
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of its bucket."""
+        rank = q * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return BUCKETS[idx] if idx < len(BUCKETS) else self.max
+        return 0.0
+
+
+class MetricsCollector(Hook):
+    """Collect latency histograms, status codes and transferred bytes per
+    endpoint, as well as retries and time spent backing off. The metrics can
+    be logged as a summary, or written to a file in the Prometheus text
+    format (for the node exporter's textfile collector) or as JSON."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.statuses: Dict[Tuple[str, str, str], int] = {}
+        self.sent: Dict[str, int] = {}
+        self.received: Dict[str, int] = {}
+        self.retries = 0
+        self.backoff = 0.0
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def on_request(self, info: RequestInfo):
+        status = str(info.status) if info.status is not None else "error"
+        with self._lock:
+            key = (info.method, info.endpoint)
+            if key not in self.latency:
+                self.latency[key] = Histogram()
+            self.latency[key].observe(info.elapsed)
+            skey = (info.method, info.endpoint, status)
+            self.statuses[skey] = self.statuses.get(skey, 0) + 1
+            self.sent[info.endpoint] = self.sent.get(info.endpoint, 0) + info.sent
+
+    def on_received(self, endpoint: str, size: int):
+        with self._lock:
+            self.received[endpoint] = self.received.get(endpoint, 0) + size
+
+    def on_retry(self, err: Exception, delay: float):
+        with self._lock:
+            self.retries += 1
+            self.backoff += delay
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            endpoints = {}
+            for (method, endpoint), hist in sorted(self.latency.items()):
+                statuses = {
+                    s: c
+                    for (m, e, s), c in self.statuses.items()
+                    if m == method and e == endpoint
+                }
+                endpoints["%s %s" % (method, endpoint)] = {
+                    "requests": hist.count,
+                    "seconds": round(hist.sum, 6),
+                    "p50": hist.quantile(0.5),
+                    "p95": hist.quantile(0.95),
+                    "max": round(hist.max, 6),
+                    "statuses": statuses,
+                }
+            return {
+                "uptime": round(time.time() - self.started, 3),
+                "endpoints": endpoints,
+                "bytes_sent": dict(self.sent),
+                "bytes_received": dict(self.received),
+                "retries": self.retries,
+                "backoff_seconds": round(self.backoff, 3),
+            }
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+        prefix = "openaleph_client"
+        with self._lock:
+            name = "%s_request_duration_seconds" % prefix
+            lines.append("# TYPE %s histogram" % name)
+            for (method, endpoint), hist in sorted(self.latency.items()):
+                labels = 'method="%s",endpoint="%s"' % (method, endpoint)
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), hist.counts):
+                    cumulative += count
+                    lines.append(
+                        '%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative)
+                    )
+                lines.append("%s_sum{%s} %f" % (name, labels, hist.sum))
+                lines.append("%s_count{%s} %d" % (name, labels, hist.count))
+            name = "%s_responses_total" % prefix
+            lines.append("# TYPE %s counter" % name)
+            for (method, endpoint, status), count in sorted(self.statuses.items()):
+                labels = 'method="%s",endpoint="%s",status="%s"'
+                labels = labels % (method, endpoint, status)
+                lines.append("%s{%s} %d" % (name, labels, count))
+            for kind, values in (("sent", self.sent), ("received", self.received)):
+                name = "%s_bytes_%s_total" % (prefix, kind)
+                lines.append("# TYPE %s counter" % name)
+                for endpoint, size in sorted(values.items()):
+                    lines.append('%s{endpoint="%s"} %d' % (name, endpoint, size))
+            lines.append("# TYPE %s_retries_total counter" % prefix)
+            lines.append("%s_retries_total %d" % (prefix, self.retries))
+            lines.append("# TYPE %s_backoff_seconds_total counter" % prefix)
+            lines.append("%s_backoff_seconds_total %f" % (prefix, self.backoff))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Write the metrics to `path`, as JSON if it ends with `.json` and
+        in the Prometheus text format otherwise. The file is replaced
+        atomically, so it can be read at any time."""
+        if path.endswith(".json"):
+            data = json.dumps(self.to_dict(), indent=2)
+        else:
+            data = self.to_prometheus()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+
+    def start_writer(self, path: str, interval: float = 15.0):
+        """Write the metrics to `path` every `interval` seconds until
+        `stop_writer` is called."""
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.write(path)
+                except OSError as exc:
+                    log.warning("Cannot write metrics to %s: %s", path, exc)
+
+        self._writer = threading.Thread(target=run, daemon=True)
+        self._writer.start()
+
+    def stop_writer(self):
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
+    def summary(self) -> str:
+        """A human-readable report of where the time went."""
+        data = self.to_dict()
+        total = sum(e["seconds"] for e in data["endpoints"].values())
+        lines = [
+            "HTTP requests over %.1fs: %.1fs waiting for the server, "
+            "%d retries, %.1fs backing off"
+            % (data["uptime"], total, data["retries"], data["backoff_seconds"])
+        ]
+        for name, stats in data["endpoints"].items():
+            endpoint = name.split(" ", 1)[1]
+            statuses = ", ".join("%s: %d" % s for s in sorted(stats["statuses"].items()))
+            lines.append(
+                "  %s: %d requests, %.1fs, p50 %.3fs, p95 %.3fs, max %.3fs, "
+                "%d bytes sent, %d received (%s)"
+                % (
+                    name,
+                    stats["requests"],
+                    stats["seconds"],
+                    stats["p50"],
+                    stats["p95"],
+                    stats["max"],
+                    data["bytes_sent"].get(endpoint, 0),
+                    data["bytes_received"].get(endpoint, 0),
+                    statuses,
+                )
+            )
+        return "\n".join(lines)
@@ -0,0 +1,153 @@
+import logging
+import os
+import struct
+import threading
+import time
+from typing import Any, Iterable, Iterator, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+from openaleph_client import settings
+
+log = logging.getLogger(__name__)
+STATE = struct.Struct("dd")
+# Bodies larger than this are throttled while they are sent, not up front
+STREAM_THRESHOLD = 1024 * 1024
+
+
+class TokenBucket(object):
+    """A token bucket refilled with `rate` tokens per second, holding at most
+    `capacity` tokens (one second worth by default).
+
+    Taking tokens never fails: the bucket goes into debt and the caller
+    sleeps until it is paid off, so large requests are delayed in proportion
+    to their size. Safe to share between threads. With a `path`, the bucket
+    state lives in that file and is shared by all processes on the host that
+    use it, coordinated with `flock`.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        path: Optional[str] = None,
+    ):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.path = path
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        if path is not None and fcntl is None:
+            log.warning("File locking is not available, rate limit is per process")
+            self.path = None
+
+    def _take(self, tokens: float, tokens_now: float, updated: float, now: float):
+        tokens_now = min(self.capacity, tokens_now + (now - updated) * self.rate)
+        tokens_now -= tokens
+        delay = max(0.0, -tokens_now / self.rate)
+        return tokens_now, delay
+
+    def _take_shared(self, tokens: float) -> float:
+        assert self.path is not None
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # wall clock time, as monotonic clocks are not comparable
+            # between processes
+            now = time.time()
+            data = os.pread(fd, STATE.size, 0)
+            if len(data) == STATE.size:
+                tokens_now, updated = STATE.unpack(data)
+            else:
+                tokens_now, updated = self.capacity, now
+            tokens_now, delay = self._take(tokens, tokens_now, updated, now)
+            os.pwrite(fd, STATE.pack(tokens_now, now), 0)
+            return delay
+        finally:
+            os.close(fd)
+
+    def take(self, tokens: float = 1.0) -> float:
+        """Take tokens and return how long the caller must wait for them."""
+        if self.path is not None:
+            return self._take_shared(tokens)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens, delay = self._take(tokens, self._tokens, self._updated, now)
+            self._updated = now
+            return delay
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until `tokens` are available."""
+        delay = self.take(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class _ThrottledReader(object):
+    def __init__(self, body: Any, bucket: TokenBucket):
+        self.body = body
+        self.bucket = bucket
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.body.read(size)
+        self.bucket.acquire(len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.body, name)
+
+
+def _throttled_iter(body: Iterable, bucket: TokenBucket) -> Iterator:
+    for data in body:
+        bucket.acquire(len(data))
+        yield data
+
+
+def _slices(
+    body: Union[bytes, bytearray], size: int
+) -> Iterator[Union[bytes, bytearray]]:
+    for offset in range(0, len(body), size):
+        yield body[offset : offset + size]
+
+
+class RateLimiter(object):
+    """Limit requests per second and request body bytes per second, for all
+    threads using it. With a `path`, the budget is shared by all processes on
+    the host using the same path. A rate of 0 disables that limit."""
+
+    def __init__(
+        self,
+        requests_per_second: float = settings.RATE_LIMIT,
+        bytes_per_second: float = settings.BYTE_RATE_LIMIT,
+        path: Optional[str] = settings.RATE_LIMIT_FILE,
+    ):
+        self.requests: Optional[TokenBucket] = None
+        self.bytes: Optional[TokenBucket] = None
+        if requests_per_second > 0:
+            req_path = path + ".requests" if path else None
+            self.requests = TokenBucket(requests_per_second, path=req_path)
+        if bytes_per_second > 0:
+            bytes_path = path + ".bytes" if path else None
+            self.bytes = TokenBucket(bytes_per_second, path=bytes_path)
+
+    def throttle(self, body: Any) -> Any:
+        """Wait for a request slot and return `body`, wrapped so that it is
+        sent within the byte rate."""
+        if self.requests is not None:
+            self.requests.acquire()
+        if self.bytes is None or body is None:
+            return body
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        if isinstance(body, (bytes, bytearray)):
+            if len(body) <= STREAM_THRESHOLD:
+                self.bytes.acquire(len(body))
+                return body
+            return _throttled_iter(_slices(body, STREAM_THRESHOLD), self.bytes)
+        if hasattr(body, "read"):
+            return _ThrottledReader(body, self.bytes)
+        return _throttled_iter(body, self.bytes)
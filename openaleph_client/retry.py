@@ -0,0 +1,220 @@
+import logging
+import random
+import threading
+import time
+from typing import Callable, List, Optional, TypeVar
+
+from openaleph_client import settings
+from openaleph_client.errors import AlephException
+from openaleph_client.metrics import Hook
+
+log = logging.getLogger(__name__)
+T = TypeVar("T")
+# Statuses which mean the server is down or overloaded, rather than that one
+# request failed
+OUTAGE_STATUS = (502, 503, 504)
+# Longest wait honored from a `Retry-After` header, in seconds
+MAX_RETRY_AFTER = 300.0
+
+
+class RetryBudget(object):
+    """Limit retries to a fraction of successful requests, so that a failing
+    server is not hit with a multiple of the normal load by every worker
+    retrying. Each success earns `ratio` retries, up to `reserve` retries
+    which are also available from the start."""
+
+    def __init__(
+        self,
+        ratio: float = settings.RETRY_BUDGET,
+        reserve: int = settings.RETRY_RESERVE,
+    ):
+        self.ratio = ratio
+        self.reserve = float(reserve)
+        self.tokens = self.reserve
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.reserve, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Take one retry from the budget, if there is one left."""
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker(object):
+    """Pause all requests after `threshold` consecutive outage failures.
+
+    While the breaker is open, callers wait for `cooldown` seconds. After
+    that a single request is let through as a probe: if it succeeds the
+    breaker closes, otherwise it opens again for twice as long (up to
+    `max_cooldown`). Requests are only ever delayed, never refused.
+    """
+
+    def __init__(
+        self,
+        threshold: int = settings.BREAKER_THRESHOLD,
+        cooldown: float = settings.BREAKER_COOLDOWN,
+        max_cooldown: float = 300.0,
+    ):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = 0
+        self.opened = 0
+        self._current = cooldown
+        self._open_until: Optional[float] = None
+        self._probe: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._open_until is not None
+
+    def remaining(self) -> float:
+        """Seconds the caller should wait before sending a request. Returns
+        0 when the request may be sent (possibly as the probe)."""
+        with self._lock:
+            if self._open_until is None:
+                return 0.0
+            now = time.monotonic()
+            if now < self._open_until:
+                return self._open_until - now
+            if self._probe is None or now - self._probe > self._current:
+                self._probe = now
+                return 0.0
+            return min(1.0, self._current)
+
+    def wait(self):
+        """Block until a request may be sent."""
+        while True:
+            delay = self.remaining()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            if self._open_until is not None:
+                log.info("Server is responding again, resuming requests")
+            self._open_until = None
+            self._probe = None
+            self._current = self.cooldown
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probe is not None:
+                self._current = min(self.max_cooldown, self._current * 2)
+            elif self._open_until is not None or self.failures < self.threshold:
+                return
+            self._probe = None
+            self._open_until = time.monotonic() + self._current
+            self.opened += 1
+            log.warning(
+                "Server unavailable (%d failures), pausing requests for %.0fs",
+                self.failures,
+                self._current,
+            )
+
+
+class Retrying(object):
+    """The retry state of one operation, see `RetryPolicy.start`."""
+
+    def __init__(self, policy: "RetryPolicy"):
+        self.policy = policy
+        self.attempts = 0
+        self._delay = policy.base_delay
+
+    def reset(self):
+        """The operation made progress: start counting failures anew."""
+        self.attempts = 0
+        self._delay = self.policy.base_delay
+
+    def delay(self, err: AlephException) -> Optional[float]:
+        """Record a failure and return how long to wait before retrying, or
+        None if the error should be raised."""
+        policy = self.policy
+        self.attempts += 1
+        if not err.transient or self.attempts > policy.retries:
+            return None
+        if not policy.budget.withdraw():
+            log.warning("Retry budget exhausted, not retrying: %s", err)
+            return None
+        with policy._lock:
+            policy.retried += 1
+        # decorrelated jitter: spread retries of concurrent workers apart
+        upper = max(policy.base_delay, self._delay * 3)
+        self._delay = min(policy.max_delay, random.uniform(policy.base_delay, upper))
+        delay = self._delay
+        if err.retry_after is not None:
+            delay = min(MAX_RETRY_AFTER, max(err.retry_after, delay))
+        for hook in policy.hooks:
+            hook.on_retry(err, delay)
+        return delay
+
+    def retry(self, err: AlephException) -> bool:
+        """Wait before retrying after `err`. Returns False if the error
+        should be raised instead."""
+        delay = self.delay(err)
+        if delay is None:
+            return False
+        log.warning("Error: %s, back-off: %.2fs", err, delay)
+        time.sleep(delay)
+        return True
+
+
+class RetryPolicy(object):
+    """Retry transient errors of all requests made through one API client.
+
+    Delays follow decorrelated jitter between `base_delay` and `max_delay`,
+    or the server's `Retry-After`, whichever is longer. Retries are shared
+    out by a `RetryBudget`, and a `CircuitBreaker` pauses all workers together
+    while the server is down.
+    """
+
+    def __init__(
+        self,
+        retries: int = settings.MAX_TRIES,
+        base_delay: float = settings.RETRY_BASE_DELAY,
+        max_delay: float = settings.RETRY_MAX_DELAY,
+        budget: Optional[RetryBudget] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.retried = 0
+        self.hooks: List[Hook] = []
+        self._lock = threading.Lock()
+
+    def start(self) -> Retrying:
+        """Begin an operation which may be retried."""
+        return Retrying(self)
+
+    def call(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Call `func`, retrying it on transient `AlephException`s."""
+        state = self.start()
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except AlephException as ae:
+                if not state.retry(ae):
+                    raise
+
+    def record(self, status: Optional[int]):
+        """Feed the outcome of a request to the budget and breaker: an HTTP
+        status, or None if no response was received."""
+        if status is None or status in OUTAGE_STATUS:
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+            if status < 400:
+                self.budget.deposit()
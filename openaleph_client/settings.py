@@ -11,3 +11,70 @@ API_KEY = os.environ.get("OPAL_API_KEY", API_KEY)
 
 MAX_TRIES = int(os.environ.get("OPENALEPH_MAX_TRIES", 5))
 MEMORIOUS_RATE_LIMIT = int(os.environ.get("OPENALEPH_MEMORIOUS_RATE_LIMIT", 120))
+
+# Maximum number of pooled HTTP connections kept open to the API host
+POOL_SIZE = int(os.environ.get("OPENALEPH_POOL_SIZE", 10))
+
+# Search results the server returns for one query at most (offset + limit),
+# result sets do not prefetch pages beyond it
+RESULT_WINDOW = int(os.environ.get("OPENALEPH_RESULT_WINDOW", 10_000))
+
+# Upper bound for the serialized size of a single bulk request, in bytes
+BULK_CHUNK_BYTES = int(os.environ.get("OPENALEPH_BULK_CHUNK_BYTES", 20 * 1024 * 1024))
+# Bulk requests slower than this (in seconds) shrink the chunk size, 0 disables
+BULK_TARGET_LATENCY = float(os.environ.get("OPENALEPH_BULK_TARGET_LATENCY", 10))
+
+# JSON library used for entity streams: orjson, ujson or json. Defaults to the
+# fastest one installed.
+JSON_CODEC = os.environ.get("OPENALEPH_JSON", "")
+
+# Cache GET responses in memory, optionally shared across processes in a file
+CACHE = os.environ.get("OPENALEPH_CACHE", "false").lower() in ("1", "true", "yes")
+CACHE_FILE = os.environ.get("OPENALEPH_CACHE_FILE")
+CACHE_TTL = float(os.environ.get("OPENALEPH_CACHE_TTL", 300))
+CACHE_SIZE = int(os.environ.get("OPENALEPH_CACHE_SIZE", 4096))
+
+# Client-side rate limits: requests per second and request body bytes per
+# second (0 disables). A file path shares the budget between processes. Without
+# OPENALEPH_RATE_LIMIT, the memorious rate limit (per minute) applies if set.
+RATE_LIMIT = 0.0
+if "OPENALEPH_MEMORIOUS_RATE_LIMIT" in os.environ:
+    RATE_LIMIT = MEMORIOUS_RATE_LIMIT / 60
+RATE_LIMIT = float(os.environ.get("OPENALEPH_RATE_LIMIT", RATE_LIMIT))
+BYTE_RATE_LIMIT = float(os.environ.get("OPENALEPH_BYTE_RATE_LIMIT", 0))
+RATE_LIMIT_FILE = os.environ.get("OPENALEPH_RATE_LIMIT_FILE")
+
+# Retries: delays grow with decorrelated jitter from the base up to the maximum
+# (in seconds). The budget allows retries beyond the reserve only in proportion
+# to successful requests, e.g. 0.1 means one retry per ten successes.
+RETRY_BASE_DELAY = float(os.environ.get("OPENALEPH_RETRY_BASE_DELAY", 1))
+RETRY_MAX_DELAY = float(os.environ.get("OPENALEPH_RETRY_MAX_DELAY", 32))
+RETRY_BUDGET = float(os.environ.get("OPENALEPH_RETRY_BUDGET", 0.1))
+RETRY_RESERVE = int(os.environ.get("OPENALEPH_RETRY_RESERVE", 50))
+# Consecutive connection failures (or 502/503/504) that pause all requests,
+# and the initial length of that pause in seconds
+BREAKER_THRESHOLD = int(os.environ.get("OPENALEPH_BREAKER_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.environ.get("OPENALEPH_BREAKER_COOLDOWN", 10))
+
+# Timeouts in seconds: for establishing a connection, and for waiting on the
+# server (between two received bytes, not for the whole response) by kind of
+# request. Bulk writes and uploads may take the server much longer to answer.
+CONNECT_TIMEOUT = float(os.environ.get("OPENALEPH_CONNECT_TIMEOUT", 10))
+READ_TIMEOUT = float(os.environ.get("OPENALEPH_READ_TIMEOUT", 60))
+STREAM_TIMEOUT = float(os.environ.get("OPENALEPH_STREAM_TIMEOUT", 120))
+BULK_TIMEOUT = float(os.environ.get("OPENALEPH_BULK_TIMEOUT", 300))
+UPLOAD_TIMEOUT = float(os.environ.get("OPENALEPH_UPLOAD_TIMEOUT", 600))
+# Hedged reads: send a duplicate of a GET request when it has not been answered
+# after the given quantile of recent GET latencies, and use the first response
+HEDGE = os.environ.get("OPENALEPH_HEDGE", "false").lower() in ("1", "true", "yes")
+HEDGE_QUANTILE = float(os.environ.get("OPENALEPH_HEDGE_QUANTILE", 0.95))
+
+# Files listed by crawldir but not uploaded yet: the scanners wait when this
+# many are queued, which bounds memory use on very large trees
+CRAWL_QUEUE_SIZE = int(os.environ.get("OPENALEPH_CRAWL_QUEUE_SIZE", 10_000))
+# Files of at least this many bytes are uploaded by crawldir in a separate
+# lane with its own threads (0: one lane for all files)
+CRAWL_LARGE_FILE_THRESHOLD = int(os.environ.get("OPENALEPH_LARGE_FILE_THRESHOLD", 0))
+CRAWL_LARGE_PARALLEL = int(os.environ.get("OPENALEPH_LARGE_PARALLEL", 1))
+# Maximum duration of a whole file download in fetchdir
+FETCH_DEADLINE = float(os.environ.get("OPENALEPH_FETCH_DEADLINE", 3600))
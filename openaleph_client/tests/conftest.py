@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+from requests import HTTPError, Response
+
+from openaleph_client.api import AlephAPI
+from openaleph_client.crawldir import CrawlDirectory
+from openaleph_client.errors import AlephException
+
+
+def _error(status):
+    response = Response()
+    response.status_code = status
+    return AlephException(HTTPError(response=response))
+
+
+class FakeServer:
+    """Stands in for `CrawlDirectory.ingest_upload`: creates folders, records
+    uploaded files with their parent folder and the thread uploading them,
+    and rejects uploads into folders it does not know with a 400, like the
+    ingest API. `get_entity` looks up folders, with a 404 for unknown
+    ones."""
+
+    def __init__(self):
+        self.folders = {}
+        self.uploads = {}
+        self.threads = {}
+        # foreign IDs of files and folders which the server rejects
+        self.broken = set()
+        # seconds it takes to create a folder
+        self.folder_delay = 0.0
+        self._created = {}
+        self._lock = threading.Lock()
+
+    def ingest_upload(self, path, parent_id, foreign_id):
+        if path.is_dir() and self.folder_delay:
+            time.sleep(self.folder_delay)
+        with self._lock:
+            if foreign_id in self.broken:
+                raise _error(400)
+            if parent_id is not None and parent_id not in self.folders.values():
+                raise _error(400)
+            if path.is_dir():
+                # a folder created again gets a new ID
+                count = self._created.get(foreign_id, 0) + 1
+                self._created[foreign_id] = count
+                folder_id = "id-%s" % foreign_id
+                if count > 1:
+                    folder_id = "%s-%d" % (folder_id, count)
+                self.folders[foreign_id] = folder_id
+                return folder_id
+            self.uploads[foreign_id] = parent_id
+            self.threads[foreign_id] = threading.current_thread().name
+            return "id-%s" % foreign_id
+
+    def get_entity(self, entity_id, publisher=False):
+        with self._lock:
+            if entity_id not in self.folders.values():
+                raise _error(404)
+            return {"id": entity_id, "schema": "Folder"}
+
+    def clear(self):
+        with self._lock:
+            self.uploads.clear()
+            self.threads.clear()
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """A directory with 3x3 folders of two files each, and one file at the
+    top: 12 folders and 19 files."""
+    root = tmp_path / "data"
+    for a in range(3):
+        for b in range(3):
+            folder = root / ("a%d" % a) / ("b%d" % b)
+            folder.mkdir(parents=True)
+            for c in range(2):
+                (folder / ("f%d.txt" % c)).write_text("x")
+    (root / "top.txt").write_text("x")
+    return root
+
+
+@pytest.fixture
+def api(mocker):
+    api = AlephAPI(host="http://openaleph.test/api/2/", api_key="fake")
+    mocker.patch.object(api, "load_collection_by_foreign_id", return_value={"id": "1"})
+    return api
+
+
+@pytest.fixture
+def server(mocker):
+    server = FakeServer()
+    mocker.patch.object(CrawlDirectory, "ingest_upload", server.ingest_upload)
+    mocker.patch.object(AlephAPI, "get_entity", server.get_entity)
+    return server
@@ -0,0 +1,177 @@
+import gzip
+import json
+import threading
+
+import pytest
+from requests import Response
+from requests.exceptions import ConnectTimeout, ReadTimeout
+
+from openaleph_client.api import AlephAPI
+from openaleph_client.bulk import BulkBody, ChunkSizer, encode_entity
+from openaleph_client.errors import AlephException
+
+
+def make_response(status_code):
+    response = Response()
+    response.status_code = status_code
+    return response
+
+
+class TestApiBulk:
+    fake_url = "http://openaleph.test/api/2/"
+
+    def setup_method(self):
+        self.api = AlephAPI(host=self.fake_url, api_key="fake_key", retries=0)
+        self.entities = [{"id": str(i), "schema": "Person"} for i in range(10)]
+
+    def test_write_entities_sequential(self, mocker):
+        mocker.patch.object(self.api, "_bulk_chunk")
+        self.api.write_entities("8", self.entities, chunk_size=4)
+        sizes = [len(c.args[1]) for c in self.api._bulk_chunk.call_args_list]
+        assert sizes == [4, 4, 2]
+
+    def test_write_entities_concurrent(self, mocker):
+        seen = []
+        threads = set()
+
+        def bulk_chunk(collection_id, chunk, **kw):
+            threads.add(threading.current_thread().name)
+            seen.extend(json.loads(e)["id"] for e in chunk)
+
+        mocker.patch.object(self.api, "_bulk_chunk", side_effect=bulk_chunk)
+        self.api.write_entities("8", self.entities, chunk_size=2, concurrency=3)
+        assert sorted(seen, key=int) == [e["id"] for e in self.entities]
+        assert all(t.startswith("openaleph-bulk") for t in threads)
+        assert self.api.transport.pool_size >= 3
+
+    def test_write_entities_concurrent_error(self, mocker):
+        mocker.patch("requests.Session.post", return_value=make_response(400))
+        with pytest.raises(AlephException):
+            self.api.write_entities("8", self.entities, chunk_size=2, concurrency=3)
+
+    def test_write_entities_concurrent_force(self, mocker):
+        post = mocker.patch("requests.Session.post", return_value=make_response(400))
+        self.api.write_entities(
+            "8", self.entities, chunk_size=2, concurrency=3, force=True
+        )
+        assert post.call_count == 5
+
+    def test_write_entities_chunk_bytes(self, mocker):
+        mocker.patch.object(self.api, "_bulk_chunk")
+        text = {"bodyText": ["x" * 100]}
+        entities = [{"id": str(i), "properties": text} for i in range(10)]
+        self.api.write_entities("8", entities, chunk_size=100, chunk_bytes=350)
+        sizes = [len(c.args[1]) for c in self.api._bulk_chunk.call_args_list]
+        assert sizes == [2, 2, 2, 2, 2]
+
+    def test_bulk_chunk_split_oversize(self, mocker):
+        sent = []
+
+        def post(url, data=None, **kw):
+            chunk = json.loads(b"".join(data))
+            if len(chunk) > 3:
+                return make_response(413)
+            sent.append([e["id"] for e in chunk])
+            return make_response(200)
+
+        mocker.patch("requests.Session.post", side_effect=post)
+        sizer = ChunkSizer(10)
+        self.api._bulk_chunk("8", self.entities, sizer=sizer)
+        assert [i for ids in sent for i in ids] == [e["id"] for e in self.entities]
+        assert max(len(ids) for ids in sent) <= 3
+        assert sizer.size <= 5
+
+    def test_bulk_chunk_connect_timeout_not_split(self, mocker):
+        post = mocker.patch(
+            "requests.Session.post", side_effect=ConnectTimeout("unreachable")
+        )
+        sizer = ChunkSizer(10)
+        with pytest.raises(AlephException):
+            self.api._bulk_chunk("8", self.entities, sizer=sizer)
+        assert post.call_count == 1
+        assert sizer.size == 10
+
+    def test_bulk_chunk_gateway_timeout_not_split(self, mocker):
+        post = mocker.patch("requests.Session.post", return_value=make_response(504))
+        with pytest.raises(AlephException) as exc:
+            self.api._bulk_chunk("8", self.entities)
+        assert exc.value.status == 504
+        assert post.call_count == 1
+
+    def test_bulk_chunk_split_read_timeout(self, mocker):
+        sent = []
+
+        def post(url, data=None, **kw):
+            chunk = json.loads(b"".join(data))
+            if len(chunk) > 5:
+                raise ReadTimeout("slow")
+            sent.append(len(chunk))
+            return make_response(200)
+
+        mocker.patch("requests.Session.post", side_effect=post)
+        self.api._bulk_chunk("8", self.entities, sizer=ChunkSizer(10))
+        assert sent == [5, 5]
+
+    def test_bulk_chunk_gzip(self, mocker):
+        post = mocker.patch("requests.Session.post", return_value=make_response(200))
+        self.api._bulk_chunk("8", self.entities, compress=True)
+        kwargs = post.call_args.kwargs
+        assert kwargs["headers"]["Content-Encoding"] == "gzip"
+        body = gzip.decompress(b"".join(kwargs["data"]))
+        assert json.loads(body) == self.entities
+
+
+class TestBulkBody:
+    def test_body(self):
+        chunk = [encode_entity({"id": str(i), "text": "x" * i}) for i in range(100)]
+        body = BulkBody(chunk, buffer_size=64)
+        data = b"".join(body)
+        assert len(body) == len(data)
+        assert json.loads(data) == json.loads(b"[" + b",".join(chunk) + b"]")
+        assert data == b"".join(body)
+
+    def test_empty(self):
+        body = BulkBody([])
+        assert b"".join(body) == b"[]"
+        assert len(body) == 2
+
+
+class TestChunkSizer:
+    def test_adapts_to_latency(self):
+        sizer = ChunkSizer(1000, target_latency=10)
+        sizer.observe(1000, 30)
+        assert sizer.size == 500
+        sizer.observe(500, 12)
+        assert sizer.size == 400
+        sizer.observe(400, 1)
+        assert sizer.size == 501
+        for _ in range(10):
+            sizer.observe(sizer.size, 1)
+        assert sizer.size == 1000
+
+    def test_ignores_short_chunks(self):
+        sizer = ChunkSizer(1000, target_latency=10)
+        sizer.observe(10, 30)
+        assert sizer.size == 1000
+
+    def test_disabled(self):
+        sizer = ChunkSizer(1000, target_latency=0)
+        sizer.observe(1000, 300)
+        assert sizer.size == 1000
+
+    def test_bytes_recover(self):
+        sizer = ChunkSizer(1000, max_bytes=1000, target_latency=10)
+        sizer.oversize([b"x" * 100] * 10)
+        assert sizer.max_bytes == 500
+        sizer.observe(5, 30)
+        assert sizer.max_bytes == 500
+        for _ in range(5):
+            sizer.observe(5, 1)
+        assert sizer.max_bytes == 1000
+
+    def test_bytes_recover_uncapped(self):
+        sizer = ChunkSizer(1000, max_bytes=0, target_latency=0)
+        sizer.oversize([b"x" * 100] * 10)
+        assert sizer.max_bytes == 500
+        sizer.observe(5, 300)
+        assert sizer.max_bytes == 626
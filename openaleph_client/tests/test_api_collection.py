@@ -15,7 +15,7 @@ class TestApiCollection:
     fake_url = "http://openaleph.test/api/2/"
 
     def setup_method(self, mocker):
-        self.api = AlephAPI(host=self.fake_url, api_key="fake_key")
+        self.api = AlephAPI(host=self.fake_url, api_key="fake_key", retries=0)
 
     def test_502(self, mocker, http_error_response):
         # Test that the _request method raises AlephException
@@ -30,6 +30,18 @@ class TestApiCollection:
         with pytest.raises(AlephException):
             self.api.get_collection(collection_id)
 
+    def test_get_retried(self, mocker, http_error_response):
+        api = AlephAPI(host=self.fake_url, api_key="fake_key", retries=2)
+        ok = Response()
+        ok.status_code = 200
+        ok._content = b'{"id": "8"}'
+        request = mocker.patch.object(
+            api.session, "request", side_effect=[http_error_response, ok]
+        )
+        mocker.patch("openaleph_client.retry.time.sleep")
+        assert api.get_collection("8") == {"id": "8"}
+        assert request.call_count == 2
+
     def test_get_collection(self, mocker):
         collection_id = "8"
         mocker.patch.object(self.api, "_request")
@@ -1,3 +1,7 @@
+import threading
+from urllib.parse import parse_qs, urlparse
+
+from openaleph_client import settings
 from openaleph_client.api import AlephAPI, APIResultSet
 
 
@@ -47,3 +51,72 @@ class TestApiSearch:
 
         assert "first=first" in search_result.url
         assert "second=second" in search_result.url
+
+    def test_search_limit(self, mocker):
+        mocker.patch.object(self.api, "_request")
+        search_result = self.api.search(self.fake_query, limit=500)
+
+        assert "limit=500" in search_result.url
+
+
+class TestResultSetPrefetch:
+    fake_url = "http://openaleph.test/api/2/"
+    fake_query = "fleem"
+
+    def setup_method(self, mocker):
+        self.api = AlephAPI(host=self.fake_url, api_key="fake_key")
+
+    def _pages(self, mocker, total, limit, reported_total=None):
+        requested = []
+        self.prefetched = []
+
+        def request(method, url):
+            params = parse_qs(urlparse(url).query)
+            offset = int(params.get("offset", ["0"])[0])
+            requested.append(offset)
+            if threading.current_thread().name.startswith("openaleph-page"):
+                self.prefetched.append(offset)
+            end = min(offset + limit, total)
+            next_url = None
+            if end < total:
+                next_url = "%sentities?offset=%d" % (self.fake_url, end)
+            return {
+                "total": reported_total or total,
+                "limit": limit,
+                "offset": offset,
+                "next": next_url,
+                "results": [{"id": str(i)} for i in range(offset, end)],
+            }
+
+        mocker.patch.object(self.api, "_request", side_effect=request)
+        return requested
+
+    def test_prefetch_order(self, mocker):
+        requested = self._pages(mocker, total=95, limit=10)
+        results = self.api.search(self.fake_query, limit=10, prefetch=3)
+        ids = [r["id"] for r in results]
+        assert ids == [str(i) for i in range(95)]
+        assert sorted(requested) == list(range(0, 100, 10))
+
+    def test_prefetch_lower_bound_total(self, mocker):
+        self._pages(mocker, total=45, limit=10, reported_total=20)
+        results = self.api.search(self.fake_query, limit=10, prefetch=2)
+        assert [r["id"] for r in results] == [str(i) for i in range(45)]
+
+    def test_prefetch_result_window(self, mocker):
+        mocker.patch.object(settings, "RESULT_WINDOW", 50)
+        self._pages(mocker, total=95, limit=10)
+        results = self.api.search(self.fake_query, limit=10, prefetch=3)
+        assert [r["id"] for r in results] == [str(i) for i in range(95)]
+        assert sorted(self.prefetched) == [10, 20, 30, 40]
+
+    def test_close_cancels_pages(self, mocker):
+        self._pages(mocker, total=95, limit=10)
+        results = self.api.search(self.fake_query, limit=10, prefetch=3)
+        for _ in range(11):
+            next(results)
+        executor = results._executor
+        results.close()
+        assert results._executor is None
+        assert not len(results._pages)
+        assert executor._shutdown
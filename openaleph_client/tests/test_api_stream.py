@@ -0,0 +1,140 @@
+import io
+import json
+
+import pytest
+from click.testing import CliRunner
+from requests import Response
+from urllib3.exceptions import ProtocolError
+
+from openaleph_client import codec
+from openaleph_client.api import AlephAPI, _line_blocks
+from openaleph_client.cli import stream_entities
+from openaleph_client.errors import AlephException
+
+
+class BrokenRaw(object):
+    """A response body that drops the connection (or raises `error`) after
+    `limit` bytes."""
+
+    def __init__(self, body: bytes, limit: int, error=None):
+        self.body = body
+        self.limit = limit
+        self.error = error or ProtocolError("Connection broken")
+
+    def stream(self, chunk_size, decode_content=True):
+        for pos in range(0, self.limit, 7):
+            yield self.body[pos : min(pos + 7, self.limit)]
+        raise self.error
+
+
+def make_stream_response(body: bytes, limit=None, error=None):
+    response = Response()
+    response.status_code = 200
+    if limit is None:
+        response.raw = io.BytesIO(body)
+    else:
+        response.raw = BrokenRaw(body, limit, error)
+    return response
+
+
+class TestApiStream:
+    fake_url = "http://openaleph.test/api/2/"
+
+    def setup_method(self):
+        self.api = AlephAPI(host=self.fake_url, api_key="fake_key")
+        self.lines = [json.dumps({"id": str(i), "properties": {}}) for i in range(5)]
+        self.body = "\n".join(self.lines).encode("utf-8") + b"\n"
+
+    def test_stream_entities(self, mocker):
+        response = make_stream_response(self.body)
+        mocker.patch.object(self.api.session, "get", return_value=response)
+        entities = list(self.api.stream_entities({"id": "8"}))
+        assert [e["id"] for e in entities] == ["0", "1", "2", "3", "4"]
+        assert entities[0]["properties"]["alephUrl"] == [self.fake_url + "entities/0"]
+
+    def test_stream_entities_raw(self, mocker):
+        response = make_stream_response(self.body)
+        mocker.patch.object(self.api.session, "get", return_value=response)
+        blocks = list(self.api.stream_entities({"id": "8"}, raw=True))
+        assert b"".join(blocks) == self.body
+
+    def test_line_blocks(self):
+        chunks = [b'{"id": 1}\n{"id"', b": 2}", b"\n{", b'"id": 3}']
+        blocks = list(_line_blocks(chunks))
+        assert all(block.endswith(b"\n") for block in blocks)
+        assert b"".join(blocks) == b'{"id": 1}\n{"id": 2}\n{"id": 3}\n'
+
+    def test_line_blocks_long_line(self):
+        chunks = [b"x" * 10] * 1000 + [b"\nyy", b"y"]
+        blocks = list(_line_blocks(chunks))
+        assert blocks == [b"x" * 10_000 + b"\n", b"yyy\n"]
+
+    def test_stream_entities_reconnect(self, mocker):
+        self.api.retry.max_delay = self.api.retry.base_delay = 0
+        responses = [
+            make_stream_response(self.body, limit=len(self.body) // 2),
+            make_stream_response(self.body),
+        ]
+        mocker.patch.object(self.api.session, "get", side_effect=responses)
+        stream = self.api.stream_entities({"id": "8"})
+        assert [e["id"] for e in stream] == ["0", "1", "2", "3", "4"]
+        assert stream.position == 5
+        assert stream.last_id == "4"
+
+    def test_stream_entities_raw_reconnect(self, mocker):
+        self.api.retry.max_delay = self.api.retry.base_delay = 0
+        responses = [
+            make_stream_response(self.body, limit=len(self.body) // 2),
+            make_stream_response(self.body),
+        ]
+        mocker.patch.object(self.api.session, "get", side_effect=responses)
+        blocks = list(self.api.stream_entities({"id": "8"}, raw=True))
+        assert b"".join(blocks) == self.body
+
+    def test_stream_entities_schemata(self, mocker):
+        response = make_stream_response(self.body)
+        get = mocker.patch.object(self.api.session, "get", return_value=response)
+        list(self.api.stream_entities({"id": "8"}, schema=iter(["Person", "Email"])))
+        assert get.call_args.kwargs["params"]["schema"] == ["Person", "Email"]
+
+    def test_stream_entities_resume(self, mocker):
+        response = make_stream_response(self.body)
+        mocker.patch.object(self.api.session, "get", return_value=response)
+        stream = self.api.stream_entities({"id": "8"}, position=2, last_id="1")
+        assert [e["id"] for e in stream] == ["2", "3", "4"]
+
+    def test_stream_entities_resume_order_changed(self, mocker):
+        response = make_stream_response(self.body)
+        mocker.patch.object(self.api.session, "get", return_value=response)
+        stream = self.api.stream_entities({"id": "8"}, position=2, last_id="3")
+        with pytest.raises(AlephException):
+            list(stream)
+
+    def test_cli_resume(self, mocker, tmp_path):
+        outfile = str(tmp_path / "entities.json")
+        args = ["-f", "test", "-o", outfile]
+        obj = {"api": self.api}
+        mocker.patch.object(
+            self.api, "get_collection_by_foreign_id", return_value={"id": "8"}
+        )
+        interrupted = make_stream_response(
+            self.body, limit=len(self.body) // 2, error=KeyboardInterrupt()
+        )
+        mocker.patch.object(self.api.session, "get", return_value=interrupted)
+        result = CliRunner().invoke(stream_entities, args, obj=obj)
+        assert result.exit_code != 0
+        with open(outfile + ".checkpoint", "rb") as fh:
+            saved = codec.loads(fh.read())
+        assert saved["position"] == 2
+        assert saved["offset"] == len(open(outfile, "rb").read())
+
+        # a write cut short after the checkpoint
+        with open(outfile, "ab") as fh:
+            fh.write(b'{"id": "2", "prop')
+        response = make_stream_response(self.body)
+        mocker.patch.object(self.api.session, "get", return_value=response)
+        result = CliRunner().invoke(stream_entities, args + ["--resume"], obj=obj)
+        assert result.exit_code == 0, result.output
+        with open(outfile, "rb") as fh:
+            ids = [codec.loads(line)["id"] for line in fh]
+        assert ids == ["0", "1", "2", "3", "4"]
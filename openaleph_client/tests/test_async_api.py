@@ -0,0 +1,132 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from openaleph_client.async_api import AsyncAlephAPI, AsyncEntityResultSet
+from openaleph_client.errors import AlephException
+
+
+def make_api(handler):
+    transport = httpx.MockTransport(handler)
+    return AsyncAlephAPI(
+        host="http://openaleph.test/", api_key="fake_key", transport=transport
+    )
+
+
+class TestAsyncApi:
+    def test_get_entity(self):
+        def handler(request):
+            assert request.url.path == "/api/2/entities/24"
+            assert request.headers["Authorization"] == "ApiKey fake_key"
+            return httpx.Response(200, json={"id": "24", "properties": {}})
+
+        async def run():
+            async with make_api(handler) as api:
+                return await api.get_entity("24")
+
+        entity = asyncio.run(run())
+        assert entity["id"] == "24"
+        assert entity["properties"]["alephUrl"] == [
+            "http://openaleph.test/api/2/entities/24"
+        ]
+
+    def test_search_pages(self):
+        next_url = "http://openaleph.test/api/2/entities?offset=2"
+        pages = {
+            "0": {
+                "total": 3,
+                "limit": 2,
+                "offset": 0,
+                "next": next_url,
+                "results": [{"id": "a"}, {"id": "b"}],
+            },
+            "2": {
+                "total": 3,
+                "limit": 2,
+                "offset": 2,
+                "next": None,
+                "results": [{"id": "c"}],
+            },
+        }
+
+        def handler(request):
+            return httpx.Response(200, json=pages[request.url.params.get("offset", "0")])
+
+        async def run():
+            async with make_api(handler) as api:
+                results = await api.search("fleem")
+                assert isinstance(results, AsyncEntityResultSet)
+                assert len(results) == 3
+                return [e["id"] async for e in results]
+
+        assert asyncio.run(run()) == ["a", "b", "c"]
+
+    def test_stream_entities(self):
+        lines = [json.dumps({"id": str(i)}) for i in range(5)]
+
+        def handler(request):
+            assert "include" not in request.url.params
+            return httpx.Response(200, content="\n".join(lines).encode())
+
+        async def run():
+            async with make_api(handler) as api:
+                return [e["id"] async for e in api.stream_entities()]
+
+        assert asyncio.run(run()) == ["0", "1", "2", "3", "4"]
+
+    def test_write_entities_chunks(self):
+        chunks = []
+
+        def handler(request):
+            chunks.append(json.loads(request.content))
+            return httpx.Response(200, json={})
+
+        async def run():
+            async with make_api(handler) as api:
+                entities = [{"id": str(i)} for i in range(5)]
+                await api.write_entities("8", entities, chunk_size=2)
+
+        asyncio.run(run())
+        assert [len(c) for c in chunks] == [2, 2, 1]
+
+    def test_write_entities_proxies_and_bytes(self):
+        class Proxy:
+            def __init__(self, id):
+                self.id = id
+
+            def to_dict(self):
+                return {"id": self.id, "schema": "Thing"}
+
+        chunks = []
+
+        def handler(request):
+            assert request.headers["Content-Type"] == "application/json"
+            chunks.append(json.loads(request.content))
+            return httpx.Response(200, json={})
+
+        async def entities():
+            for i in range(4):
+                yield Proxy(str(i) * 100)
+
+        async def run():
+            async with make_api(handler) as api:
+                await api.write_entities("8", entities(), chunk_bytes=300)
+
+        asyncio.run(run())
+        assert [len(c) for c in chunks] == [2, 2]
+        assert chunks[0][0] == {"id": "0" * 100, "schema": "Thing"}
+
+    def test_error(self):
+        def handler(request):
+            return httpx.Response(404, json={"message": "Not found"})
+
+        async def run():
+            async with make_api(handler) as api:
+                await api.get_collection("8")
+
+        with pytest.raises(AlephException) as exc:
+            asyncio.run(run())
+        assert exc.value.status == 404
+        assert str(exc.value) == "Not found"
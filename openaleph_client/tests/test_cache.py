@@ -0,0 +1,139 @@
+import sqlite3
+import time
+
+from requests import Response
+
+from openaleph_client.api import AlephAPI
+from openaleph_client.cache import ResponseCache
+
+
+def make_response(status_code, content=b"", etag=None):
+    response = Response()
+    response.status_code = status_code
+    response._content = content
+    if etag is not None:
+        response.headers["ETag"] = etag
+    return response
+
+
+class TestResponseCache:
+    fake_url = "http://openaleph.test/api/2/"
+
+    def setup_method(self):
+        self.cache = ResponseCache(ttl=60, max_size=2)
+        self.api = AlephAPI(host=self.fake_url, api_key="fake_key", cache=self.cache)
+
+    def test_lru(self):
+        self.cache.set("a", b"1")
+        self.cache.set("b", b"2")
+        self.cache.get("a")
+        self.cache.set("c", b"3")
+        assert self.cache.get("b") is None
+        assert self.cache.get("a").data == b"1"
+        assert self.cache.stats()["evictions"] == 1
+
+    def test_cached_get(self, mocker):
+        response = make_response(200, b'{"id": "8"}')
+        request = mocker.patch.object(
+            self.api.session, "request", return_value=response
+        )
+        assert self.api.get_collection("8") == {"id": "8"}
+        assert self.api.get_collection("8") == {"id": "8"}
+        assert request.call_count == 1
+        assert self.cache.stats()["hits"] == 1
+        assert self.cache.stats()["misses"] == 1
+
+    def test_invalidate_on_write(self, mocker):
+        response = make_response(200, b'{"id": "8"}')
+        request = mocker.patch.object(
+            self.api.session, "request", return_value=response
+        )
+        self.api.get_collection("8")
+        self.api.update_collection("8", {"label": "x"})
+        self.api.get_collection("8")
+        assert request.call_count == 3
+
+    def test_bulk_invalidates_entities(self, mocker):
+        responses = [
+            make_response(200, b'{"id": "e1"}'),
+            make_response(200, b'{"id": "e1", "schema": "Person"}'),
+        ]
+        request = mocker.patch.object(
+            self.api.session, "request", side_effect=responses
+        )
+        mocker.patch.object(self.api.session, "post", return_value=make_response(200))
+        assert self.api.get_entity("e1")["id"] == "e1"
+        self.api.write_entities("8", [{"id": "e1", "schema": "Person"}])
+        assert self.api.get_entity("e1")["schema"] == "Person"
+        assert request.call_count == 2
+
+    def test_etag_revalidation(self, mocker):
+        self.cache.ttl = 0
+        responses = [
+            make_response(200, b'{"id": "8"}', etag='"v1"'),
+            make_response(304),
+        ]
+        request = mocker.patch.object(
+            self.api.session, "request", side_effect=responses
+        )
+        self.api.get_entity("8")
+        time.sleep(0.01)
+        entity = self.api.get_entity("8")
+        assert entity["id"] == "8"
+        assert request.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+        assert self.cache.stats()["revalidated"] == 1
+
+    def test_persistent(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        cache = ResponseCache(path=path)
+        cache.set("a", b"1", etag="x")
+        cache.close()
+        cache = ResponseCache(path=path)
+        entry = cache.get("a")
+        assert entry.data == b"1"
+        assert entry.etag == "x"
+
+    def test_persistent_invalidate(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        cache = ResponseCache(path=path)
+        cache.set("a/1", b"1", scope="a")
+        cache.set("b/1", b"2", scope="b")
+        cache.close()
+        cache = ResponseCache(path=path)
+        cache.invalidate("a")
+        assert cache.get("a/1") is None
+        assert cache.get("b/1").scope == "b"
+        plan = cache._conn.execute(
+            "EXPLAIN QUERY PLAN DELETE FROM cache WHERE scope = ?", ("a",)
+        ).fetchall()
+        assert "cache_scope" in str(plan)
+
+    def test_upgrade(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE cache (key TEXT PRIMARY KEY, expires REAL, etag TEXT, data BLOB)"
+        )
+        conn.execute("INSERT INTO cache VALUES ('a', 0, 'x', X'31')")
+        conn.commit()
+        conn.close()
+        cache = ResponseCache(path=path)
+        assert cache.get("a") is None
+        cache.set("a", b"1", scope="s")
+        assert cache.get("a").scope == "s"
+
+    def test_invalidate_known_scopes_only(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        cache = ResponseCache(path=path)
+        cache.set("a/1", b"1", scope="a")
+        cache.close()
+        cache = ResponseCache(path=path)
+        statements = []
+        cache._conn.set_trace_callback(statements.append)
+        cache.invalidate("b")
+        assert statements == []
+        cache.invalidate("a")
+        assert any(s.startswith("DELETE") for s in statements)
+        statements.clear()
+        cache.invalidate("a")
+        assert statements == []
@@ -0,0 +1,20 @@
+from openaleph_client import codec
+
+
+class TestCodec:
+    entity = {"id": "a1", "schema": "Person", "properties": {"name": ["Anna Ärger"]}}
+
+    def test_roundtrip(self):
+        data = codec.dumps(self.entity)
+        assert isinstance(data, bytes)
+        assert codec.loads(data) == self.entity
+        assert codec.loads(data.decode("utf-8")) == self.entity
+
+    def test_stdlib(self):
+        name, dumps, loads = codec._load("json")
+        assert name == "json"
+        assert loads(dumps(self.entity)) == self.entity
+
+    def test_unavailable_falls_back(self):
+        name, dumps, loads = codec._load("simdjson")
+        assert name == "json"
@@ -1,8 +1,11 @@
 import os
+import threading
+import time
+from concurrent.futures import Future
 from pathlib import Path
 
 from openaleph_client.api import AlephAPI
-from openaleph_client.crawldir import CrawlDirectory
+from openaleph_client.crawldir import CrawlDirectory, LargestFirstQueue, crawl_dir
 
 
 class TestCrawlDirectory:
@@ -46,3 +49,200 @@ class TestCrawlDirectory:
         crawldir = CrawlDirectory(AlephAPI, {}, Path(self.base_path))
         crawldir.ignore_patterns = ["jan/"]
         assert crawldir.is_ignored(path)
+
+
+class TestParallelScan:
+    def test_parents_before_children(self, tree, api, server):
+        # the server rejects uploads into folders it does not know yet
+        server.folder_delay = 0.01
+        crawl_dir(api, str(tree), "test", {}, parallel=4, scan_parallel=4)
+        assert len(server.folders) == 12
+        assert len(server.uploads) == 19
+        assert server.uploads["top.txt"] is None
+        assert server.uploads["a1/b2/f0.txt"] == server.folders["a1/b2"]
+        assert server.uploads["a0/b0/f1.txt"] == server.folders["a0/b0"]
+
+    def test_bounded_queue(self, tmp_path):
+        for i in range(10):
+            (tmp_path / ("f%d.txt" % i)).write_text("x")
+        crawler = CrawlDirectory(AlephAPI, {}, tmp_path, queue_size=3)
+        crawler.ignore_patterns = []
+        scanner = threading.Thread(
+            target=crawler.scandir, args=(str(tmp_path), None), daemon=True
+        )
+        scanner.start()
+        time.sleep(0.1)
+        # the scanner waits for the uploads to catch up
+        assert scanner.is_alive()
+        assert crawler.queue.qsize() == 3
+        paths = []
+        while len(paths) < 10:
+            path, folder = crawler.queue.get()
+            assert isinstance(path, str)
+            paths.append(path)
+        scanner.join(1)
+        assert not scanner.is_alive()
+
+    def test_consume_survives_errors(self, tmp_path):
+        (tmp_path / "a.txt").write_text("x")
+        crawler = CrawlDirectory(AlephAPI, {}, tmp_path)
+        folder: Future = Future()
+        folder.set_exception(RuntimeError("folder failed"))
+        crawler.queue.put((str(tmp_path / "a.txt"), folder))
+        crawler.queue.put((None, None))
+        crawler.consume()
+        assert crawler.queue.unfinished_tasks == 0
+        assert crawler.state.failed_paths() == ["a.txt"]
+
+
+class TestResume:
+    def test_skips_processed(self, tree, api, server):
+        crawl_dir(api, str(tree), "test", {}, parallel=2)
+        assert len(server.uploads) == 19
+        (tree / "new.txt").write_text("x")
+        server.clear()
+        crawl_dir(api, str(tree), "test", {}, parallel=2, resume=True)
+        assert list(server.uploads) == ["new.txt"]
+
+    def test_reuses_folders(self, tree, api, server):
+        crawl_dir(api, str(tree), "test", {}, parallel=2)
+        assert len(server.folders) == 12
+        (tree / "a1" / "b2" / "new.txt").write_text("x")
+        created = dict(server.folders)
+        server.clear()
+        crawl_dir(api, str(tree), "test", {}, parallel=2, resume=True)
+        assert server.folders == created
+        assert server.uploads == {"a1/b2/new.txt": "id-a1/b2"}
+
+    def test_replaces_missing_folders(self, tree, api, server):
+        crawl_dir(api, str(tree), "test", {}, parallel=2)
+        (tree / "a1" / "b2" / "new.txt").write_text("x")
+        (tree / "a0" / "b0" / "new.txt").write_text("x")
+        # the folders a1 and a1/b2 were deleted on the server
+        stored = dict(server.folders)
+        del server.folders["a1"]
+        del server.folders["a1/b2"]
+        server.clear()
+        crawl_dir(api, str(tree), "test", {}, parallel=2, resume=True)
+        assert set(server.folders) == set(stored)
+        assert server.folders["a1/b2"] != stored["a1/b2"]
+        assert server.folders["a0/b0"] == stored["a0/b0"]
+        assert server.uploads == {
+            "a1/b2/new.txt": server.folders["a1/b2"],
+            "a0/b0/new.txt": stored["a0/b0"],
+        }
+
+    def test_keeps_folders_on_other_errors(self, tree, api, server):
+        crawl_dir(api, str(tree), "test", {}, parallel=2)
+        (tree / "a1" / "b2" / "new.txt").write_text("x")
+        server.broken.add("a1/b2/new.txt")
+        stored = dict(server.folders)
+        server.clear()
+        crawl_dir(api, str(tree), "test", {}, parallel=2, resume=True)
+        assert server.folders == stored
+        assert server.uploads == {}
+
+
+class TestSync:
+    def test_sync(self, mocker, tree, api, server):
+        delete_entity = mocker.patch.object(api, "delete_entity")
+        crawl_dir(api, str(tree), "test", {}, parallel=2, sync=True)
+        assert len(server.uploads) == 19
+        server.clear()
+        (tree / "a0" / "b1" / "f0.txt").write_text("changed")
+        (tree / "a2" / "b2" / "f1.txt").unlink()
+        (tree / "new.txt").write_text("x")
+        crawl_dir(api, str(tree), "test", {}, parallel=2, sync=True, delete=True)
+        assert sorted(server.uploads) == ["a0/b1/f0.txt", "new.txt"]
+        delete_entity.assert_called_once_with("id-a2/b2/f1.txt")
+        server.clear()
+        delete_entity.reset_mock()
+        crawl_dir(api, str(tree), "test", {}, parallel=2, sync=True, delete=True)
+        assert server.uploads == {}
+        delete_entity.assert_not_called()
+
+
+class TestDedupe:
+    def test_dedupe(self, tree, api, server):
+        (tree / "a0" / "b0" / "f0.txt").write_text("unique")
+        crawl_dir(api, str(tree), "test", {}, parallel=4, dedupe=True)
+        # all files but one contain "x"
+        assert len(server.uploads) == 2
+        assert "a0/b0/f0.txt" in server.uploads
+
+        server.clear()
+        (tree / "new.txt").write_text("x")
+        crawl_dir(api, str(tree), "test", {}, sync=True, dedupe=True)
+        assert server.uploads == {}
+
+    def test_entry(self, mocker, tree, api, server):
+        entities = []
+
+        def write_entity(collection_id, entity):
+            entities.append(entity)
+            return {"id": "entity-%d" % len(entities)}
+
+        mocker.patch.object(api, "write_entity", side_effect=write_entity)
+        crawl_dir(
+            api, str(tree), "test", {}, parallel=4, dedupe=True, duplicates="entry"
+        )
+        assert len(server.uploads) == 1
+        assert len(entities) == 18
+        by_name = {}
+        for entity in entities:
+            assert entity["schema"] == "Document"
+            props = entity["properties"]
+            # SHA1 of "x"
+            assert props["contentHash"] == ["11f6ad8ec52a2984abaafd7c3b516503785c2072"]
+            by_name.setdefault(props["fileName"][0], set()).update(props["parent"])
+        assert server.folders["a2/b1"] in by_name["f1.txt"]
+
+    def test_upload(self, tree, api, server):
+        crawl_dir(
+            api, str(tree), "test", {}, parallel=4, dedupe=True, duplicates="upload"
+        )
+        assert len(server.uploads) == 19
+
+
+class TestLanes:
+    def test_largest_first(self):
+        queue = LargestFirstQueue()
+        for path, size in (("a", 10), ("b", 300), ("c", 20), ("d", 300)):
+            queue.put((path, None, size))
+        assert [queue.get()[0] for _ in range(4)] == ["b", "d", "c", "a"]
+
+    def test_large_file_lane(self, tree, api, server):
+        (tree / "a1" / "big.bin").write_bytes(b"x" * 2000)
+        (tree / "a2" / "b0" / "bigger.bin").write_bytes(b"x" * 3000)
+        crawl_dir(
+            api,
+            str(tree),
+            "test",
+            {},
+            parallel=2,
+            large_file_threshold=1000,
+            large_parallel=1,
+            largest_first=True,
+        )
+        assert len(server.threads) == 21
+        large = {f for f, name in server.threads.items() if "large" in name}
+        assert large == {"a1/big.bin", "a2/b0/bigger.bin"}
+
+
+class TestRetryFailed:
+    def test_retry_failed(self, mocker, tree, api, server):
+        server.broken.update(["a0/b1/f0.txt", "top.txt"])
+        crawl_dir(api, str(tree), "test", {}, parallel=2)
+        assert "a0/b1/f0.txt" not in server.uploads
+        created = dict(server.folders)
+        scandir = mocker.patch("openaleph_client.crawldir.os.scandir")
+        server.broken.clear()
+        server.clear()
+        crawl_dir(api, str(tree), "test", {}, parallel=2, retry_failed=True)
+        scandir.assert_not_called()
+        # no folders are created again
+        assert server.folders == created
+        assert server.uploads == {"a0/b1/f0.txt": "id-a0/b1", "top.txt": None}
+        server.clear()
+        crawl_dir(api, str(tree), "test", {}, parallel=2, retry_failed=True)
+        assert server.uploads == {}
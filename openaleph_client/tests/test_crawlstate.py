@@ -0,0 +1,145 @@
+import sqlite3
+import threading
+from pathlib import Path
+
+from openaleph_client.crawlstate import BloomFilter, CrawlState
+
+
+class TestCrawlState:
+    def test_bloom_filter(self):
+        bloom = BloomFilter(10_000)
+        values = ["dir/file-%d.txt" % i for i in range(10_000)]
+        for value in values:
+            bloom.add(value)
+        assert all(value in bloom for value in values)
+        others = sum(1 for i in range(10_000) if "other-%d" % i in bloom)
+        assert others < 300
+
+    def test_group_commit(self, tmp_path):
+        path = tmp_path / "state.db"
+        state = CrawlState(path, batch_size=3, flush_interval=60)
+        reader = sqlite3.connect(str(path))
+        state.mark_processed("a")
+        state.mark_failed("b")
+        assert reader.execute("SELECT COUNT(*) FROM processed").fetchone()[0] == 0
+        state.mark_processed("c")
+        assert reader.execute("SELECT COUNT(*) FROM processed").fetchone()[0] == 2
+        state.mark_processed("b")
+        assert state.counts() == (3, 0)
+        assert state.failed_paths() == []
+        state.close()
+        reader.close()
+        assert not (tmp_path / "state.db-wal").exists()
+
+    def test_resume(self, tmp_path):
+        path = tmp_path / "state.db"
+        state = CrawlState(path)
+        for i in range(100):
+            state.mark_processed("file-%d" % i)
+        state.mark_failed("broken")
+        state.close()
+
+        state = CrawlState(path)
+        assert not state.is_processed("file-1")
+        state.load()
+        assert state.is_processed("file-1")
+        assert state.is_processed("file-99")
+        assert not state.is_processed("file-100")
+        assert not state.is_processed("broken")
+        assert state.failed_paths() == ["broken"]
+        state.close()
+        CrawlState.remove(path)
+        assert not path.exists()
+
+    def test_folder_ids(self, tmp_path):
+        path = tmp_path / "state.db"
+        state = CrawlState(path)
+        state.set_folder_id("a", "1")
+        state.set_folder_id("a/b", "2")
+        assert state.folder_id("a/b") == "2"
+        state.set_folder_id("a/b", "3")
+        state.close()
+
+        state = CrawlState(path)
+        assert state.folder_id("a") is None
+        state.load()
+        assert state.folder_id("a") == "1"
+        assert state.folder_id("a/b") == "3"
+        assert state.folder_id("c") is None
+        state.close()
+
+    def test_sync(self, tmp_path):
+        path = tmp_path / "state.db"
+        state = CrawlState(path)
+        state.mark_processed("a", (1, 100, 7), "doc-a")
+        state.mark_processed("b", (2, 100, 8), "doc-b")
+        state.mark_processed("c", (3, 100, 9), "doc-c")
+        state.close()
+
+        state = CrawlState(path)
+        state.load()
+        assert state.run == 2
+        assert state.is_unchanged("a", (1, 100, 7))
+        assert not state.is_unchanged("b", (2, 200, 8))
+        assert not state.is_unchanged("new", (1, 100, 10))
+        state.mark_processed("b", (2, 200, 8), "doc-b")
+        assert state.removed() == [("c", "doc-c", None)]
+        state.forget(["c"])
+        assert state.counts() == (2, 0)
+        state.close()
+
+    def test_upgrade_schema(self, tmp_path):
+        path = tmp_path / "state.db"
+        conn = sqlite3.connect(str(path))
+        conn.execute("CREATE TABLE processed (path TEXT PRIMARY KEY)")
+        conn.execute("CREATE TABLE failed (path TEXT PRIMARY KEY)")
+        conn.execute("INSERT INTO processed VALUES ('old')")
+        conn.commit()
+        conn.close()
+        state = CrawlState(path)
+        state.load()
+        # no signature stored: the file is taken to be unchanged
+        assert state.is_unchanged("old", (1, 2, 3))
+        assert state.removed() == []
+        state.close()
+
+    def test_dedupe(self, tmp_path):
+        path = tmp_path / "state.db"
+        state = CrawlState(path, flush_interval=60)
+        state.cache_hash((10, 100, 7), "hash-a")
+        state.set_content_id("hash-a", "doc-a")
+        assert state.content_id("hash-a") == "doc-a"
+        state.mark_processed("a", (10, 100, 7), "doc-a", "hash-a")
+        state.mark_processed("b", (10, 100, 8), None, "hash-a", "doc-a")
+        state.flush()
+        assert state.cached_hash((10, 100, 7)) == "hash-a"
+        assert state.cached_hash((10, 200, 7)) is None
+        assert state.content_id("hash-a") == "doc-a"
+        assert state.content_id("hash-b") is None
+        state.close()
+
+        state = CrawlState(path)
+        state.load()
+        # the canonical upload is kept while a duplicate is still there
+        assert state.is_unchanged("b", (10, 100, 8))
+        assert state.removed() == []
+        state.close()
+
+    def test_in_memory(self):
+        threads = threading.active_count()
+        state = CrawlState(Path(":memory:"))
+        assert threading.active_count() == threads
+        state.cache_hash((10, 100, 7), "hash-a")
+        state.set_content_id("hash-a", "doc-a")
+        state.flush()
+        results = []
+
+        def read():
+            results.append(state.cached_hash((10, 100, 7)))
+            results.append(state.content_id("hash-a"))
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join()
+        assert results == ["hash-a", "doc-a"]
+        state.close()
@@ -0,0 +1,71 @@
+import io
+import json
+
+import pytest
+
+from openaleph_client.api import AlephAPI
+from openaleph_client.export import export_shards, plan_shards
+
+
+class FakeStream(object):
+    def __init__(self, entities):
+        self.entities = iter(entities)
+        self.position = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        entity = next(self.entities)
+        self.position += 1
+        return entity
+
+
+class TestExport:
+    counts = {"Person": 100, "Company": 60, "Email": 50, "Page": 10}
+
+    def setup_method(self):
+        self.api = AlephAPI(host="http://openaleph.test/api/2/", api_key="fake_key")
+        self.streamed = []
+
+    def _mock_api(self, mocker):
+        values = [{"id": k, "count": v} for k, v in self.counts.items()]
+        facets = {"facets": {"schema": {"values": values}}}
+        mocker.patch.object(self.api, "_request", return_value=facets)
+
+        def stream_entities(collection=None, schema=None, **kw):
+            self.streamed.append(schema)
+            entities = [{"id": "%s-%d" % (s, i)} for s in schema for i in range(3)]
+            return FakeStream(entities)
+
+        mocker.patch.object(self.api, "stream_entities", side_effect=stream_entities)
+
+    def test_plan_shards(self):
+        shards = plan_shards(self.counts, 2)
+        assert shards == [["Person", "Page"], ["Company", "Email"]]
+        assert len(plan_shards(self.counts, 10)) == 4
+        assert plan_shards(self.counts, 2, schema=["Email"]) == [["Email"]]
+        assert plan_shards({}, 4) == []
+
+    def test_export_merged(self, mocker):
+        self._mock_api(mocker)
+        outfile = io.BytesIO()
+        total = export_shards(self.api, {"id": "8"}, 3, outfile=outfile)
+        ids = [json.loads(line)["id"] for line in outfile.getvalue().splitlines()]
+        assert total == len(ids) == 12
+        streamed = sorted(s for schemata in self.streamed for s in schemata)
+        assert streamed == sorted(self.counts)
+
+    def test_export_outdir(self, mocker, tmp_path):
+        self._mock_api(mocker)
+        export_shards(self.api, {"id": "8"}, 2, outdir=tmp_path / "out")
+        files = sorted((tmp_path / "out").iterdir())
+        assert [f.name for f in files] == ["shard-000.ijson", "shard-001.ijson"]
+        assert all(len(f.read_bytes().splitlines()) == 6 for f in files)
+
+    def test_export_requires_output(self, mocker):
+        self._mock_api(mocker)
+        with pytest.raises(ValueError):
+            export_shards(self.api, {"id": "8"}, 2)
+        assert self.streamed == []
+        self.api._request.assert_not_called()
@@ -0,0 +1,37 @@
+import pytest
+
+from openaleph_client.api import AlephAPI
+from openaleph_client.errors import AlephException
+from openaleph_client.fetchdir import fetch_collection
+
+
+def make_document(name):
+    return {
+        "id": name,
+        "properties": {"fileName": [name]},
+        "links": {"file": "http://openaleph.test/files/%s" % name},
+    }
+
+
+class TestFetchCollection:
+    def setup_method(self):
+        self.api = AlephAPI(host="http://openaleph.test/api/2/", api_key="fake_key")
+
+    def test_continue_after_failure(self, mocker, tmp_path):
+        documents = [make_document(n) for n in ("a.txt", "b.txt", "c.txt")]
+        mocker.patch.object(
+            self.api, "get_collection_by_foreign_id", return_value={"id": "8"}
+        )
+        mocker.patch.object(self.api, "search", return_value=documents)
+        fetched = []
+
+        def fetch_archive(url, path, deadline):
+            if path.name == "b.txt":
+                raise AlephException("Download failed")
+            fetched.append(path.name)
+
+        mocker.patch("openaleph_client.fetchdir.fetch_archive", fetch_archive)
+        with pytest.raises(AlephException) as exc:
+            fetch_collection(self.api, str(tmp_path), "test")
+        assert fetched == ["a.txt", "c.txt"]
+        assert str(exc.value) == "1 downloads failed: %s" % (tmp_path / "b.txt")
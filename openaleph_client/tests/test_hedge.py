@@ -0,0 +1,79 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from openaleph_client.api import AlephAPI
+from openaleph_client.errors import AlephException
+from openaleph_client.fetchdir import fetch_archive
+from openaleph_client.hedge import Hedger, LatencyTracker
+
+
+class TestHedge:
+    def test_latency_tracker(self):
+        tracker = LatencyTracker(quantile=0.95, min_samples=20)
+        for i in range(19):
+            tracker.observe(i)
+        assert tracker.value is None
+        for i in range(19, 100):
+            tracker.observe(i)
+        assert tracker.value == 94
+
+    def test_hedged_call(self):
+        hedger = Hedger(max_workers=2)
+        for _ in range(20):
+            hedger.latency.observe(0.01)
+        stalled = threading.Event()
+        calls = []
+        discarded = []
+
+        def func():
+            calls.append(1)
+            if len(calls) == 1:
+                stalled.wait(5)
+                return "slow"
+            return "fast"
+
+        assert hedger.call(func, discard=discarded.append) == "fast"
+        stalled.set()
+        hedger.close()
+        assert hedger.stats() == {"hedged": 1, "wins": 1}
+
+    def test_hedged_error(self):
+        hedger = Hedger(max_workers=2)
+        assert hedger.call(lambda: "direct") == "direct"
+        for _ in range(20):
+            hedger.latency.observe(0.0)
+
+        def func():
+            raise ValueError("failed")
+
+        with pytest.raises(ValueError):
+            hedger.call(func)
+        hedger.close()
+
+    def test_request_timeouts(self, mocker):
+        api = AlephAPI(
+            host="http://openaleph.test/api/2/",
+            api_key="fake",
+            timeouts={"read": 5},
+        )
+        request = mocker.patch.object(api.session, "request")
+        request.return_value.content = b"{}"
+        api.get_collection("1")
+        assert request.call_args.kwargs["timeout"] == (api.connect_timeout, 5)
+        api.delete_entity("1")
+        timeout = request.call_args.kwargs["timeout"]
+        assert timeout == api.timeout("write")
+
+    def test_fetch_archive_deadline(self, mocker, tmp_path):
+        response = MagicMock()
+        response.iter_content.return_value = iter([b"a", b"b", b"c"])
+        mocker.patch.object(requests, "get", return_value=response)
+        clock = mocker.patch("openaleph_client.fetchdir.time.monotonic")
+        clock.side_effect = [0, 1, 100]
+        path = tmp_path / "file"
+        with pytest.raises(AlephException):
+            fetch_archive("http://openaleph.test/file", path, deadline=10)
+        assert not path.exists()
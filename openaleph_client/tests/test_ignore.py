@@ -0,0 +1,81 @@
+import os
+
+from openaleph_client.crawldir import crawl_dir
+from openaleph_client.ignore import IgnoreRules, translate
+
+
+class TestIgnoreRules:
+    def test_translate(self):
+        assert translate("*.txt") == "[^/]*\\.txt"
+        assert translate("a/**/b") == "a/(?:.*/)?b"
+        assert translate("a/**") == "a/.*"
+        assert translate("[!a-c]?") == "[^a-c][^/]"
+
+    def test_names_at_any_depth(self):
+        rules = IgnoreRules(["*.log", "Thumbs.db", "*~", "# comment", ""])
+        assert rules.is_ignored("a.log", False)
+        assert rules.is_ignored("x/y/a.log", False)
+        assert rules.is_ignored("x/Thumbs.db", False)
+        assert rules.is_ignored("x/notes.txt~", False)
+        assert not rules.is_ignored("x/a.log.txt", False)
+        assert not rules.is_ignored("# comment", False)
+
+    def test_anchored(self):
+        rules = IgnoreRules(["/build", "docs/*.pdf", "**/cache/*", "a/**/z"])
+        assert rules.is_ignored("build", True)
+        assert not rules.is_ignored("src/build", True)
+        assert rules.is_ignored("docs/a.pdf", False)
+        assert not rules.is_ignored("docs/sub/a.pdf", False)
+        assert not rules.is_ignored("x/docs/a.pdf", False)
+        assert rules.is_ignored("cache/x", False)
+        assert rules.is_ignored("x/y/cache/x", False)
+        assert rules.is_ignored("a/z", False)
+        assert rules.is_ignored("a/b/c/z", False)
+
+    def test_directories_only(self):
+        rules = IgnoreRules(["tmp/"])
+        assert rules.is_ignored("x/tmp", True)
+        assert not rules.is_ignored("x/tmp", False)
+        assert rules.is_ignored_path("x/tmp/a.txt", False)
+
+    def test_negation(self):
+        rules = IgnoreRules(["*.log", "!important.log", "secret*"])
+        assert rules.is_ignored("a.log", False)
+        assert not rules.is_ignored("x/important.log", False)
+        assert rules.is_ignored("secret.log", False)
+        assert rules.is_ignored("x/secret-important.log", False)
+
+    def test_nested(self):
+        root = IgnoreRules(["*.log", "data/"])
+        child = root.child("a/b", ["!keep.log", "/local.txt", "*.tmp"])
+        assert child.is_ignored("a/b/x.log", False)
+        assert not child.is_ignored("a/b/keep.log", False)
+        assert not child.is_ignored("a/b/c/keep.log", False)
+        assert child.is_ignored("a/b/local.txt", False)
+        assert not child.is_ignored("a/b/c/local.txt", False)
+        assert child.is_ignored("a/b/c/data", True)
+        assert not root.is_ignored("x.tmp", False)
+
+
+class TestIgnoreFiles:
+    def test_ignore_files(self, mocker, tree, api, server):
+        (tree / ".openalephignore").write_text("b1/\n*.log\n")
+        (tree / "a0" / "x.log").write_text("x")
+        (tree / "a2" / ".openalephignore").write_text("!x.log\n/b0/f0.txt\n")
+        (tree / "a2" / "x.log").write_text("x")
+        scanned = []
+        scandir = os.scandir
+        mocker.patch(
+            "openaleph_client.crawldir.os.scandir",
+            side_effect=lambda path: scanned.append(str(path)) or scandir(path),
+        )
+        crawl_dir(api, str(tree), "test", {}, parallel=2)
+        uploaded = list(server.uploads) + list(server.folders)
+        assert not any("b1" in path for path in uploaded)
+        assert not any(path.endswith("/b1") for path in scanned)
+        assert "a0/x.log" not in uploaded
+        assert "a2/x.log" in uploaded
+        assert "a2/b0/f0.txt" not in uploaded
+        assert "a2/b0/f1.txt" in uploaded
+        assert "a0/b0/f0.txt" in uploaded
+        assert not any(".openalephignore" in path for path in uploaded)
@@ -0,0 +1,92 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from openaleph_client.api import AlephAPI
+from openaleph_client.metrics import MetricsCollector, RequestInfo, endpoint_name
+from openaleph_client.tests.test_retry import make_error
+
+
+class JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if "_stream" in self.path:
+            body = b'{"id": "1"}\n{"id": "2"}\n'
+        else:
+            body = b'{"id": "1", "label": "test"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        self.rfile.read(length)
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), JsonHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d/" % httpd.server_address[1]
+    httpd.shutdown()
+
+
+class TestMetrics:
+    def test_endpoint_name(self):
+        base = "http://openaleph.test/api/2/"
+        assert endpoint_name(base + "collections/12/_bulk?x=1") == "collections/{id}/_bulk"
+        assert endpoint_name(base + "entities/ab.cd") == "entities/{id}"
+        assert endpoint_name(base + "entities/_stream") == "entities/_stream"
+        assert endpoint_name(base + "collections/3/ingest") == "collections/{id}/ingest"
+        assert endpoint_name(base + "entitysets/4/items") == "entitysets/{id}/items"
+        assert endpoint_name(base + "match") == "match"
+
+    def test_collect(self, server):
+        api = AlephAPI(host=server, api_key="fake", retries=0)
+        collector = MetricsCollector()
+        api.add_hook(collector)
+        assert api.retry.hooks == [collector]
+        api.get_collection("5")
+        api.get_collection("6")
+        assert len(list(api.stream_entities({"id": "5"}))) == 2
+        with pytest.raises(Exception):
+            api.create_collection({"label": "x"})
+        data = collector.to_dict()
+        coll = data["endpoints"]["GET collections/{id}"]
+        assert coll["requests"] == 2
+        assert coll["statuses"] == {"200": 2}
+        assert data["endpoints"]["POST collections"]["statuses"] == {"404": 1}
+        assert data["bytes_received"]["collections/{id}"] == 56
+        assert data["bytes_received"]["collections/{id}/_stream"] == 24
+        assert data["bytes_sent"]["collections"] == len(b'{"label": "x"}')
+        assert "GET collections/{id}" in collector.summary()
+
+    def test_retries_and_output(self, tmp_path):
+        collector = MetricsCollector()
+        info = RequestInfo("GET", "http://x/api/2/entities/1", "entities/{id}", 503, 0.3, 0)
+        collector.on_request(info)
+        collector.on_retry(make_error(503), 2.5)
+        text = collector.to_prometheus()
+        assert (
+            'openaleph_client_request_duration_seconds_bucket{method="GET",'
+            'endpoint="entities/{id}",le="0.5"} 1' in text
+        )
+        assert "openaleph_client_retries_total 1" in text
+        assert "openaleph_client_backoff_seconds_total 2.5" in text
+        path = tmp_path / "metrics.json"
+        collector.write(str(path))
+        data = json.loads(path.read_text())
+        assert data["retries"] == 1
+        assert data["endpoints"]["GET entities/{id}"]["p95"] == 0.5
@@ -0,0 +1,86 @@
+import importlib
+import io
+
+from openaleph_client import settings
+from openaleph_client.api import AlephAPI
+from openaleph_client.ratelimit import STREAM_THRESHOLD, RateLimiter, TokenBucket
+
+
+class TestSettings:
+    def test_memorious_rate_limit(self, monkeypatch):
+        monkeypatch.delenv("OPENALEPH_RATE_LIMIT", raising=False)
+        monkeypatch.setenv("OPENALEPH_MEMORIOUS_RATE_LIMIT", "120")
+        try:
+            assert importlib.reload(settings).RATE_LIMIT == 2.0
+            monkeypatch.setenv("OPENALEPH_RATE_LIMIT", "5")
+            assert importlib.reload(settings).RATE_LIMIT == 5.0
+        finally:
+            monkeypatch.undo()
+            importlib.reload(settings)
+
+
+class TestTokenBucket:
+    def test_debt(self, mocker):
+        mocker.patch("time.monotonic", return_value=100.0)
+        bucket = TokenBucket(10)
+        assert bucket.take(10) == 0.0
+        assert bucket.take(5) == 0.5
+        mocker.patch("time.monotonic", return_value=101.0)
+        assert bucket.take(1) == 0.0
+
+    def test_capacity(self, mocker):
+        mocker.patch("time.monotonic", return_value=100.0)
+        bucket = TokenBucket(10)
+        mocker.patch("time.monotonic", return_value=200.0)
+        assert bucket.take(10) == 0.0
+        assert bucket.take(10) == 1.0
+
+    def test_shared_file(self, mocker, tmp_path):
+        mocker.patch("time.time", return_value=100.0)
+        path = str(tmp_path / "bucket")
+        first = TokenBucket(2, path=path)
+        second = TokenBucket(2, path=path)
+        assert first.take(2) == 0.0
+        assert second.take(1) == 0.5
+        assert first.take(1) == 1.0
+
+
+class TestRateLimiter:
+    def test_disabled(self):
+        limiter = RateLimiter(0, 0)
+        assert limiter.requests is None and limiter.bytes is None
+        body = b"x" * 10
+        assert limiter.throttle(body) is body
+
+    def test_throttle_bodies(self, mocker):
+        limiter = RateLimiter(0, 1000)
+        acquire = mocker.patch.object(limiter.bytes, "acquire")
+        assert limiter.throttle("abc") == b"abc"
+        acquire.assert_called_once_with(3)
+
+        body = b"x" * (STREAM_THRESHOLD + 1)
+        acquire.reset_mock()
+        assert b"".join(limiter.throttle(body)) == body
+        assert [c.args[0] for c in acquire.call_args_list] == [STREAM_THRESHOLD, 1]
+
+        acquire.reset_mock()
+        reader = limiter.throttle(io.BytesIO(b"abcd"))
+        assert reader.read(3) == b"abc"
+        assert reader.read() == b"d"
+        assert [c.args[0] for c in acquire.call_args_list] == [3, 1]
+
+        acquire.reset_mock()
+        assert list(limiter.throttle([b"ab", b"c"])) == [b"ab", b"c"]
+        assert [c.args[0] for c in acquire.call_args_list] == [2, 1]
+
+    def test_session_throttled(self, mocker):
+        limiter = RateLimiter(5, 0)
+        acquire = mocker.patch.object(limiter.requests, "acquire")
+        api = AlephAPI(
+            host="http://openaleph.test/api/2/", api_key="fake", rate_limiter=limiter
+        )
+        send = mocker.patch("requests.Session.send")
+        send.return_value.status_code = 200
+        api.session.get("http://openaleph.test/api/2/collections")
+        assert acquire.call_count == 1
+        assert send.call_count == 1
@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import pytest
+from requests import HTTPError
+
+from openaleph_client.api import AlephAPI
+from openaleph_client.errors import AlephException, retry_after
+from openaleph_client.retry import CircuitBreaker, RetryBudget, RetryPolicy
+
+
+def make_error(status, headers=None):
+    response = MagicMock(status_code=status, headers=headers or {})
+    response.json.return_value = {"message": "error %d" % status}
+    return AlephException(HTTPError(response=response))
+
+
+class TestRetryPolicy:
+    def test_transient(self):
+        assert make_error(429).transient
+        assert make_error(500).transient
+        assert make_error(503).transient
+        assert not make_error(404).transient
+        assert not make_error(501).transient
+
+    def test_retry_after(self):
+        assert retry_after({"Retry-After": "7"}) == 7.0
+        assert retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0.0
+        assert retry_after({"Retry-After": "soon"}) is None
+        assert retry_after({}) is None
+        assert make_error(429, {"Retry-After": "3"}).retry_after == 3.0
+
+    def test_delay(self):
+        policy = RetryPolicy(retries=3, base_delay=1, max_delay=4)
+        retrying = policy.start()
+        delays = [retrying.delay(make_error(503)) for _ in range(3)]
+        assert all(1 <= d <= 4 for d in delays)
+        assert retrying.delay(make_error(503)) is None
+        assert policy.start().delay(make_error(400)) is None
+        delay = policy.start().delay(make_error(429, {"Retry-After": "30"}))
+        assert delay == 30.0
+
+    def test_budget(self):
+        policy = RetryPolicy(retries=5, budget=RetryBudget(ratio=0.5, reserve=2))
+        policy.base_delay = policy.max_delay = 0
+        retrying = policy.start()
+        assert retrying.delay(make_error(503)) is not None
+        assert retrying.delay(make_error(503)) is not None
+        assert retrying.delay(make_error(503)) is None
+        policy.record(200)
+        policy.record(200)
+        assert policy.start().delay(make_error(503)) is not None
+
+    def test_call(self):
+        policy = RetryPolicy(retries=2, base_delay=0, max_delay=0)
+        func = MagicMock(side_effect=[make_error(502), make_error(429), "ok"])
+        assert policy.call(func, 1, a=2) == "ok"
+        func.assert_called_with(1, a=2)
+        assert policy.retried == 2
+        func = MagicMock(side_effect=make_error(403))
+        with pytest.raises(AlephException):
+            policy.call(func)
+        assert func.call_count == 1
+
+    def test_retried_threads(self):
+        policy = RetryPolicy(retries=1, budget=RetryBudget(reserve=10_000))
+        err = make_error(503)
+
+        def fail(_):
+            policy.start().delay(err)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(fail, range(2000)))
+        assert policy.retried == 2000
+
+
+class TestCircuitBreaker:
+    def test_open_and_probe(self, mocker):
+        clock = mocker.patch("openaleph_client.retry.time.monotonic")
+        clock.return_value = 100.0
+        breaker = CircuitBreaker(threshold=2, cooldown=10)
+        breaker.failure()
+        assert breaker.remaining() == 0
+        breaker.failure()
+        assert breaker.is_open
+        assert breaker.remaining() == 10.0
+        clock.return_value = 110.0
+        # the first caller probes, the others keep waiting
+        assert breaker.remaining() == 0
+        assert breaker.remaining() > 0
+        breaker.failure()
+        assert breaker.remaining() == 20.0
+        clock.return_value = 130.0
+        assert breaker.remaining() == 0
+        breaker.success()
+        assert not breaker.is_open
+        assert breaker.remaining() == 0
+
+    def test_session_records(self, mocker):
+        api = AlephAPI(host="http://openaleph.test/api/2/", api_key="fake")
+        api.retry.breaker.threshold = 2
+        send = mocker.patch("requests.Session.send")
+        send.return_value.status_code = 503
+        api.session.get("http://openaleph.test/api/2/collections")
+        api.session.get("http://openaleph.test/api/2/collections")
+        assert api.retry.breaker.is_open
+        assert api.retry.breaker.opened == 1
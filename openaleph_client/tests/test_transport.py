@@ -0,0 +1,81 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from openaleph_client.api import AlephAPI
+from openaleph_client.transport import Transport
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), OkHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d/" % httpd.server_address[1]
+    httpd.shutdown()
+
+
+class TestTransport:
+    def test_session_per_thread(self):
+        transport = Transport({"X-Test": "1"}, pool_size=4)
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(transport.session))
+        thread.start()
+        thread.join()
+        assert transport.session is transport.session
+        assert sessions[0] is not transport.session
+        assert sessions[0].headers["X-Test"] == "1"
+        assert sessions[0].get_adapter("https://x") is transport.adapter
+        assert transport.session.get_adapter("https://x") is transport.adapter
+
+    def test_ensure_pool_size(self):
+        transport = Transport({}, pool_size=4)
+        session = transport.session
+        transport.ensure_pool_size(2)
+        assert transport.pool_size == 4
+        assert transport.session is session
+        transport.ensure_pool_size(33)
+        assert transport.pool_size == 33
+        assert transport.session is not session
+
+    def test_configure_closes_adapter(self, server):
+        transport = Transport({}, pool_size=2)
+        adapter = transport.adapter
+        transport.session.get(server)
+        assert len(adapter.poolmanager.pools.keys()) == 1
+        transport.configure(4)
+        assert transport.adapter is not adapter
+        assert len(adapter.poolmanager.pools.keys()) == 0
+
+    def test_connection_reuse(self, server):
+        api = AlephAPI(host=server, api_key="fake_key", pool_size=2)
+        threads = [
+            threading.Thread(
+                target=lambda: [api._request("GET", server) for _ in range(10)]
+            )
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = api.transport.stats()
+        assert stats["requests"] == 20
+        assert stats["connections"] <= 2
+        assert stats["reused"] >= 18
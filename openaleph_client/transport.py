@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from requests import ConnectionError, PreparedRequest, Response, Session, Timeout
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, cast
+
+from openaleph_client import settings
+from openaleph_client.metrics import Hook, RequestInfo, endpoint_name
+from openaleph_client.ratelimit import RateLimiter
+from openaleph_client.retry import RetryPolicy
+
+log = logging.getLogger(__name__)
+
+
+class TransportSession(Session):
+    """A session which sends all requests through its `Transport`."""
+
+    def __init__(self, transport: "Transport"):
+        super(TransportSession, self).__init__()
+        self.transport = transport
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        retry = self.transport.retry
+        if retry is not None:
+            retry.breaker.wait()
+        limiter = self.transport.limiter
+        if limiter is not None:
+            request.body = limiter.throttle(request.body)
+        hooks = self.transport.hooks
+        if len(hooks):
+            return self._instrumented(request, hooks, **kwargs)
+        return self._send(request, **kwargs)
+
+    def _send(self, request: PreparedRequest, **kwargs) -> Response:
+        retry = self.transport.retry
+        try:
+            response = super(TransportSession, self).send(request, **kwargs)
+        except (ConnectionError, Timeout):
+            if retry is not None:
+                retry.record(None)
+            raise
+        if retry is not None:
+            retry.record(response.status_code)
+        return response
+
+    def _instrumented(
+        self, request: PreparedRequest, hooks: List[Hook], **kwargs
+    ) -> Response:
+        endpoint = endpoint_name(request.url or "")
+        sent = [0]
+        length = request.headers.get("Content-Length")
+        if length is not None:
+            sent[0] = int(length)
+        elif request.body is not None and not hasattr(request.body, "read"):
+            # PreparedRequest.body is typed as bytes or str, but the adapter
+            # sends any iterable body chunk by chunk (that is how requests
+            # streams generator bodies), so wrapping it keeps it valid.
+            request.body = cast(Any, _counted(request.body, sent))
+        start = time.monotonic()
+        status = None
+        try:
+            response = self._send(request, **kwargs)
+            status = response.status_code
+        finally:
+            info = RequestInfo(
+                method=request.method or "GET",
+                url=request.url or "",
+                endpoint=endpoint,
+                status=status,
+                elapsed=time.monotonic() - start,
+                sent=sent[0],
+            )
+            for hook in hooks:
+                hook.on_request(info)
+        if kwargs.get("stream"):
+            _count_received(response, endpoint, hooks)
+        else:
+            for hook in hooks:
+                hook.on_received(endpoint, len(response.content))
+        return response
+
+
+def _counted(body: Iterable, sent: List[int]) -> Iterator:
+    for data in body:
+        sent[0] += len(data)
+        yield data
+
+
+def _count_received(response: Response, endpoint: str, hooks: List[Hook]):
+    """Report the body of a streamed response to the hooks as it is read."""
+    raw: Any = response.raw
+    read = raw.read
+
+    def counted_read(*args, **kwargs):
+        data = read(*args, **kwargs)
+        for hook in hooks:
+            hook.on_received(endpoint, len(data))
+        return data
+
+    raw.read = counted_read
+
+
+class Transport(object):
+    """Hand out one `requests.Session` per thread, all mounted on a single
+    shared connection pool.
+
+    Sessions keep mutable state (cookies, hooks, adapters) and are not safe to
+    use from several threads at once, but urllib3's pool manager is. Giving
+    each thread its own session on top of one `HTTPAdapter` keeps the
+    connections alive across all workers while isolating session state. The
+    pool blocks instead of opening throw-away connections once `pool_size`
+    connections are in use, so it should be at least the number of threads
+    making requests. An optional `RateLimiter` throttles the requests of all
+    threads together, and the circuit breaker of an optional `RetryPolicy`
+    pauses them together while the server is down. All requests are reported
+    to the instrumentation `hooks`.
+    """
+
+    def __init__(
+        self,
+        headers: Mapping[str, str],
+        pool_size: int = settings.POOL_SIZE,
+        limiter: Optional[RateLimiter] = None,
+        retry: Optional[RetryPolicy] = None,
+        hooks: Optional[List[Hook]] = None,
+    ):
+        self.headers = dict(headers)
+        self.limiter = limiter
+        self.retry = retry
+        self.hooks: List[Hook] = hooks if hooks is not None else []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.configure(pool_size)
+
+    def configure(self, pool_size: int):
+        """Replace the connection pool with one of the given size. Sessions
+        created before this call are discarded the next time their thread
+        makes a request."""
+        with self._lock:
+            self._configure(pool_size)
+
+    def ensure_pool_size(self, pool_size: int):
+        """Grow the connection pool to at least `pool_size` connections."""
+        with self._lock:
+            if pool_size > self.pool_size:
+                self._configure(pool_size)
+
+    def _configure(self, pool_size: int):
+        previous: Optional[HTTPAdapter] = getattr(self, "adapter", None)
+        self.pool_size = pool_size
+        self.adapter = HTTPAdapter(pool_maxsize=pool_size, pool_block=True)
+        self._generation += 1
+        if previous is not None:
+            # Idle connections are closed now, those still in use by other
+            # threads when they are returned.
+            previous.close()
+        log.debug("Connection pool size: %d", pool_size)
+
+    @property
+    def session(self) -> Session:
+        """The session for the calling thread."""
+        session = getattr(self._local, "session", None)
+        if session is None or self._local.generation != self._generation:
+            session = TransportSession(self)
+            session.headers.update(self.headers)
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
+            self._local.session = session
+            self._local.generation = self._generation
+        return session
+
+    def stats(self) -> Dict[str, int]:
+        """Connection reuse counters for the current pool: `requests` sent,
+        `connections` opened and `reused`, the number of requests that did not
+        need a new connection (and thus no new TLS handshake)."""
+        requests = connections = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests += pool.num_requests
+            connections += pool.num_connections
+        return {
+            "pool_size": self.pool_size,
+            "requests": requests,
+            "connections": connections,
+            "reused": max(0, requests - connections),
+        }